@@ -0,0 +1,368 @@
+"""Reproducible pipeline benchmark for Latex Table Miner.
+
+Runs ExtractionPipeline over the bundled corpus (benchmarks/corpus/*.tex) with a
+deterministic mock LLM and a fake TeX engine, so results do not depend on network,
+API quota or an installed TeX distribution. Reports throughput, per-stage
+p50/p95 latency, compile attempts per table and peak RSS, and compares against
+benchmarks/baseline.json.
+
+    python benchmarks/bench.py                    # run and compare with baseline
+    python benchmarks/bench.py --save-baseline    # record a new baseline
+    python benchmarks/bench.py --no-sleep         # pure orchestration overhead
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import io
+import hashlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import main  # noqa: E402
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Packages the fake engine pretends are not installed
+FAKE_MISSING_PACKAGES = {'icml2025', 'neurips_2024', 'acl2023', 'fancytabstyle'}
+
+
+def missing_zz(tex):
+    """\\zz... macros used in tex but never defined (\\zzfatal is handled separately)"""
+    used = set(re.findall(r'\\(zz[a-z]+)', tex))
+    defined = set(re.findall(r'\\(?:providecommand|newcommand)\*?\{\\(zz[a-z]+)\}', tex))
+    return sorted(used - defined - {'zzfatal'})
+
+
+class BenchBackend(main.FakeBackend):
+    """Fake TeX engine that fails on the corpus conventions like Tectonic would.
+
+    Like Tectonic without a package index it accepts every package up front
+    and only reports missing ones when compiling, so the auto-fix path is
+    exercised (once per package, see CompileBackend.mark_missing).
+    """
+    name = "bench"
+
+    def __init__(self, compile_ms=40.0, compile_ms_per_kb=2.0):
+        super().__init__(missing_packages=FAKE_MISSING_PACKAGES)
+        self.compile_ms = compile_ms
+        self.compile_ms_per_kb = compile_ms_per_kb
+
+    def has_package(self, name):
+        return name not in self._missing
+
+    def run(self, tex_file, runner):
+        with open(tex_file, "r", encoding="utf-8") as f:
+            tex = f.read()
+        time.sleep((self.compile_ms + self.compile_ms_per_kb * len(tex) / 1024.0) / 1000.0)
+        base = tex_file[:-4]
+        error = self._fake_error(tex, os.path.basename(tex_file))
+        if error is None:
+            with open(base + ".pdf", "wb") as f:
+                f.write(b"%PDF-1.5\n" + tex.encode("utf-8") + b"\n%%EOF\n")
+            return subprocess.CompletedProcess([tex_file], 0, b"", b"")
+        summary, log = error
+        with open(base + ".log", "w", encoding="utf-8") as f:
+            f.write("This is a fake TeX log\n" + log)
+        return subprocess.CompletedProcess([tex_file], 1, b"", summary.encode("utf-8"))
+
+    def _fake_error(self, tex, name):
+        """Return (tectonic summary, log excerpt) for the first simulated error, or None"""
+        lines = tex.split('\n')
+        for pkg in re.findall(r'\\usepackage(?:\[[^\]]*\])?\{([^}]+)\}', tex):
+            if pkg in self.missing_packages:
+                return (f"error: {name}: ! LaTeX Error: File `{pkg}.sty' not found.",
+                        f"! LaTeX Error: File `{pkg}.sty' not found.\n")
+        try:
+            start = lines.index("\\begin{document}") + 1
+        except ValueError:
+            start = 0
+        missing = set(missing_zz(tex))
+        for n, line in enumerate(lines[start:], start + 1):
+            if '\\zzfatal' in line:
+                return (f"error: {name}:{n}: TeX capacity exceeded, sorry [main memory size=5000000]",
+                        f"! TeX capacity exceeded, sorry [main memory size=5000000].\nl.{n} {line}\n")
+            for macro in re.findall(r'\\(zz[a-z]+)', line):
+                if macro in missing:
+                    ctx = line[:line.index('\\' + macro) + len(macro) + 1]
+                    return (f"error: {name}:{n}: Undefined control sequence",
+                            f"! Undefined control sequence.\nl.{n} {ctx}\n")
+            if re.search(r'\\caption\b', line):
+                return (f"error: {name}:{n}: LaTeX Error: \\caption outside float",
+                        f"! LaTeX Error: \\caption outside float.\nl.{n} {line}\n")
+            text = re.sub(r'(?<!\\)\$.*?(?<!\\)\$', '', line)
+            if re.search(r'(?<!\\)_', text):
+                return (f"error: {name}:{n}: Missing $ inserted",
+                        f"! Missing $ inserted.\nl.{n} {line}\n")
+            if re.match(r'\s*\\(?:hline|midrule|bottomrule)', line):
+                prev = lines[n - 2].rstrip()
+                if '&' in prev and not prev.endswith('\\\\'):
+                    return (f"error: {name}:{n}: Misplaced \\noalign",
+                            f"! Misplaced \\noalign.\nl.{n} {line}\n")
+        return None
+
+
+class MockLogic(main.CoreLogic):
+    """CoreLogic with a deterministic local LLM and the fake TeX engine above.
+
+    Latencies are simulated with sleeps so that orchestration changes
+    (fewer retries, fewer LLM calls, shorter prompts) show up in the numbers.
+    """
+
+    def __init__(self, compile_ms=40.0, compile_ms_per_kb=2.0, llm_ms=300.0, llm_ms_per_kchar=20.0,
+                 speculative_fixes=False):
+        super().__init__(backend=BenchBackend(compile_ms, compile_ms_per_kb), speculative_fixes=speculative_fixes)
+        self.llm_ms = llm_ms
+        self.llm_ms_per_kchar = llm_ms_per_kchar
+
+    # --- mock LLM ---
+    def _llm_request(self, api_config, system_prompt, user_content, json_mode=False):
+        if "LaTeX Parsing Expert" in system_prompt:
+            text = self._mock_extract(user_content)
+        elif '"edits"' in system_prompt:
+            text = self._mock_patch(user_content)
+        else:
+            text = self._mock_full_fix(user_content)
+        time.sleep((self.llm_ms + self.llm_ms_per_kchar * len(text) / 1000.0) / 1000.0)
+        return text, (len(system_prompt) + len(user_content)) // 4, len(text) // 4
+
+    def _mock_extract(self, source):
+        tables = []
+        env_re = re.compile(r'\\begin\{(table\*?|sidewaystable\*?|longtable\*?)\}(\[[^\]]*\])?(.*?)\\end\{\1\}', re.S)
+        for m in env_re.finditer(source):
+            env, body = m.group(1), m.group(3)
+            line = source.count('\n', 0, m.start()) + 1
+            raw = 'tab:raw-' in body
+            body = re.sub(r'\\label\{[^}]*\}\s*', '', body)
+            body = re.sub(r'\\centering\s*', '', body)
+            if not raw:
+                body = re.sub(r'^\s*\\caption\{.*\}\s*$', '', body, flags=re.M)
+            if env.startswith('longtable'):
+                body = f"\\begin{{{env}}}{m.group(2) or ''}{body}\\end{{{env}}}"
+            code = "\\documentclass[preview]{standalone}\n\\usepackage{booktabs}\n\\begin{document}\n" \
+                   + body.strip() + "\n\\end{document}"
+            tables.append({'code': code, 'packages': ['booktabs'], 'source_line': line})
+        return json.dumps({'tables_found': len(tables), 'tables_extracted': len(tables), 'tables': tables})
+
+    def _failed_tex_from_prompt(self, user_content):
+        m = re.search(r'=== FAILED STANDALONE TEX FILE ===\n(.*?)\n\n=== COMPILATION ERRORS', user_content, re.S)
+        return m.group(1) if m else ""
+
+    def _mock_patch(self, user_content):
+        tex = self._failed_tex_from_prompt(user_content)
+        edits = [{'op': 'provide_command', 'name': '\\' + name, 'nargs': 0, 'body': ''} for name in missing_zz(tex)]
+        return json.dumps({'edits': edits})
+
+    def _mock_full_fix(self, user_content):
+        tex = self._failed_tex_from_prompt(user_content)
+        stubs = ''.join(f"\\providecommand{{\\{name}}}{{}}\n" for name in missing_zz(tex))
+        return tex.replace("\\begin{document}", stubs + "\\begin{document}", 1)
+
+    # --- fake rasterizer (BenchBackend output is not a real PDF) ---
+    def _rasterize(self, pdf_file, img_path):
+        with open(pdf_file, "rb") as src, open(img_path, "wb") as dst:
+            dst.write(b"\x89PNG\r\n\x1a\n" + src.read()[:4096])
+
+    def _render_hash(self, pdf_file):
+        with open(pdf_file, "rb") as f:
+            data = f.read()
+        # The document body stands in for the page content of a real PDF
+        return hashlib.sha256(data[data.find(b"\\begin{document}"):]).hexdigest()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / (1024.0 * 1024.0)
+        except ImportError:
+            return None
+
+
+def run_benchmark(args):
+    corpus = sorted(f for f in os.listdir(CORPUS_DIR) if f.endswith(".tex"))
+    workdir = tempfile.mkdtemp(prefix="ltminer_bench_")
+    old_cwd = os.getcwd()
+    os.chdir(workdir)  # _compile_tex writes temp files into the cwd
+    try:
+        logic = MockLogic(
+            compile_ms=0 if args.no_sleep else args.compile_ms,
+            compile_ms_per_kb=0 if args.no_sleep else args.compile_ms_per_kb,
+            llm_ms=0 if args.no_sleep else args.llm_ms,
+            llm_ms_per_kchar=0 if args.no_sleep else args.llm_ms_per_kchar,
+            speculative_fixes=args.speculative,
+        )
+        dm = main.DataManager(config={
+            "storage_path": os.path.join(workdir, "library"),
+            "llm_fix_mode": args.fix_mode,
+            # Repeated passes would otherwise be served entirely from the dedup index
+            "dedup_mode": "link" if args.dedup else "off",
+        })
+        api_cfg = {'api_key': 'mock', 'base_url': '', 'provider': 'Mock', 'model': 'mock-1', 'fix_mode': args.fix_mode}
+        pipeline = main.ExtractionPipeline(logic, dm, api_cfg)
+
+        per_doc = {}
+        start = time.perf_counter()
+        for rep in range(args.repeat):
+            for fname in corpus:
+                with open(os.path.join(CORPUS_DIR, fname), "r", encoding="utf-8") as f:
+                    source = f.read()
+                sink = io.StringIO()
+                with (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(sink)):
+                    summary = pipeline.run(f"{fname}#{rep}", source)
+                doc = per_doc.setdefault(fname, {'tables': 0, 'success': 0})
+                doc['tables'] += summary['total']
+                doc['success'] += summary['success']
+        wall = time.perf_counter() - start
+
+        dm.cursor.execute("SELECT stage, seconds FROM metric_events")
+        stage_times = {}
+        for stage, seconds in dm.cursor.fetchall():
+            stage_times.setdefault(stage, []).append(seconds)
+        dm.cursor.execute("SELECT name, SUM(value) FROM metric_counters GROUP BY name")
+        counters = dict(dm.cursor.fetchall())
+        dm.conn.close()
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    tables = sum(d['tables'] for d in per_doc.values())
+    success = sum(d['success'] for d in per_doc.values())
+    return {
+        'corpus': corpus,
+        'repeat': args.repeat,
+        'fix_mode': args.fix_mode,
+        'tables': tables,
+        'success': success,
+        'wall_seconds': round(wall, 3),
+        'tables_per_min': round(success / wall * 60.0, 2) if wall else 0.0,
+        'compile_attempts_per_table': round(counters.get('compile_attempts', 0) / tables, 3) if tables else 0.0,
+        'llm_calls': counters.get('llm_calls', 0),
+        'llm_tokens': counters.get('llm_prompt_tokens', 0) + counters.get('llm_completion_tokens', 0),
+        'rasterize_reused': counters.get('rasterize_reused', 0),
+        'peak_rss_mb': round(peak_rss_mb() or 0.0, 1),
+        'stages': {
+            stage: {
+                'count': len(v),
+                'p50': round(percentile(v, 50), 6),
+                'p95': round(percentile(v, 95), 6),
+                'total': round(sum(v), 6),
+            } for stage, v in sorted(stage_times.items())
+        },
+        'documents': per_doc,
+    }
+
+
+def _delta(new, old):
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def print_report(result, baseline=None):
+    b = baseline or {}
+    print(f"\n{'='*72}")
+    print(f"  Benchmark: {len(result['corpus'])} documents x{result['repeat']}, fix_mode={result['fix_mode']}")
+    print(f"{'='*72}")
+    rows = [
+        ("tables compiled", f"{result['success']}/{result['tables']}", None, None),
+        ("throughput (tables/min)", result['tables_per_min'], result['tables_per_min'], b.get('tables_per_min')),
+        ("compile attempts/table", result['compile_attempts_per_table'], result['compile_attempts_per_table'], b.get('compile_attempts_per_table')),
+        ("LLM calls", result['llm_calls'], result['llm_calls'], b.get('llm_calls')),
+        ("LLM tokens", result['llm_tokens'], result['llm_tokens'], b.get('llm_tokens')),
+        ("rasterizations reused", result['rasterize_reused'], None, None),
+        ("peak RSS (MB)", result['peak_rss_mb'], result['peak_rss_mb'], b.get('peak_rss_mb')),
+    ]
+    for label, shown, new, old in rows:
+        delta = _delta(new, old) if new is not None and baseline else ""
+        print(f"  {label:<28}{str(shown):>14}  {delta}")
+    print(f"{'-'*72}")
+    print(f"  {'stage':<16}{'count':>7}{'p50 (ms)':>12}{'p95 (ms)':>12}{'total (s)':>12}  p95 vs base")
+    for stage, st in result['stages'].items():
+        old = b.get('stages', {}).get(stage, {}).get('p95')
+        delta = _delta(st['p95'], old) if baseline else ""
+        print(f"  {stage:<16}{st['count']:>7}{st['p50']*1000:>12.2f}{st['p95']*1000:>12.2f}{st['total']:>12.3f}  {delta}")
+    print(f"{'='*72}\n")
+
+
+def find_regressions(result, baseline, max_regression):
+    """Return human-readable regressions beyond max_regression percent"""
+    problems = []
+    limit = max_regression / 100.0
+    if baseline.get('tables_per_min') and result['tables_per_min'] < baseline['tables_per_min'] * (1 - limit):
+        problems.append(f"throughput {result['tables_per_min']} < baseline {baseline['tables_per_min']}")
+    if baseline.get('compile_attempts_per_table') and \
+            result['compile_attempts_per_table'] > baseline['compile_attempts_per_table'] * (1 + limit):
+        problems.append(f"compile attempts/table {result['compile_attempts_per_table']} > baseline {baseline['compile_attempts_per_table']}")
+    for stage, st in result['stages'].items():
+        old = baseline.get('stages', {}).get(stage, {}).get('p95')
+        if old and st['p95'] > old * (1 + limit):
+            problems.append(f"{stage} p95 {st['p95']*1000:.2f}ms > baseline {old*1000:.2f}ms")
+    return problems
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Latex Table Miner pipeline benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    parser.add_argument("--fix-mode", choices=["patch", "full"], default="patch")
+    parser.add_argument("--dedup", action="store_true", help="keep duplicate detection on across repeats")
+    parser.add_argument("--compile-ms", type=float, default=40.0, help="simulated fixed cost per compile")
+    parser.add_argument("--compile-ms-per-kb", type=float, default=2.0, help="simulated compile cost per KB of .tex")
+    parser.add_argument("--llm-ms", type=float, default=300.0, help="simulated fixed latency per LLM call")
+    parser.add_argument("--llm-ms-per-kchar", type=float, default=20.0, help="simulated latency per 1000 output chars")
+    parser.add_argument("--speculative", action="store_true", help="race candidate repairs on first failure")
+    parser.add_argument("--no-sleep", action="store_true", help="disable all simulated latency")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="exit non-zero when a metric regresses by more than this percent")
+    parser.add_argument("--json", default=None, help="also write the result to this file")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline console output")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+    elif args.max_regression is not None:
+        problems = find_regressions(result, baseline, args.max_regression)
+        for p in problems:
+            print(f"[REGRESSION] {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
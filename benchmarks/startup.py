@@ -0,0 +1,111 @@
+"""Startup benchmark for Latex Table Miner.
+
+Measures, in fresh interpreters, how long it takes to import the headless core
+(`import main`), to run a CLI command, to import the GUI module and (with
+--window, needs a display) to get the main window on screen. Also checks that
+headless paths do not load the heavy GUI/rendering dependencies.
+
+    python benchmarks/startup.py                 # 5 runs per scenario
+    python benchmarks/startup.py --importtime    # slowest imports of `import main`
+    python benchmarks/startup.py --check         # non-zero exit if headless import loads GUI deps
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must never be imported by `import main` or headless commands
+HEAVY_MODULES = ("tkinter", "customtkinter", "PIL", "fitz", "requests")
+
+_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+SCENARIOS = {
+    'import main': "import main",
+    'cli backends': "import main, io, contextlib\n"
+                    "with contextlib.redirect_stdout(io.StringIO()): main.main(['backends'])",
+    'import gui': "import main, gui",  # as main.main() does before gui.run(main)
+    'window shown': "import main, gui\n"
+                    "app = gui.App(main)\n"
+                    "app.update()  # first paint; DB and engine are still loading on a worker\n"
+                    "app.destroy()",
+}
+
+
+def probe(name, runs):
+    code = _PROBE.format(body=SCENARIOS[name], heavy=HEAVY_MODULES)
+    samples, loaded = [], []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {'error': (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(result['seconds'] * 1000.0)
+        loaded = result['loaded']
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples), 'loaded': loaded}
+
+
+def import_profile(top=15):
+    """Slowest modules (cumulative microseconds) pulled in by `import main`"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Latex Table Miner startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--window", action="store_true", help="also time the first paint of the main window")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports of `import main`")
+    parser.add_argument("--check", action="store_true", help="fail if `import main` loads a GUI/rendering module")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = ['import main', 'cli backends', 'import gui'] + (['window shown'] if args.window else [])
+    report = {name: probe(name, args.runs) for name in names}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\n{'='*72}")
+        print(f"  Startup ({args.runs} runs each, fresh interpreter)")
+        print(f"{'='*72}")
+        print(f"  {'scenario':<16}{'median (ms)':>12}{'min (ms)':>10}   heavy modules loaded")
+        for name, res in report.items():
+            if 'error' in res:
+                print(f"  {name:<16}{'-':>12}{'-':>10}   skipped: {res['error'][:40]}")
+            else:
+                print(f"  {name:<16}{res['median_ms']:>12.1f}{res['min_ms']:>10.1f}   {', '.join(res['loaded']) or '-'}")
+        print(f"{'='*72}")
+        if args.importtime:
+            print("  slowest imports of `import main` (cumulative ms):")
+            for cumulative_us, module in import_profile():
+                print(f"    {cumulative_us / 1000.0:>8.1f}  {module}")
+            print(f"{'='*72}")
+        print()
+
+    headless = report['import main']
+    if args.check and ('error' in headless or headless['loaded']):
+        print(f"FAIL: headless import loaded {headless.get('loaded') or headless.get('error')}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
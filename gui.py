@@ -0,0 +1,927 @@
+"""Desktop UI of Latex Table Miner (customtkinter).
+
+main.main() imports this module only when the GUI is launched, so the CLI,
+the benchmarks and library use never load Tk or PIL. It then calls run() with
+itself: the core module is passed in rather than imported here, so running
+main.py as a script does not load a second copy of it under the name "main".
+"""
+import os
+import threading
+import webbrowser
+from PIL import Image
+import customtkinter as ctk
+from tkinter import filedialog, messagebox
+
+ctk.set_appearance_mode("Light")
+ctk.set_default_color_theme("blue")
+
+# --- 3. UI Interface ---
+TRANSLATIONS = {
+    "CN": {
+        "title": "Latex 表格提取器",
+        "logo_text": "LT Miner",
+        "api_group": "API 设置",
+        "api_key_ph": "请输入 API Key",
+        "base_url_ph": "Base URL (默认自动)",
+        "model_ph": "模型名称 (e.g. gpt-4)",
+        "path_btn": "更改存储路径",
+        "import_btn": "导入本地 .tex 文件",
+        "import_dir_btn": "批量导入文件夹 / 压缩包",
+        "task_group": "新任务",
+        "arxiv_ph": "ArXiv ID (e.g. 2301.xxxx)",
+        "clean_mode": "数据脱敏模式",
+        "clean_hint": "说明：开启后检查器显示表体数值已替换为选定字符的版本（标签、表头与结构不变）；开启时提取的表格还会保存由脱敏代码渲染的预览图。",
+        "run_btn": "开始提取",
+        "run_btn_loading": "处理中...",
+        "resume_btn": "继续未完成任务 ({})",
+        "cancel_btn": "取消",
+        "cancelled": "⏹ 已取消（可继续）",
+        "tab_lib": "资料库",
+        "tab_insp": "检查器",
+        "pkg_label": "依赖包 (Packages)",
+        "copy_btn": "复制引用代码",
+        "src_label": "LaTeX 源码",
+        "note_label": "备注",
+        "save_note_btn": "保存备注",
+        "preview_lost": "预览丢失",
+        "preview_none": "无预览",
+        "lib_view": "查看",
+        "lib_del": "删除",
+        "lib_page": "第 {} / {} 页（共 {} 个表格）",
+        "success_title": "成功",
+        "success_msg": "提取 {} 个表格",
+        "copy_success_title": "复制成功",
+        "confirm_del": "确认删除此条目？",
+        "warn_no_api": "请输入 API Key",
+        "warn_no_url": "请输入 Base URL",
+        "warn_no_path": "请先选择存储路径！",
+        "copyright": "Copyright © 2ManyStars",
+        "arrow_hint": "提示：在检查器中按 ↑↓ 方向键可快捷切换表格"
+    },
+    "EN": {
+        "title": "Latex Table Miner",
+        "logo_text": "LT Miner",
+        "api_group": "API Settings",
+        "api_key_ph": "Enter API Key",
+        "base_url_ph": "Base URL (Auto default)",
+        "model_ph": "Model Name (e.g. gpt-4)",
+        "path_btn": "Change Storage Path",
+        "import_btn": "Import Local .tex",
+        "import_dir_btn": "Import Folder / Tarballs",
+        "task_group": "New Task",
+        "arxiv_ph": "ArXiv ID (e.g. 2301.xxxx)",
+        "clean_mode": "Data Desensitization",
+        "clean_hint": "Note: The Inspector shows the variant with every body value replaced by the selected char (labels, headers and structure kept); tables extracted while it is on also store a preview rendered from it.",
+        "run_btn": "Start Extraction",
+        "run_btn_loading": "Processing...",
+        "resume_btn": "Resume Unfinished ({})",
+        "cancel_btn": "Cancel",
+        "cancelled": "⏹ Cancelled (resumable)",
+        "tab_lib": "Library",
+        "tab_insp": "Inspector",
+        "pkg_label": "Packages",
+        "copy_btn": "Copy Command",
+        "src_label": "LaTeX Source",
+        "note_label": "Notes",
+        "save_note_btn": "Save Note",
+        "preview_lost": "Preview Lost",
+        "preview_none": "No Preview",
+        "lib_view": "View",
+        "lib_del": "Delete",
+        "lib_page": "Page {} / {} ({} tables)",
+        "success_title": "Success",
+        "success_msg": "Extracted {} tables",
+        "copy_success_title": "Copied",
+        "confirm_del": "Delete this item?",
+        "warn_no_api": "Please enter API Key",
+        "warn_no_url": "Please enter Base URL",
+        "warn_no_path": "Please select storage path first!",
+        "copyright": "Copyright © 2ManyStars",
+        "arrow_hint": "Tip: Press ↑↓ arrow keys in Inspector to switch tables"
+    }
+}
+
+class TaskExecutor:
+    """Background worker pool whose callbacks run on the Tk main thread.
+
+    Workers never touch widgets: results (and call_soon requests from any thread)
+    go through a queue that the main loop drains every poll_ms via after().
+    """
+
+    def __init__(self, widget, max_workers=2, poll_ms=30):
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self.results = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ltminer-ui")
+        # Speculative work (preview prefetch) never queues in front of what the user is waiting for
+        self.background_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ltminer-ui-bg")
+        self.widget.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, background=False):
+        """Run fn(*args) on a worker; on_done(result) / on_error(exc) run on the main thread"""
+        def job():
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.results.put((on_error or self._report_error, e))
+                return
+            if on_done:
+                self.results.put((on_done, result))
+        return (self.background_pool if background else self.pool).submit(job)
+
+    def call_soon(self, fn, *args):
+        """Thread-safe: schedule fn(*args) on the main thread"""
+        self.results.put((lambda a: fn(*a), args))
+
+    def _report_error(self, exc):
+        print(f"[UI-TASK] Background task failed: {str(exc)[:200]}")
+
+    def _poll(self):
+        import queue
+        try:
+            while True:
+                callback, value = self.results.get_nowait()
+                try:
+                    callback(value)
+                except Exception as e:
+                    print(f"[UI-TASK] Callback error: {str(e)[:200]}")
+        except queue.Empty:
+            pass
+        self.widget.after(self.poll_ms, self._poll)
+
+class PreviewCache:
+    """Thread-safe LRU of decoded, already-resized preview images keyed by (table id, cleaned, max size)"""
+
+    def __init__(self, capacity=24):
+        from collections import OrderedDict
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.pending = {}  # key being decoded by a worker -> {'future': prefetch future or None, 'waiters': [...]}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, pil_img):
+        """Store a decoded image and hand it to the waiters of key (call on the main thread)"""
+        with self.lock:
+            waiters = self.pending.pop(key, {}).get('waiters', [])
+            entry = self.items[key] = {'pil': pil_img, 'ctk': None}
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+        for waiter in waiters:
+            waiter(entry)
+        return entry
+
+    def claim(self, key):
+        """Mark key as being decoded; False if it is cached or already in flight"""
+        with self.lock:
+            if key in self.items or key in self.pending:
+                return False
+            self.pending[key] = {'future': None, 'waiters': []}
+            return True
+
+    def track(self, key, future):
+        """Remember the prefetch future decoding key, so cancel_queued can drop it"""
+        with self.lock:
+            if key in self.pending:
+                self.pending[key]['future'] = future
+
+    def cancel_queued(self, key):
+        """Drop a prefetch of key that has not started yet; True if it was dropped (key is unclaimed again)"""
+        with self.lock:
+            pending = self.pending.get(key)
+            if pending and not pending['waiters'] and pending['future'] is not None and pending['future'].cancel():
+                del self.pending[key]
+                return True
+            return False
+
+    def wait(self, key, waiter):
+        """Call waiter(entry) when the decode of key in flight lands; False if none is in flight"""
+        with self.lock:
+            if key not in self.pending:
+                return False
+            self.pending[key]['waiters'].append(waiter)
+            return True
+
+    def discard(self, table_id):
+        with self.lock:
+            for key in [k for k in self.items if k[0] == table_id]:
+                del self.items[key]
+
+class App(ctk.CTk):
+    PREVIEW_SIZE = (600, 800)
+    PREFETCH_ROWS = 3  # neighbours decoded ahead in each direction
+    LIBRARY_PAGE_SIZE = 50  # cards built at a time; the rest of the library is only a row list
+
+    def __init__(self, core=None):
+        super().__init__()
+        self.core = core or _import_core()  # main, see run()
+        self.lang = "CN"
+        self.t = TRANSLATIONS[self.lang]
+        
+        self.title(self.t["title"])
+        self.geometry("1100x800")
+        # Only app_config.json is read up front; the database and the TeX engine
+        # (detection, package index) are set up on a worker once the window is shown
+        self.data_manager = self.core.open_library(open_db=False)
+        self.logic = None
+        self.tasks = TaskExecutor(self)
+        self.preview_cache = PreviewCache()
+        self.current_table_id = None
+        self.library_data = []  # Store current library data for pagination
+        self.current_index = -1  # Current index in library_data
+        self.library_page = 0
+        self._library_gen = 0  # Drops stale refresh_library results
+        self.setup_ui()
+        for btn in (self.run_btn, self.import_local_btn, self.import_dir_btn):
+            btn.configure(state="disabled")
+        self.set_status("⏳ Loading library...")
+        self.tasks.submit(self._init_backend, on_done=self._backend_ready, on_error=self._backend_failed)
+
+    def _init_backend(self):
+        self.data_manager.init_db()
+        return self.core.CoreLogic.from_config(self.data_manager.config)
+
+    def _backend_ready(self, logic):
+        self.logic = logic
+        for btn in (self.run_btn, self.import_local_btn, self.import_dir_btn):
+            btn.configure(state="normal")
+        self.set_status("✅ Ready", active=False)
+        self.refresh_library()
+        self.refresh_jobs()
+
+    def _backend_failed(self, exc):
+        self.set_status("❌ Error", active=False)
+        messagebox.showerror("Error", str(exc))
+
+    def ui_call(self, fn, *args):
+        """Thread-safe way for worker threads to touch widgets"""
+        self.tasks.call_soon(fn, *args)
+
+    def setup_ui(self):
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        
+        # Font color config (enhance contrast)
+        self.text_color_primary = "#1A1A1A"  # Dark black
+        self.text_color_secondary = "#555555" # Dark gray
+
+        # Left Sidebar
+        self.sidebar = ctk.CTkFrame(self, width=240, corner_radius=0)
+        self.sidebar.grid(row=0, column=0, sticky="nsew")
+        
+        # Language Switch
+        self.lang_switch = ctk.CTkSegmentedButton(self.sidebar, values=["CN", "EN"], command=self.change_language)
+        self.lang_switch.set("CN")
+        self.lang_switch.pack(pady=(20, 10), padx=15, fill="x")
+
+        self.logo_label = ctk.CTkLabel(self.sidebar, text="LT Miner", font=("Roboto Medium", 22), text_color=self.text_color_primary)
+        self.logo_label.pack(pady=(10, 20))
+        
+        # --- API Settings ---
+        self.api_group_label = ctk.CTkLabel(self.sidebar, text="API Settings", font=("Arial", 14, "bold"), anchor="w", text_color=self.text_color_primary)
+        self.api_group_label.pack(padx=15, fill="x")
+        
+        self.provider_var = ctk.StringVar(value=self.data_manager.config.get("provider", "OpenAI"))
+        self.provider_menu = ctk.CTkOptionMenu(self.sidebar, values=["OpenAI", "Google", "DeepSeek", "Qwen"], 
+                                               variable=self.provider_var, command=self.update_provider_settings)
+        self.provider_menu.pack(pady=5, padx=15, fill="x")
+
+        self.api_input = ctk.CTkEntry(self.sidebar)
+        self.api_input.insert(0, self.data_manager.config.get("api_key", ""))
+        self.api_input.pack(pady=5, padx=15, fill="x")
+
+        self.base_url_input = ctk.CTkEntry(self.sidebar)
+        self.base_url_input.insert(0, self.data_manager.config.get("base_url", "https://api.openai.com/v1"))
+        self.base_url_input.pack(pady=5, padx=15, fill="x")
+        
+        self.model_input = ctk.CTkEntry(self.sidebar)
+        self.model_input.insert(0, self.data_manager.config.get("model", "gpt-3.5-turbo"))
+        self.model_input.pack(pady=5, padx=15, fill="x")
+
+        self.path_btn = ctk.CTkButton(self.sidebar, text="Path", command=self.change_path, fg_color="transparent", border_width=1, text_color=self.text_color_primary)
+        self.path_btn.pack(pady=10, padx=15, fill="x")
+
+        # --- Task Settings ---
+        self.task_group_label = ctk.CTkLabel(self.sidebar, text="New Task", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
+        self.task_group_label.pack(pady=(20, 5), anchor="w", padx=15)
+        
+        self.arxiv_input = ctk.CTkEntry(self.sidebar)
+        self.arxiv_input.pack(pady=5, padx=15, fill="x")
+
+        self.import_local_btn = ctk.CTkButton(self.sidebar, text="Import Local", command=self.import_local, fg_color="#5F6F81")
+        self.import_local_btn.pack(pady=(0, 5), padx=15, fill="x")
+
+        self.import_dir_btn = ctk.CTkButton(self.sidebar, text="Import Folder", command=self.import_folder, fg_color="#5F6F81")
+        self.import_dir_btn.pack(pady=(0, 5), padx=15, fill="x")
+        
+        # Data Desensitization Module
+        self.clean_mode_var = ctk.BooleanVar(value=False)
+        self.clean_mode_checkbox = ctk.CTkCheckBox(self.sidebar, text="Clean Mode", variable=self.clean_mode_var, text_color=self.text_color_primary,
+                                                   command=self.reload_detail)
+        self.clean_mode_checkbox.pack(pady=(10, 2), padx=15, anchor="w")
+        
+        self.clean_hint_label = ctk.CTkLabel(self.sidebar, text="Hint...", text_color=self.text_color_secondary, font=("Arial", 11), wraplength=200, justify="left")
+        self.clean_hint_label.pack(padx=15, anchor="w")
+
+        self.clean_char_var = ctk.StringVar(value=self.data_manager.config.get("clean_char", "-"))
+        self.clean_char_seg = ctk.CTkSegmentedButton(self.sidebar, values=["-", "SPACE"], variable=self.clean_char_var,
+                                                      command=lambda _: self.reload_detail())
+        self.clean_char_seg.pack(pady=5, padx=15, fill="x")
+
+        self.run_btn = ctk.CTkButton(self.sidebar, text="Run", command=self.start_extract_thread)
+        self.run_btn.pack(pady=20, padx=15, fill="x")
+
+        # Only packed while an extraction runs
+        self.cancel_btn = ctk.CTkButton(self.sidebar, text="Cancel", command=self.cancel_extraction, fg_color="#C0392B")
+
+        # Only packed while the job journal has unfinished runs (see refresh_jobs)
+        self.resume_btn = ctk.CTkButton(self.sidebar, text="Resume", command=self.resume_jobs, fg_color="#B5651D")
+        self.unfinished_jobs = []
+
+        # Copyright Link
+        self.copyright_label = ctk.CTkLabel(self.sidebar, text="Copyright © 2ManyStars", text_color="gray", cursor="hand2")
+        self.copyright_label.pack(side="bottom", pady=10)
+        self.copyright_label.bind("<Button-1>", lambda e: webbrowser.open("https://github.com/DianxingShi"))
+
+        # Right Tabview
+        self.tabview = ctk.CTkTabview(self, text_color=self.text_color_primary)
+        self.tabview.grid(row=0, column=1, sticky="nsew", padx=15, pady=10)
+        self.tabview.add("Library")
+        self.tabview.add("Inspector")
+        
+        self.library_pager = ctk.CTkFrame(self.tabview.tab("Library"), fg_color="transparent")
+        self.library_pager.pack(side="bottom", fill="x", pady=(5, 0))
+        self.library_prev_btn = ctk.CTkButton(self.library_pager, text="◀", width=40,
+                                              command=lambda: self.step_library_page(-1))
+        self.library_prev_btn.pack(side="left", padx=5)
+        self.library_next_btn = ctk.CTkButton(self.library_pager, text="▶", width=40,
+                                              command=lambda: self.step_library_page(1))
+        self.library_next_btn.pack(side="right", padx=5)
+        self.library_page_label = ctk.CTkLabel(self.library_pager, text="", text_color=self.text_color_secondary)
+        self.library_page_label.pack(expand=True)
+
+        self.library_frame = ctk.CTkScrollableFrame(self.tabview.tab("Library"))
+        self.library_frame.pack(fill="both", expand=True)
+        
+        # Inspector Interface
+        self.inspector = ctk.CTkFrame(self.tabview.tab("Inspector"), fg_color="transparent")
+        self.inspector.pack(fill="both", expand=True)
+        
+        self.insp_left = ctk.CTkFrame(self.inspector)
+        self.insp_left.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+        self.img_preview = ctk.CTkLabel(self.insp_left, text="No Preview", text_color="gray")
+        self.img_preview.pack(expand=True)
+        
+        self.insp_right = ctk.CTkScrollableFrame(self.inspector, width=420)
+        self.insp_right.pack(side="right", fill="y", padx=5, pady=5)
+        
+        # Packages Area
+        self.pkg_label = ctk.CTkLabel(self.insp_right, text="Packages", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
+        self.pkg_label.pack(anchor="w", pady=(10,5))
+        
+        self.packages_frame = ctk.CTkFrame(self.insp_right, fg_color="transparent")
+        self.packages_frame.pack(fill="x", pady=5)
+        
+        self.copy_pkg_btn = ctk.CTkButton(self.insp_right, text="Copy", height=24, command=self.copy_packages)
+        self.copy_pkg_btn.pack(fill="x", pady=(0, 15))
+        
+        self.src_label = ctk.CTkLabel(self.insp_right, text="Source", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
+        self.src_label.pack(anchor="w")
+        self.code_editor = ctk.CTkTextbox(self.insp_right, height=200, font=("Consolas", 12))
+        self.code_editor.pack(fill="x", pady=5)
+        
+        self.note_label = ctk.CTkLabel(self.insp_right, text="Note", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
+        self.note_label.pack(anchor="w", pady=(10,0))
+        self.note_editor = ctk.CTkTextbox(self.insp_right, height=150)
+        self.note_editor.pack(fill="x", pady=5)
+        
+        self.save_note_btn = ctk.CTkButton(self.insp_right, text="Save", command=self.save_current_note)
+        self.save_note_btn.pack(fill="x", pady=10)
+
+        # Shortcut Hint
+        self.arrow_hint_label = ctk.CTkLabel(self.insp_right, text="", text_color="#888888", font=("Arial", 11), wraplength=380, justify="center")
+        self.arrow_hint_label.pack(pady=(5, 10))
+
+        self.current_packages_str = ""
+        
+        # Bind Arrow Keys
+        self.bind("<Up>", lambda e: self.navigate_inspector(-1))
+        self.bind("<Down>", lambda e: self.navigate_inspector(1))
+        
+        # === LED Status Bar ===
+        self.status_frame = ctk.CTkFrame(self, height=28, width=420, corner_radius=14, fg_color="#e8ecf1")
+        self.status_frame.place(relx=0.5, rely=1.0, anchor="s", y=-6)
+        self.status_frame.grid_propagate(False)
+        self.status_frame.grid_columnconfigure(1, weight=1)
+        
+        self.status_dot = ctk.CTkLabel(self.status_frame, text="●", font=("Consolas", 10),
+                                       text_color="#c0c5cc", width=16)
+        self.status_dot.grid(row=0, column=0, padx=(10, 3), pady=3)
+        
+        self.status_label = ctk.CTkLabel(self.status_frame, text="Ready",
+                                         font=("Consolas", 10), text_color="#a0a5ac",
+                                         anchor="w")
+        self.status_label.grid(row=0, column=1, sticky="w", padx=(0, 10), pady=3)
+        
+        self._status_blink_id = None
+        self._status_active = False
+        self._blink_state = True
+        self._led_bg = "#e8ecf1"
+        
+        self.update_language("CN") # Initialize language
+
+    def set_status(self, msg, active=True):
+        """Thread-safe LED status update"""
+        def _update():
+            self.status_label.configure(text=msg)
+            if active:
+                self.status_label.configure(text_color="#2980B9")
+                self.status_dot.configure(text_color="#2980B9")
+                self._status_active = True
+                self._start_blink()
+            else:
+                self._status_active = False
+                if self._status_blink_id:
+                    self.after_cancel(self._status_blink_id)
+                    self._status_blink_id = None
+                if "✅" in msg:
+                    self.status_label.configure(text_color="#27ae60")
+                    self.status_dot.configure(text_color="#27ae60")
+                elif "❌" in msg:
+                    self.status_label.configure(text_color="#e74c3c")
+                    self.status_dot.configure(text_color="#e74c3c")
+                self.after(5000, self._fade_status)
+        self.ui_call(_update)
+
+    def _start_blink(self):
+        if self._status_blink_id:
+            self.after_cancel(self._status_blink_id)
+        self._blink_state = True
+        self._blink_dot()
+
+    def _blink_dot(self):
+        if not self._status_active:
+            return
+        if self._blink_state:
+            self.status_dot.configure(text_color="#2980B9")
+        else:
+            self.status_dot.configure(text_color=self._led_bg)
+        self._blink_state = not self._blink_state
+        self._status_blink_id = self.after(600, self._blink_dot)
+
+    def _fade_status(self):
+        if not self._status_active:
+            self.status_label.configure(text_color="#c0c5cc")
+            self.status_dot.configure(text_color="#c0c5cc")
+
+    def change_language(self, value):
+        self.lang = value
+        self.t = TRANSLATIONS[value]
+        self.update_language(value)
+        self.refresh_library()
+
+    def update_language(self, lang):
+        t = TRANSLATIONS[lang]
+        self.title(t['title'])
+        self.logo_label.configure(text=t['logo_text'])
+        self.api_group_label.configure(text=t['api_group'])
+        self.api_input.configure(placeholder_text=t['api_key_ph'])
+        self.base_url_input.configure(placeholder_text=t['base_url_ph'])
+        self.model_input.configure(placeholder_text=t['model_ph'])
+        self.path_btn.configure(text=t['path_btn'])
+        self.task_group_label.configure(text=t['task_group'])
+        self.arxiv_input.configure(placeholder_text=t['arxiv_ph'])
+        self.import_local_btn.configure(text=t['import_btn'])
+        self.import_dir_btn.configure(text=t['import_dir_btn'])
+        self.clean_mode_checkbox.configure(text=t['clean_mode'])
+        self.clean_hint_label.configure(text=t['clean_hint'])
+        self.run_btn.configure(text=t['run_btn'])
+        self.resume_btn.configure(text=t['resume_btn'].format(len(self.unfinished_jobs)))
+        self.cancel_btn.configure(text=t['cancel_btn'])
+        self.copyright_label.configure(text=t['copyright'])
+        self._update_library_pager()
+        
+        # TabView titles
+        try:
+            self.tabview._segmented_button._buttons_dict["Library"].configure(text=t['tab_lib'])
+            self.tabview._segmented_button._buttons_dict["Inspector"].configure(text=t['tab_insp'])
+        except: pass
+
+        self.pkg_label.configure(text=t['pkg_label'])
+        self.copy_pkg_btn.configure(text=t['copy_btn'])
+        self.src_label.configure(text=t['src_label'])
+        self.note_label.configure(text=t['note_label'])
+        self.save_note_btn.configure(text=t['save_note_btn'])
+        self.arrow_hint_label.configure(text=t['arrow_hint'])
+
+    def update_provider_settings(self, provider):
+        defaults = {
+            "OpenAI": ("https://api.openai.com/v1", "gpt-3.5-turbo"),
+            "Google": ("", "gemini-pro"),
+            "DeepSeek": ("https://api.deepseek.com", "deepseek-chat"),
+            "Qwen": ("https://dashscope.aliyuncs.com/compatible-mode/v1", "qwen-plus")
+        }
+        if provider in defaults:
+            url, model = defaults[provider]
+            self.base_url_input.delete(0, "end")
+            self.base_url_input.insert(0, url)
+            self.model_input.delete(0, "end")
+            self.model_input.insert(0, model)
+
+    def change_path(self):
+        new_path = filedialog.askdirectory()
+        if new_path:
+            self.tasks.submit(self.data_manager.save_config, {"storage_path": new_path},
+                              on_done=lambda _: (self.refresh_library(), self.refresh_jobs()))
+            return True
+        return False
+
+    def start_extract_thread(self, mode="arxiv", data=None):
+        # Widgets are read here, on the main thread; the worker only gets plain values
+        settings = {
+            'api_key': self.api_input.get(),
+            'base_url': self.base_url_input.get(),
+            'provider': self.provider_var.get(),
+            'model': self.model_input.get(),
+            'clean_char_choice': self.clean_char_var.get(),
+            'clean_mode': self.clean_mode_var.get(),
+            'arxiv_id': self.arxiv_input.get(),
+        }
+        threading.Thread(target=self.run_extraction, args=(mode, data, settings), daemon=True).start()
+
+    def import_local(self):
+        file_path = filedialog.askopenfilename(filetypes=[("LaTeX Files", "*.tex"), ("All Files", "*.*")])
+        if file_path:
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                filename = os.path.basename(file_path)
+                self.start_extract_thread(mode="local", data={"content": content, "filename": filename})
+            except Exception as e:
+                messagebox.showerror("Error", f"Read failed: {e}")
+
+    def import_folder(self):
+        """Offline batch import of a local mirror (project folders and/or arXiv tarballs)"""
+        folder = filedialog.askdirectory()
+        if folder:
+            self.start_extract_thread(mode="folder", data={"paths": [folder]})
+
+    def run_extraction(self, mode="arxiv", data=None, settings=None):
+        # Check if storage path is set
+        if not self.data_manager.config.get("storage_path"):
+            self.ui_call(lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_path"]))
+            # Try to let user select
+            self.ui_call(self.change_path)
+            # Whether selected or not, do not continue this time, let user click again
+            return
+
+        api_key = settings['api_key']
+        base_url = settings['base_url']
+        provider = settings['provider']
+        model = settings['model']
+        clean_char = " " if settings['clean_char_choice'] == "SPACE" else "-"
+        
+        if not api_key: 
+            self.ui_call(lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_api"]))
+            return
+
+        if provider != "Google" and not base_url:
+             self.ui_call(lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_url"]))
+             return
+
+        self.data_manager.save_config({
+            "api_key": api_key,
+            "base_url": base_url,
+            "provider": provider,
+            "model": model,
+            "clean_char": settings['clean_char_choice']
+        })
+
+        self.ui_call(lambda: self.run_btn.configure(state="disabled", text=self.t["run_btn_loading"]))
+        self.ui_call(lambda: self.resume_btn.configure(state="disabled"))
+        self.ui_call(lambda: self.cancel_btn.pack(pady=(0, 20), padx=15, fill="x", after=self.run_btn))
+        self.logic.cancel_event.clear()
+        self.logic.policy.begin_batch(mode)
+        try:
+            if mode in ("resume", "folder"):
+                doc_id, source = None, None
+            elif mode == "local":
+                source = data["content"]
+                doc_id = f"Local_{data['filename']}"
+                self.set_status("📂 Loading local file...")
+            else:
+                doc_id = settings['arxiv_id']
+                if not doc_id: 
+                    self.ui_call(lambda: messagebox.showwarning("Tip", "ID required"))
+                    return 
+                source = None  # fetched by the pipeline
+
+            # Build API config for LLM extraction and fix
+            api_cfg = {
+                'api_key': api_key,
+                'base_url': base_url,
+                'provider': provider,
+                'model': model,
+                'fix_mode': self.data_manager.config.get('llm_fix_mode', 'patch'),
+                'routes': self.data_manager.config.get('llm_routes') or {},
+            }
+            pipeline = self.core.ExtractionPipeline(
+                self.logic, self.data_manager, api_cfg,
+                clean_mode=settings['clean_mode'], clean_char=clean_char,
+                status_cb=self.set_status
+            )
+            if mode == "folder":
+                importer = self.core.LocalImporter(
+                    self.logic, self.data_manager, api_cfg,
+                    workers=self.data_manager.config.get("import_workers", 4),
+                    clean_mode=settings['clean_mode'], clean_char=clean_char,
+                    status_cb=self.set_status
+                )
+                summary = importer.run(data["paths"])
+                if summary['cancelled']:
+                    raise self.core.ExtractionCancelled("Import cancelled")
+                success_count, fail_count = summary['success'], summary['failed']
+            elif mode == "resume":
+                # Journaled runs pick up where they stopped, oldest first
+                success_count = fail_count = 0
+                for job_id in data["job_ids"]:
+                    # A job that cannot be resumed is logged and skipped; it stays in the unfinished list
+                    try:
+                        summary = pipeline.run(None, job_id=job_id)
+                    except self.core.ExtractionCancelled:
+                        raise
+                    except Exception as job_err:
+                        print(f"[JOB] Resuming job #{job_id} failed: {str(job_err)[:200]}")
+                        self.set_status(f"❌ Job #{job_id} failed")
+                        continue
+                    success_count += summary['success']
+                    fail_count += summary['failed']
+            else:
+                summary = pipeline.run(doc_id, source)
+                success_count, fail_count = summary['success'], summary['failed']
+            
+            self.ui_call(self.refresh_library)
+            result_msg = f"✅ Done: {success_count} ok"
+            if fail_count > 0:
+                result_msg += f", {fail_count} fail"
+            llm_tokens = self.logic.policy.report()['batch']['tokens']
+            if llm_tokens:
+                result_msg += f" · {llm_tokens} LLM tokens"
+            self.set_status(result_msg, active=False)
+            msg = self.t["success_msg"].format(success_count)
+            if fail_count > 0:
+                msg += f" ({fail_count} failed)"
+            self.ui_call(lambda m=msg: messagebox.showinfo(self.t["success_title"], m))
+        except self.core.ExtractionCancelled:
+            self.set_status(self.t["cancelled"], active=False)
+        except Exception as e:
+            err_msg = str(e)
+            self.set_status("❌ Error", active=False)
+            self.ui_call(lambda: messagebox.showerror("Error", err_msg))
+        finally:
+            self.ui_call(lambda: self.run_btn.configure(state="normal", text=self.t["run_btn"]))
+            self.ui_call(lambda: self.resume_btn.configure(state="normal"))
+            self.ui_call(self.cancel_btn.pack_forget)
+            self.ui_call(self.refresh_jobs)
+
+    def cancel_extraction(self):
+        if self.logic is None: return
+        self.logic.cancel()
+        self.set_status("⏹ Cancelling...")
+
+    def refresh_jobs(self):
+        """Show the resume button while the job journal has unfinished runs"""
+        self.tasks.submit(self.data_manager.get_unfinished_jobs, on_done=self._render_jobs)
+
+    def _render_jobs(self, jobs):
+        self.unfinished_jobs = jobs
+        if jobs:
+            self.resume_btn.configure(text=self.t["resume_btn"].format(len(jobs)))
+            self.resume_btn.pack(pady=(0, 20), padx=15, fill="x", after=self.run_btn)
+        else:
+            self.resume_btn.pack_forget()
+
+    def resume_jobs(self):
+        if self.unfinished_jobs:
+            self.start_extract_thread(mode="resume", data={"job_ids": [j[0] for j in self.unfinished_jobs]})
+
+    def refresh_library(self):
+        """Query the library on a worker, rebuild the cards when the rows arrive"""
+        self._library_gen += 1
+        gen = self._library_gen
+        self.tasks.submit(self.data_manager.get_library_rows,
+                          on_done=lambda data, g=gen: self._render_library(data, g))
+
+    def _render_library(self, data, gen):
+        if gen != self._library_gen:
+            return  # A newer refresh is in flight
+        self.library_data = data if data else []
+        self.library_page = min(self.library_page, self._library_page_count() - 1)
+        self._render_library_page()
+
+    def _library_page_count(self):
+        return max(1, -(-len(self.library_data) // self.LIBRARY_PAGE_SIZE))
+
+    def step_library_page(self, direction):
+        page = self.library_page + direction
+        if 0 <= page < self._library_page_count():
+            self.library_page = page
+            self._render_library_page()
+
+    def _update_library_pager(self):
+        pages = self._library_page_count()
+        self.library_page_label.configure(text=self.t["lib_page"].format(self.library_page + 1, pages, len(self.library_data)))
+        self.library_prev_btn.configure(state="normal" if self.library_page > 0 else "disabled")
+        self.library_next_btn.configure(state="normal" if self.library_page < pages - 1 else "disabled")
+
+    def _render_library_page(self):
+        """Build cards for the current page only, so large libraries cost a page of widgets, not one per table"""
+        for w in self.library_frame.winfo_children(): w.destroy()
+        self._update_library_pager()
+        start = self.library_page * self.LIBRARY_PAGE_SIZE
+        try: self.library_frame._parent_canvas.yview_moveto(0)
+        except: pass
+
+        for row in self.library_data[start:start + self.LIBRARY_PAGE_SIZE]:
+            card = ctk.CTkFrame(self.library_frame)
+            card.pack(fill="x", pady=5, padx=5)
+            
+            # Left: ID and Packages
+            title = f"{row.arxiv_id} | {row.package_count} Pkgs"
+            ctk.CTkLabel(card, text=title, font=("Arial", 12, "bold"), text_color=self.text_color_primary).pack(side="left", padx=10)
+            
+            # Middle: Note (already truncated by get_library_rows)
+            if row.note_preview:
+                ctk.CTkLabel(card, text=row.note_preview, text_color="gray", font=("Arial", 11)).pack(side="left", padx=10)
+
+            # Right: Buttons
+            ctk.CTkButton(card, text=self.t["lib_view"], width=60, 
+                          command=lambda r=row: self.load_detail(r)).pack(side="right", padx=10, pady=10)
+            ctk.CTkButton(card, text=self.t["lib_del"], width=50, fg_color="#C0392B", 
+                          command=lambda rid=row.id: self.delete_item(rid)).pack(side="right", padx=5)
+
+    def load_detail(self, row):
+        """Open a LibraryRow in the Inspector; its code, packages, note and image name are read on a worker"""
+        tid = row.id
+        self.current_table_id = tid
+        
+        # Update current index
+        for i, r in enumerate(self.library_data):
+            if r.id == tid:
+                self.current_index = i
+                break
+        # Keep the Library tab on the page of the row shown (arrow keys can cross pages)
+        page = max(self.current_index, 0) // self.LIBRARY_PAGE_SIZE
+        if page != self.library_page:
+            self.library_page = page
+            self._render_library_page()
+        
+        # Clean mode shows the stored cleaned variant (code and the PNG rendered from it)
+        cleaned = self.clean_mode_var.get()
+        self.tasks.submit(self.data_manager.get_table_detail, tid, cleaned, self._clean_char(),
+                          on_done=lambda detail, t=tid, c=cleaned: self._show_detail(t, detail, c))
+        self.tabview.set("Inspector")
+
+    def _clean_char(self):
+        return " " if self.clean_char_var.get() == "SPACE" else "-"
+
+    def _show_detail(self, tid, detail, cleaned=False):
+        if tid != self.current_table_id or detail is None:
+            return  # User moved on, or the row was deleted meanwhile
+        code, pkgs, note, img_file = detail
+        code, note = code or "", note or ""
+        self.current_packages_str = pkgs
+        
+        self.code_editor.delete("0.0", "end")
+        self.code_editor.insert("0.0", code)
+        self.note_editor.delete("0.0", "end")
+        self.note_editor.insert("0.0", note)
+
+        for w in self.packages_frame.winfo_children(): w.destroy()
+        if pkgs:
+            r, c = 0, 0
+            for pkg in pkgs.split(','):
+                btn = ctk.CTkButton(self.packages_frame, text=pkg.strip(), width=60, height=24, fg_color="#2980B9", hover=False)
+                btn.grid(row=r, column=c, padx=2, pady=2)
+                c += 1
+                if c > 3: c, r = 0, r + 1
+
+        # Cached preview renders instantly; otherwise decode + resize the 300-DPI PNG off the main thread
+        key = (tid, cleaned) + self.PREVIEW_SIZE
+        entry = self.preview_cache.get(key)
+        if entry is not None:
+            self._show_preview(tid, entry)
+            return
+        # A prefetch still queued behind others is dropped and decoded right away; one already running is awaited
+        self.preview_cache.cancel_queued(key)
+        if not self.preview_cache.claim(key):
+            if not self.preview_cache.wait(key, lambda e, t=tid: self._show_preview(t, e)):
+                self._show_preview(tid, self.preview_cache.get(key))  # landed meanwhile
+        else:
+            full_img_path = os.path.join(self.data_manager.img_dir, img_file or "")
+            self.tasks.submit(self._decode_preview, full_img_path, *self.PREVIEW_SIZE,
+                              on_done=lambda img, k=key: self._show_preview(k[0], self.preview_cache.put(k, img)),
+                              on_error=lambda e, k=key: self._show_preview(k[0], self.preview_cache.put(k, None)))
+
+    def reload_detail(self):
+        """Redraw the inspector after the clean mode settings changed"""
+        if self.tabview.get() == "Inspector" and 0 <= self.current_index < len(self.library_data):
+            self.load_detail(self.library_data[self.current_index])
+
+    def _decode_preview(self, full_img_path, max_w=600, max_h=800):
+        """Worker side: return a PIL image already scaled to the preview size, or None"""
+        if not os.path.exists(full_img_path):
+            return None
+        with Image.open(full_img_path) as pil_img:
+            ratio = min(max_w/pil_img.width, max_h/pil_img.height, 1.0)
+            size = (max(1, int(pil_img.width*ratio)), max(1, int(pil_img.height*ratio)))
+            return pil_img.resize(size, Image.LANCZOS) if ratio < 1.0 else pil_img.copy()
+
+    def _decode_row_preview(self, tid, cleaned=False, max_w=600, max_h=800):
+        """Worker side: look up the row's image file, then decode it like _decode_preview"""
+        img_file = self.data_manager.get_image_filename(tid, cleaned)
+        if not img_file:
+            return None
+        return self._decode_preview(os.path.join(self.data_manager.img_dir, img_file), max_w, max_h)
+
+    def _show_preview(self, tid, entry):
+        if tid != self.current_table_id:
+            return  # User already moved on to another row
+        if entry['pil'] is None:
+            self.img_preview.configure(image=None, text=self.t["preview_lost"])
+        else:
+            if entry['ctk'] is None:
+                entry['ctk'] = ctk.CTkImage(entry['pil'], size=entry['pil'].size)
+            self.img_preview.configure(image=entry['ctk'], text="")
+        self._prefetch_neighbors()
+
+    def _prefetch_neighbors(self):
+        """Decode the next/previous PREFETCH_ROWS previews into the cache in the background"""
+        if self.current_index < 0 or not self.data_manager.cursor:
+            return
+        cleaned = self.clean_mode_var.get()
+        for dist in range(1, self.PREFETCH_ROWS + 1):
+            for i in (self.current_index + dist, self.current_index - dist):
+                if not 0 <= i < len(self.library_data):
+                    continue
+                row = self.library_data[i]
+                key = (row.id, cleaned) + self.PREVIEW_SIZE
+                if not self.preview_cache.claim(key):
+                    continue
+                future = self.tasks.submit(self._decode_row_preview, row.id, cleaned, *self.PREVIEW_SIZE,
+                                           on_done=lambda img, k=key: self.preview_cache.put(k, img),
+                                           on_error=lambda e, k=key: self.preview_cache.put(k, None),
+                                           background=True)
+                self.preview_cache.track(key, future)
+
+    def navigate_inspector(self, direction):
+        """Arrow key pagination: direction=-1 prev, direction=1 next"""
+        if not self.library_data or self.current_index < 0:
+            return
+        # Only active when Inspector tab is active
+        try:
+            if self.tabview.get() != "Inspector":
+                return
+        except: return
+        
+        new_index = self.current_index + direction
+        if 0 <= new_index < len(self.library_data):
+            self.load_detail(self.library_data[new_index])
+
+    def copy_packages(self):
+        if not self.current_packages_str: return
+        cmds = "\n".join([f"\\usepackage{{{p.strip()}}}" for p in self.current_packages_str.split(',')])
+        self.clipboard_clear()
+        self.clipboard_append(cmds)
+        messagebox.showinfo(self.t["copy_success_title"], cmds)
+
+    def save_current_note(self):
+        if self.current_table_id:
+            note = self.note_editor.get("0.0", "end").strip()
+            self.tasks.submit(self.data_manager.update_note, self.current_table_id, note,
+                              on_done=lambda _: self.refresh_library())
+
+    def delete_item(self, tid):
+        if messagebox.askyesno(self.t["title"], self.t["confirm_del"]):
+            self.preview_cache.discard(tid)
+            self.tasks.submit(self.data_manager.delete_table, tid,
+                              on_done=lambda _: self.refresh_library())
+
+
+def _import_core():
+    import main
+    return main
+
+def run(core=None):
+    """Open the window and run the Tk main loop; core is the loaded main module (imported if omitted)"""
+    app = App(core)
+    app.mainloop()
@@ -4,37 +4,835 @@ import json
 import sqlite3
 import tarfile
 import io
-import requests
 import subprocess
 import threading
 import datetime
 import shutil
-from PIL import Image
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
-import fitz  # PyMuPDF
+import uuid
+import collections
+import abc
+import time
+import functools
+import contextlib
+import re
+import struct
+import hashlib
+# Heavy dependencies (requests, PyMuPDF, the Tk/PIL UI in gui.py) are imported where first used
 
 # --- Global Configuration ---
 
-ctk.set_appearance_mode("Light")
-ctk.set_default_color_theme("blue")
-
 def get_resource_path(relative_path):
     """Get absolute resource path, compatible with dev env and PyInstaller."""
     if hasattr(sys, '_MEIPASS'):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
-TECTONIC_PATH = get_resource_path("tectonic.exe")
+TECTONIC_PATH = get_resource_path("tectonic.exe" if os.name == "nt" else "tectonic")
 CONFIG_FILE = "app_config.json"
 
+# --- Instrumentation ---
+class Metrics:
+    """Lightweight per-run stage timings and counters.
+
+    A run is opened with start_run(); every timer()/incr() call made afterwards
+    from the same thread is attached to it. Runs are per thread, so parallel
+    pipelines keep their own; helper threads join one with attach().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_run(self, label):
+        run = {
+            'run_id': f"{label}@{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}",
+            'label': label,
+            'started_at': datetime.datetime.now().isoformat(),
+            'finished_at': None,
+            'events': [],
+            'counters': {},
+        }
+        self._local.run = run
+        return run
+
+    def end_run(self):
+        run = self._current()
+        if run is not None:
+            run['finished_at'] = datetime.datetime.now().isoformat()
+            self._local.run = None
+        return run
+
+    def _current(self):
+        return getattr(self._local, 'run', None)
+
+    def current_run(self):
+        return self._current()
+
+    def attach(self, run):
+        """Record the calling helper thread's timings and counters in a run opened on another thread"""
+        self._local.run = run
+
+    @contextlib.contextmanager
+    def timer(self, stage, **extra):
+        """Time a block; the yielded dict can be filled with extra fields (tokens, bytes...)"""
+        event = dict(extra)
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield event
+            ok = True
+        finally:
+            event.update(stage=stage, seconds=time.perf_counter() - start, ok=ok)
+            run = self._current()
+            if run is not None:
+                with self.lock:
+                    run['events'].append(event)
+
+    def incr(self, name, n=1):
+        run = self._current()
+        if run is None: return
+        with self.lock:
+            run['counters'][name] = run['counters'].get(name, 0) + n
+
+METRICS = Metrics()
+
+def timed(stage):
+    """Decorator recording the wrapped call's duration under `stage`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Table Fingerprints ---
+MINHASH_PERMS = 64
+MINHASH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.8 Jaccard almost always share a bucket
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_COEFFS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], "big") % _MINHASH_PRIME or 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], "big") % _MINHASH_PRIME)
+    for i in range(MINHASH_PERMS)
+]
+
+def normalize_latex(code):
+    """Whitespace/comment-insensitive form of a table: body only, comments dropped, spacing collapsed"""
+    m = re.search(r'\\begin\{document\}(.*?)\\end\{document\}', code, re.DOTALL)
+    body = m.group(1) if m else code
+    body = re.sub(r'(?<!\\)%.*', '', body)
+    body = re.sub(r'\s+', ' ', body)
+    body = re.sub(r' ?([&{}\[\]]) ?', r'\1', body)
+    body = re.sub(r' ?(\\\\) ?', r'\1', body)
+    return body.strip()
+
+def latex_fingerprint(code):
+    return hashlib.sha1(normalize_latex(code).encode("utf-8")).hexdigest()
+
+def minhash_signature(code, k=5):
+    """MinHash over k-token shingles of the normalized table"""
+    tokens = re.findall(r'\\[A-Za-z]+|[A-Za-z0-9.]+|[^\sA-Za-z0-9]', normalize_latex(code))
+    shingles = {" ".join(tokens[i:i + k]) for i in range(max(1, len(tokens) - k + 1))}
+    base = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles]
+    return [min((a * h + b) % _MINHASH_PRIME for h in base) & 0xFFFFFFFF for a, b in _MINHASH_COEFFS]
+
+def minhash_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / float(len(sig_a))
+
+def minhash_bands(sig):
+    rows = len(sig) // MINHASH_BANDS
+    return [(b, hashlib.md5(struct.pack(f"{rows}I", *sig[b * rows:(b + 1) * rows])).hexdigest()[:16])
+            for b in range(MINHASH_BANDS)]
+
+def arxiv_base_id(doc_id):
+    """'2301.01234v2' -> '2301.01234'; local documents are returned unchanged"""
+    m = re.match(r'^(.+?)v\d+$', doc_id or "")
+    return m.group(1) if m and not doc_id.startswith("Local_") else doc_id
+
+# --- Table Structure ---
+TABULAR_ENVS = ('tabular', 'tabular*', 'tabularx', 'tabulary', 'longtable', 'longtable*', 'array', 'supertabular')
+_WIDTH_ARG_ENVS = ('tabular*', 'tabularx', 'tabulary')
+_ROW_COMMANDS = ('hline', 'toprule', 'midrule', 'bottomrule', 'cline', 'cmidrule', 'addlinespace', 'specialrule',
+                 'hhline', 'morecmidrules', 'hdashline', 'cdashline', 'rowcolor', 'endhead', 'endfirsthead',
+                 'endfoot', 'endlastfoot', 'noalign', 'Xhline', 'caption', 'label')
+_ROW_COMMAND_RE = re.compile(r'\s*(?:%[^\n]*\n\s*)*\\(' + '|'.join(sorted(_ROW_COMMANDS, key=len, reverse=True)) + r')(?![A-Za-z])\*?')
+_TEXT_SYMBOLS = {
+    '\\pm': '±', '\\mp': '∓', '\\%': '%', '\\&': '&', '\\_': '_', '\\#': '#', '\\times': '×', '\\cdot': '·',
+    '\\approx': '≈', '\\sim': '~', '\\ldots': '…', '\\dots': '…', '\\checkmark': '✓', '\\cmark': '✓',
+    '\\xmark': '✗', '\\uparrow': '↑', '\\downarrow': '↓', '\\leq': '≤', '\\geq': '≥', '\\le': '≤', '\\ge': '≥',
+}
+_TEXT_COMMENT_RE = re.compile(r'(?<!\\)%.*')
+# Commands whose arguments are not cell content (colours, spacing, references)
+_TEXT_DROP_RE = re.compile(r'\\(?:cellcolor|rowcolor|columncolor|color|textcolor|hspace|vspace|rule|phantom|hphantom'
+                           r'|vphantom|label|ref|eqref|cite[A-Za-z]*)\*?\s*(?:\[[^\]]*\])?\s*\{[^}]*\}')
+_TEXT_SYMBOL_RE = re.compile(r'\\\\|(?:' + '|'.join(re.escape(m) for m in sorted(_TEXT_SYMBOLS, key=len, reverse=True))
+                             + r')(?![A-Za-z])')
+_TEXT_COMMAND_RE = re.compile(r'\\[A-Za-z@]+\*?\s*(?:\[[^\]]*\])?')
+_TEXT_STRIP_RE = re.compile(r'[{}$]')
+_NUMBER_RE = re.compile(r'^([+\-−]?)\s*(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)\s*(%?)')
+_NUMBER_TAIL_RE = re.compile(r'[\s±∓()\[\]\d.,%+\-−/*†‡↑↓]*')
+_NUMBER_RANGE_RE = re.compile(r'\s*[\-−]\s*\d')  # '3-5', '10 − 20': a range, not a value
+
+def _read_group(s, i, open_ch='{', close_ch='}'):
+    """(content, start, end) of the balanced group starting at s[i] (whitespace skipped), or None"""
+    while i < len(s) and s[i] in ' \t\n':
+        i += 1
+    if i >= len(s) or s[i] != open_ch:
+        return None
+    depth, j = 0, i
+    while j < len(s):
+        c = s[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == open_ch:
+            depth += 1
+        elif c == close_ch:
+            depth -= 1
+            if depth == 0:
+                return s[i + 1:j], i + 1, j + 1
+        j += 1
+    return None
+
+def _skip_args(s, i, spec):
+    """Skip arguments after a command: spec is a string of 'o' (optional [..] or (..)) and 'm' (mandatory {..})"""
+    for kind in spec:
+        if kind == 'o':
+            while True:
+                g = _read_group(s, i, '[', ']') or _read_group(s, i, '(', ')')
+                if not g: break
+                i = g[2]
+        else:
+            g = _read_group(s, i)
+            if not g: break
+            i = g[2]
+    return i
+
+def count_columns(spec):
+    """Number of columns a tabular preamble defines (handles *{n}{..}, p{..}, @{..}, >{..}, S[..], custom letters)"""
+    n, i = 0, 0
+    while i < len(spec):
+        c = spec[i]
+        if c in ' \t\n|:':
+            i += 1
+        elif c in '@!><':
+            i = _skip_args(spec, i + 1, 'm')
+        elif c == '*':
+            rep = _read_group(spec, i + 1)
+            sub = rep and _read_group(spec, rep[2])
+            if not sub: return n
+            try: n += int(rep[0].strip()) * count_columns(sub[0])
+            except ValueError: pass
+            i = sub[2]
+        elif c == '{':
+            g = _read_group(spec, i)
+            i = g[2] if g else i + 1
+        elif c == '\\':
+            m = re.match(r'\\[A-Za-z@]+', spec[i:])
+            i += len(m.group(0)) if m else 2
+        elif c in 'pmbwW':
+            n += 1
+            i = _skip_args(spec, i + 1, 'mm' if c in 'wW' else 'm')
+        else:  # l c r X S and \newcolumntype letters
+            n += 1
+            i = _skip_args(spec, i + 1, 'o')
+    return n
+
+def _split_rows(code, start, end):
+    """Spans of rows and cells: [[(cell_start, cell_end), ...], ...] split at top-level \\\\ and &"""
+    rows, cells, cell_start = [], [], start
+    depth = env_depth = 0
+    i = start
+    while i < end:
+        c = code[i]
+        if c == '\\':
+            if depth == 0 and env_depth == 0 and (code.startswith('\\\\', i) or code.startswith('\\tabularnewline', i)):
+                cells.append((cell_start, i))
+                rows.append(cells)
+                cells = []
+                i += 2 if code.startswith('\\\\', i) else len('\\tabularnewline')
+                i = _skip_args(code, i + 1 if code.startswith('*', i) else i, 'o')
+                cell_start = i
+                continue
+            m = re.match(r'\\(begin|end)\s*\{[^}]*\}', code[i:i + 80])
+            if m:
+                env_depth += 1 if m.group(1) == 'begin' else -1
+                i += len(m.group(0))
+                continue
+            i += 2
+            continue
+        if c == '%':
+            nl = code.find('\n', i)
+            i = end if nl < 0 or nl > end else nl
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+        elif c == '&' and depth == 0 and env_depth == 0:
+            cells.append((cell_start, i))
+            cell_start = i + 1
+        i += 1
+    cells.append((cell_start, end))
+    rows.append(cells)
+    return rows
+
+def _strip_span(code, s, e):
+    while s < e and code[s] in ' \t\n': s += 1
+    while e > s and code[e - 1] in ' \t\n': e -= 1
+    return s, e
+
+def _parse_cell(code, s, e):
+    """Cell dict: text, colspan, rowspan, span (source offsets of the innermost content)"""
+    s, e = _strip_span(code, s, e)
+    colspan = rowspan = 1
+    align = None
+    while True:
+        head = code[s:e]
+        m = re.match(r'\\multicolumn(?![A-Za-z])', head)
+        if m:
+            n = _read_group(code, s + m.end())
+            spec = n and _read_group(code, n[2])
+            body = spec and _read_group(code, spec[2])
+            if not body: break
+            try: colspan = int(n[0].strip())
+            except ValueError: pass
+            align = spec[0].strip()
+            s, e = _strip_span(code, body[1], body[2] - 1)
+            continue
+        m = re.match(r'\\multirow(?![A-Za-z])', head)
+        if m:
+            i = _skip_args(code, s + m.end(), 'o')
+            n = _read_group(code, i)
+            width = n and _read_group(code, _skip_args(code, n[2], 'o'))
+            body = width and _read_group(code, _skip_args(code, width[2], 'o'))
+            if not body: break
+            try: rowspan = abs(int(n[0].strip()))
+            except ValueError: pass
+            s, e = _strip_span(code, body[1], body[2] - 1)
+            continue
+        break
+    return {'text': code[s:e], 'colspan': colspan, 'rowspan': rowspan, 'align': align, 'span': (s, e)}
+
+def _scan_tabulars(code):
+    """Every top-level tabular-like environment of code with its rows, cells and rules (source offsets kept)"""
+    results = []
+    env_alt = '|'.join(re.escape(env) for env in TABULAR_ENVS)
+    pos = 0
+    begin_re = re.compile(r'\\begin\s*\{(' + env_alt + r')\}')
+    while True:
+        m = begin_re.search(code, pos)
+        if not m: break
+        env = m.group(1)
+        i = m.end()
+        if env in _WIDTH_ARG_ENVS:
+            i = _skip_args(code, i, 'm')
+        i = _skip_args(code, i, 'o')
+        spec = _read_group(code, i)
+        if not spec:
+            pos = m.end()
+            continue
+        # matching \end, allowing the same environment nested in a cell
+        depth, j, body_end = 1, spec[2], None
+        tag_re = re.compile(r'\\(begin|end)\s*\{' + re.escape(env) + r'\}')
+        for t in tag_re.finditer(code, spec[2]):
+            depth += 1 if t.group(1) == 'begin' else -1
+            if depth == 0:
+                body_end, j = t.start(), t.end()
+                break
+        if body_end is None:
+            break
+        rows = []
+        for cell_spans in _split_rows(code, spec[2], body_end):
+            # leading rules / row-level commands belong to this row (they follow the previous \\)
+            first_s, first_e = cell_spans[0]
+            rules, k = [], first_s
+            while True:
+                rm = _ROW_COMMAND_RE.match(code, k, first_e)
+                if not rm: break
+                name = rm.group(1)
+                arg_end = _skip_args(code, rm.end(), 'om' if name in ('cline', 'cmidrule', 'rowcolor', 'hhline', 'caption', 'label', 'specialrule', 'Xhline') else 'o')
+                if name == 'specialrule':
+                    arg_end = _skip_args(code, arg_end, 'mm')
+                rules.append(code[rm.start(1) - 1:arg_end].strip())
+                k = arg_end
+            cell_spans = [(k, first_e)] + cell_spans[1:]
+            cells = [_parse_cell(code, s, e) for s, e in cell_spans]
+            empty = len(cells) == 1 and not cells[0]['text']
+            rows.append({'rules': rules, 'cells': [] if empty else cells})
+        results.append({'env': env, 'spec': spec[0], 'ncols': count_columns(spec[0]), 'rows': rows,
+                        'span': (m.start(), j)})
+        pos = j
+    return results
+
+def latex_to_text(s):
+    """Readable text of a cell: formatting commands dropped, common symbols mapped, braces and $ removed"""
+    s = _TEXT_COMMENT_RE.sub('', s)
+    s = _TEXT_DROP_RE.sub('', s)
+    s = _TEXT_SYMBOL_RE.sub(lambda m: _TEXT_SYMBOLS.get(m.group(0), ' '), s)
+    s = _TEXT_COMMAND_RE.sub(' ', s)
+    s = _TEXT_STRIP_RE.sub('', s).replace('~', ' ')
+    return ' '.join(s.split())
+
+def parse_number(text):
+    """Numeric value of a cell's readable text ('71.2±0.3' -> 71.2, '12.5%' -> 12.5, '1,024' -> 1024), else None"""
+    m = _NUMBER_RE.match(text.strip())
+    tail = text.strip()[m.end():] if m else ""
+    if not m or not _NUMBER_TAIL_RE.fullmatch(tail) or _NUMBER_RANGE_RE.match(tail):
+        return None
+    value = float(m.group(2).replace(',', ''))
+    return -value if m.group(1) in ('-', '−') else value
+
+
+class TableGrid:
+    """Cell grid of one tabular.
+
+    rows holds the LaTeX source of each cell as (text, colspan, rowspan); a
+    \\multirow cell is stored in its top row and the rows below keep the empty
+    placeholder cell the source has there. header_rows counts the leading
+    header rows (up to the first \\midrule/\\hline/\\endhead after row 0).
+    """
+
+    def __init__(self, rows, ncols, header_rows=0, env="tabular"):
+        self.rows = rows
+        self.ncols = ncols
+        self.header_rows = header_rows
+        self.env = env
+
+    @classmethod
+    def from_scan(cls, scanned):
+        rows, header_rows = [], None
+        for r in scanned['rows']:
+            if any(rule.startswith(('\\endhead', '\\endfirsthead')) for rule in r['rules']) and header_rows is None:
+                header_rows = len(rows)
+            if not r['cells']:
+                continue
+            if rows and header_rows is None and any(
+                    rule.startswith(('\\midrule', '\\hline', '\\Xhline', '\\specialrule')) for rule in r['rules']):
+                header_rows = len(rows)
+            if any(rule.startswith('\\caption') for rule in r['rules']) and len(r['cells']) == 1:
+                continue  # longtable caption row
+            rows.append([(c['text'], c['colspan'], c['rowspan']) for c in r['cells']])
+        if header_rows is None or header_rows > max(4, len(rows) // 2):
+            first = rows[0] if rows else []
+            header_rows = 1 if len(rows) > 1 and not any(parse_number(latex_to_text(t)) is not None for t, _, _ in first) else 0
+        width = max([scanned['ncols']] + [sum(c[1] for c in row) for row in rows])
+        return cls(rows, width, header_rows, scanned['env'])
+
+    def to_json(self):
+        """Compact form: a cell is its text, or [text, colspan, rowspan] when it spans"""
+        return {'env': self.env, 'ncols': self.ncols, 'header_rows': self.header_rows,
+                'rows': [[t if cs == 1 and rs == 1 else [t, cs, rs] for t, cs, rs in row] for row in self.rows]}
+
+    @classmethod
+    def from_json(cls, data):
+        rows = [[(c, 1, 1) if isinstance(c, str) else tuple(c) for c in row] for row in data['rows']]
+        return cls(rows, data['ncols'], data['header_rows'], data.get('env', 'tabular'))
+
+    def cells(self):
+        """Yield (row, first column, text, colspan, rowspan)"""
+        for r, row in enumerate(self.rows):
+            col = 0
+            for text, colspan, rowspan in row:
+                yield r, col, text, colspan, rowspan
+                col += colspan
+
+    def column_headers(self):
+        """One readable header per column, multi-row headers joined with ' / '"""
+        parts = [[] for _ in range(self.ncols)]
+        for r, col, text, colspan, rowspan in self.cells():
+            if r >= self.header_rows:
+                break
+            label = latex_to_text(text)
+            for c in range(col, min(col + colspan, self.ncols)):
+                if label and label not in parts[c]:
+                    parts[c].append(label)
+        return [" / ".join(p) for p in parts]
+
+    def numeric_cells(self):
+        """[(row, col, column header, value)] for body cells holding a number"""
+        headers = self.column_headers()
+        out = []
+        for r, col, text, colspan, rowspan in self.cells():
+            if r < self.header_rows:
+                continue
+            value = parse_number(latex_to_text(text))
+            if value is not None:
+                out.append((r, col, headers[col] if col < len(headers) else "", value))
+        return out
+
+    def column(self, header):
+        """Numeric values of the first column whose header contains header (case-insensitive)"""
+        headers = [h.lower() for h in self.column_headers()]
+        matches = [c for c, h in enumerate(headers) if header.lower() in h]
+        if not matches:
+            return []
+        return [(r, v) for r, c, _, v in self.numeric_cells() if c == matches[0]]
+
+def parse_table_grids(code):
+    """TableGrid for every tabular-like environment in code (empty list if none parse)"""
+    grids = []
+    for scanned in _scan_tabulars(code):
+        grid = TableGrid.from_scan(scanned)
+        if grid.rows:
+            grids.append(grid)
+    return grids
+
+_CLEAN_PROTECTED_RE = re.compile(
+    r'\\(?:cellcolor|rowcolor|columncolor|color|textcolor|hspace|vspace|rule|raisebox|phantom|hphantom|vphantom'
+    r'|label|ref|eqref|cite[A-Za-z]*|includegraphics|resizebox|scalebox|setlength|arraystretch|fontsize'
+    r'|tnote|footnotemark)\*?'
+    r'(?:\s*\[[^\]]*\])*(?:\s*\{[^{}]*\})?')
+# Every digit run (with its decimals), plus a leading sign that is not part of a word ("e-3")
+_CLEAN_NUMBER_RE = re.compile(r'(?:(?<![\w\\.])[+\-])?(?:\d+(?:[.,]\d+)*|\.\d+)')
+# Readable text of a value cell parse_number rejects: '1.2e-3', '3.1M', '29.0_±0.1', '↑ 3.2'
+_CLEAN_VALUE_RE = re.compile(r'([↑↓]?\s*[+\-−]?\s*(?:\d+(?:[.,]\d+)*|\.\d+)(?:[eE][+\-−]?\d+)?\s*[KMBGkx×]?)'
+                             r'([\s±∓()\[\]\d.,%+\-−/*†‡↑↓^_]*)')
+
+def _is_value_cell(text):
+    """True if the readable text of a cell is a value (with its ± / subscript / unit decoration), not a label"""
+    readable = latex_to_text(text)
+    if parse_number(readable) is not None:
+        return True
+    m = _CLEAN_VALUE_RE.fullmatch(readable)
+    return bool(m) and not _NUMBER_RANGE_RE.match(m.group(2))
+
+def clean_table_code(code, clean_char="-"):
+    """Replace the numbers of the body value cells with clean_char.
+
+    Deterministic replacement for asking the LLM to blank values: header rows,
+    captions, math delimiters and markup are kept verbatim, and so are label
+    cells ('ResNet-50', 'GPT-4 (175B)', 'Avg 3'). In a cell whose readable text
+    is a value every digit run changes, whatever surrounds it
+    ('\\textbf{71.2}$\\pm$0.3' -> '\\textbf{-}$\\pm$-', '$29.0_{\\pm0.1}$' -> '$-_{\\pm-}$',
+    '3.1M' -> '-M'). Numbers inside colour/spacing/reference arguments are left alone.
+    """
+    edits = []
+    for scanned in _scan_tabulars(code):
+        header_rows = TableGrid.from_scan(scanned).header_rows
+        row_no = 0
+        for row in scanned['rows']:
+            if not row['cells'] or (any(rule.startswith('\\caption') for rule in row['rules']) and len(row['cells']) == 1):
+                continue
+            row_no += 1
+            if row_no <= header_rows:
+                continue
+            for cell in row['cells']:
+                if not _is_value_cell(cell['text']):
+                    continue
+                start, _ = cell['span']
+                protected = [m.span() for m in _CLEAN_PROTECTED_RE.finditer(cell['text'])]
+                for m in _CLEAN_NUMBER_RE.finditer(cell['text']):
+                    if not any(a <= m.start() < b for a, b in protected):
+                        edits.append((start + m.start(), start + m.end()))
+    for a, b in sorted(edits, reverse=True):
+        code = code[:a] + clean_char + code[b:]
+    return code
+
+# --- Compile Backends ---
+class CompileBackend(abc.ABC):
+    """A TeX engine that turns temp_x.tex into temp_x.pdf (and temp_x.log) in the cwd.
+
+    Subclasses provide command(); run() may be overridden for engines that need
+    more than one command. Capability attributes tell CoreLogic what to expect:
+    fetches_packages - missing packages are downloaded on demand, so any name may work
+    unicode_input    - raw UTF-8 text compiles without inputenc/fontspec tricks
+    """
+    name = "base"
+    executables = ()  # all must be on PATH for detect()
+    fetches_packages = False
+    unicode_input = False
+    aux_extensions = ()  # side files removed after each compile
+
+    def __init__(self, executable=None):
+        self.executable = executable or self.detect()
+        self._package_cache = {}
+        self._missing = set()  # reported "not found" by a compile in this session
+        self.index_path = None
+        self.package_index = None  # PackageIndex once loaded, see use_package_index
+        self._index_lock = threading.Lock()
+
+    def use_package_index(self, path):
+        """Answer has_package from the index cached at path (built on first use)"""
+        self.index_path = path
+
+    @classmethod
+    def detect(cls):
+        """Path of the main executable if the engine is installed, else None"""
+        paths = [shutil.which(exe) for exe in cls.executables]
+        return paths[0] if paths and all(paths) else None
+
+    def available(self):
+        return self.executable is not None
+
+    @abc.abstractmethod
+    def command(self, tex_file):
+        """Argument list compiling tex_file in the cwd"""
+
+    def run(self, tex_file, runner):
+        """Compile tex_file; runner(cmd) executes a command under the compile limits"""
+        return runner(self.command(tex_file))
+
+    def cleanup(self, stem):
+        for ext in self.aux_extensions:
+            try: os.remove(stem + ext)
+            except OSError: pass
+
+    def has_package(self, name):
+        """Whether \\usepackage{name} can load; True when unknown"""
+        if name in self._missing:
+            return False
+        index = self._load_index()
+        if index is not None:
+            return name in index
+        if self.fetches_packages:
+            return True
+        if name not in self._package_cache:
+            self._package_cache[name] = self._kpsewhich(name + ".sty")
+        return self._package_cache[name]
+
+    def mark_missing(self, name):
+        self._missing.add(name)
+
+    def list_packages(self):
+        """Every loadable package name, or None if the engine cannot enumerate them"""
+        return None
+
+    def _load_index(self):
+        if self.index_path is None or not self.available():
+            return None
+        with self._index_lock:
+            if self.package_index is None:
+                self.package_index = PackageIndex.load_or_build(self, self.index_path)
+                self.index_path = self.index_path if self.package_index else None  # unbuildable: stop trying
+            return self.package_index
+
+    @staticmethod
+    def _kpsewhich(filename):
+        kpsewhich = shutil.which("kpsewhich")
+        if not kpsewhich:
+            return True
+        try:
+            out = subprocess.run([kpsewhich, filename], capture_output=True, timeout=10).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return True
+        return bool(out.strip())
+
+    def capabilities(self):
+        return {'name': self.name, 'executable': self.executable, 'available': self.available(),
+                'fetches_packages': self.fetches_packages, 'unicode_input': self.unicode_input}
+
+
+class TectonicBackend(CompileBackend):
+    """Tectonic (XeTeX based), bundled next to the app or found on PATH"""
+    name = "tectonic"
+    executables = ("tectonic",)
+    fetches_packages = True
+    unicode_input = True
+
+    @classmethod
+    def detect(cls):
+        if os.path.exists(TECTONIC_PATH):
+            return TECTONIC_PATH
+        return super().detect()
+
+    def command(self, tex_file):
+        return [self.executable, "--keep-logs", tex_file]
+
+    def list_packages(self):
+        """Package names from the bundle manifest (-X bundle search lists every file in the bundle)"""
+        try:
+            result = subprocess.run([self.executable, "-X", "bundle", "search"], capture_output=True, timeout=300)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        names = result.stdout.decode("utf-8", errors="ignore").split()
+        return {n[:-4] for n in names if n.endswith(".sty")} or None
+
+
+class LatexmkBackend(CompileBackend):
+    """pdflatex driven by latexmk from a local TeX Live / MiKTeX install"""
+    name = "latexmk"
+    executables = ("latexmk", "pdflatex")
+    aux_extensions = (".aux", ".fls", ".fdb_latexmk", ".out")
+
+    def command(self, tex_file):
+        return [self.executable, "-pdf", "-interaction=nonstopmode", "-halt-on-error", tex_file]
+
+    def list_packages(self):
+        """Package names from the ls-R databases of the TeX tree (walks the tree if they are missing)"""
+        kpsewhich = shutil.which("kpsewhich")
+        if not kpsewhich:
+            return None
+        try:
+            dbs = subprocess.run([kpsewhich, "-var-value=TEXMFDBS"], capture_output=True, timeout=30).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        roots = [r.strip().lstrip("!") for r in re.split(r"[,{}" + re.escape(os.pathsep) + r"]", dbs.decode(errors="ignore"))]
+        packages = set()
+        for root in filter(os.path.isdir, roots):
+            ls_r = os.path.join(root, "ls-R")
+            if os.path.exists(ls_r):
+                with open(ls_r, "r", encoding="utf-8", errors="ignore") as f:
+                    packages.update(line[:-5] for line in f if line.endswith(".sty\n"))
+            else:
+                for _, _, files in os.walk(root):
+                    packages.update(n[:-4] for n in files if n.endswith(".sty"))
+        return packages or None
+
+
+class FakeBackend(CompileBackend):
+    """Engine stand-in for tests: writes a blank one-page PDF for every document.
+
+    Documents loading one of missing_packages fail with the same
+    "File `x.sty' not found" error a real engine reports.
+    """
+    name = "fake"
+
+    def __init__(self, missing_packages=()):
+        super().__init__(executable="fake")
+        self.missing_packages = set(missing_packages)
+
+    @classmethod
+    def detect(cls):
+        return None  # never picked by "auto"
+
+    def has_package(self, name):
+        return name not in self.missing_packages
+
+    def command(self, tex_file):
+        return [self.executable, tex_file]  # reported only: run() compiles in-process
+
+    def run(self, tex_file, runner):
+        cmd = self.command(tex_file)
+        stem = tex_file[:-4]
+        with open(tex_file, "r", encoding="utf-8") as f:
+            tex = f.read()
+        for pkg in re.findall(r'\\usepackage(?:\[[^\]]*\])?\{([^}]+)\}', tex):
+            if pkg in self.missing_packages:
+                with open(stem + ".log", "w", encoding="utf-8") as f:
+                    f.write(f"This is a fake TeX log\n! LaTeX Error: File `{pkg}.sty' not found.\n")
+                return subprocess.CompletedProcess(cmd, 1, b"",
+                                                   f"error: {tex_file}: ! LaTeX Error: File `{pkg}.sty' not found.".encode())
+        with open(stem + ".pdf", "wb") as f:
+            f.write(self.blank_pdf())
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    @staticmethod
+    def blank_pdf():
+        objs = [b"<< /Type /Catalog /Pages 2 0 R >>",
+                b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 72 36] >>"]
+        out, offsets = b"%PDF-1.4\n", []
+        for i, obj in enumerate(objs, 1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+        out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+        return out
+
+
+class PackageIndex:
+    """Set of package names one engine can load, cached on disk per backend.
+
+    The cache file holds {backend name: {executable, built_at, source, packages}};
+    an entry is rebuilt when the executable changes or it is older than max_age_days.
+    """
+
+    def __init__(self, packages, built_at=None):
+        self.packages = frozenset(packages)
+        self.built_at = built_at
+
+    def __contains__(self, name):
+        return name in self.packages
+
+    def __len__(self):
+        return len(self.packages)
+
+    @classmethod
+    def load_or_build(cls, backend, path, max_age_days=30, rebuild=False):
+        cache = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = {}
+        entry = cache.get(backend.name)
+        if entry and not rebuild and entry.get('executable') == backend.executable:
+            age = datetime.datetime.now() - datetime.datetime.fromisoformat(entry['built_at'])
+            if age.days < max_age_days:
+                return cls(entry['packages'], entry['built_at'])
+
+        print(f"[PKG-INDEX] Building package index for {backend.name}...")
+        packages = backend.list_packages()
+        if not packages:
+            print(f"[PKG-INDEX] {backend.name} cannot list its packages, checking them one by one instead")
+            return None
+        built_at = datetime.datetime.now().isoformat()
+        cache[backend.name] = {'executable': backend.executable, 'built_at': built_at,
+                               'packages': sorted(packages)}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            print(f"[PKG-INDEX] Could not cache index: {e}")
+        print(f"[PKG-INDEX] {len(packages)} packages indexed for {backend.name}")
+        return cls(packages, built_at)
+
+
+COMPILE_BACKENDS = {cls.name: cls for cls in (TectonicBackend, LatexmkBackend, FakeBackend)}
+AUTO_BACKEND_ORDER = ("tectonic", "latexmk")
+
+def package_index_path(config):
+    return os.path.join(config.get("storage_path") or ".", "package_index.json")
+
+def get_backend(name="auto"):
+    """Backend by config name; "auto" picks the first installed engine in AUTO_BACKEND_ORDER"""
+    if name and name != "auto":
+        if name not in COMPILE_BACKENDS:
+            raise ValueError(f"Unknown compile backend '{name}' (choose from auto, {', '.join(COMPILE_BACKENDS)})")
+        return COMPILE_BACKENDS[name]()
+    for candidate in AUTO_BACKEND_ORDER:
+        backend = COMPILE_BACKENDS[candidate]()
+        if backend.available():
+            return backend
+    return TectonicBackend()  # unavailable; compiles report engine_missing
+
 # --- 1. Data Manager ---
+def synchronized(method):
+    """Serialize DataManager methods: the shared cursor is used from UI workers and extraction threads"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class LibraryRow:
+    """Display fields of one library row; code, packages and image are fetched on demand (get_table_detail)"""
+    __slots__ = ('id', 'arxiv_id', 'package_count', 'note_preview')
+    NOTE_PREVIEW = 30
+
+    def __init__(self, table_id, arxiv_id, package_count, note_preview):
+        self.id = table_id
+        self.arxiv_id = arxiv_id
+        self.package_count = package_count
+        self.note_preview = note_preview
+
 class DataManager:
-    def __init__(self):
+    def __init__(self, config=None, open_db=True):
+        self.lock = threading.RLock()
         self.conn = None
         self.cursor = None
-        self.config = self.load_config()
-        self.init_db()
+        self._defer_commit = False  # set by the LibraryService writer while it batches calls
+        # An explicit config (headless runs, benchmarks) bypasses app_config.json
+        self.config = dict(config) if config is not None else self.load_config()
+        if open_db:  # the GUI opens it later, off the main thread
+            self.init_db()
 
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
@@ -47,15 +845,36 @@ class DataManager:
             "base_url": "https://api.openai.com/v1",
             "provider": "OpenAI",
             "model": "gpt-3.5-turbo",
-            "clean_char": "-"
+            "clean_char": "-",
+            "llm_fix_mode": "patch",
+            "dedup_mode": "link",
+            "dedup_threshold": 0.9,
+            "incremental_reextract": True,
+            "compile_backend": "auto",
+            "package_index": True,
+            "compile_timeout": 60,
+            "compile_memory_mb": 0,
+            "import_workers": 4,
+            "speculative_fixes": False,
+            "llm_routes": {},
+            "library_service": "",
+            "library_service_token": "",
+            **LLMPolicy.DEFAULTS
         }
 
+    @synchronized
     def save_config(self, new_config):
         self.config.update(new_config)
         with open(CONFIG_FILE, 'w') as f:
             json.dump(self.config, f, indent=4)
         self.init_db()
 
+    def _commit(self):
+        """Commit, unless a LibraryService writer is grouping several calls into one transaction"""
+        if not self._defer_commit:
+            self.conn.commit()
+
+    @synchronized
     def init_db(self):
         root = self.config["storage_path"]
         if not root: 
@@ -87,48 +906,1730 @@ class DataManager:
             self.cursor.execute("SELECT packages FROM tables LIMIT 1")
         except sqlite3.OperationalError:
             self.cursor.execute("ALTER TABLE tables ADD COLUMN packages TEXT")
-            self.conn.commit()
-        self.conn.commit()
+            self._commit()
+        # Dedup: exact fingerprint + MinHash signature per row, LSH buckets for near-duplicates
+        try:
+            self.cursor.execute("SELECT fingerprint, minhash FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN fingerprint TEXT")
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN minhash BLOB")
+            self._commit()
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_tables_fingerprint ON tables (fingerprint)")
+        # Fingerprint of the source span (\begin{table}...\end{table}) a row was extracted from
+        try:
+            self.cursor.execute("SELECT source_fingerprint FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN source_fingerprint TEXT")
+            self._commit()
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS minhash_bands (
+                band INTEGER,
+                bucket TEXT,
+                table_id INTEGER
+            )
+        ''')
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_minhash_bands ON minhash_bands (band, bucket)")
+        # Papers that reuse an existing row instead of storing their own copy
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                arxiv_id TEXT,
+                table_id INTEGER,
+                relation TEXT,
+                similarity REAL,
+                source_fingerprint TEXT,
+                created_at TEXT
+            )
+        ''')
+        try:
+            self.cursor.execute("SELECT source_fingerprint FROM table_links LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE table_links ADD COLUMN source_fingerprint TEXT")
+        self._commit()
+        self._backfill_fingerprints()
+        # Parsed cell grids (JSON list of TableGrid.to_json, one per tabular)
+        try:
+            self.cursor.execute("SELECT cells FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN cells TEXT")
+            self._commit()
+        self._backfill_cells()
+        # Values-blanked variant of latex_code (clean mode, see clean_table_code)
+        try:
+            self.cursor.execute("SELECT cleaned_code FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN cleaned_code TEXT")
+            self._commit()
+        # Hash of the rendered PDF page (CoreLogic._render_hash): equal hashes look identical
+        try:
+            self.cursor.execute("SELECT render_hash FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN render_hash TEXT")
+            self._commit()
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_tables_render_hash ON tables (render_hash)")
+        # PNG rendered from the cleaned document (clean mode), so no real value leaves the library in it
+        try:
+            self.cursor.execute("SELECT cleaned_image_filename FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN cleaned_image_filename TEXT")
+            self._commit()
+        # Full document that compiled to the stored image (after repairs), exported verbatim in bundles
+        try:
+            self.cursor.execute("SELECT compiled_tex FROM tables LIMIT 1")
+        except sqlite3.OperationalError:
+            self.cursor.execute("ALTER TABLE tables ADD COLUMN compiled_tex TEXT")
+            self._commit()
+        # Per-rule counters of the deterministic error fixer (cumulative across runs)
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fix_rule_stats (
+                rule TEXT PRIMARY KEY,
+                hits INTEGER DEFAULT 0,
+                successes INTEGER DEFAULT 0
+            )
+        ''')
+        # LLM fix outcomes per error class (cumulative), used by LLMPolicy to rank fixes
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_fix_stats (
+                error_class TEXT PRIMARY KEY,
+                attempts INTEGER DEFAULT 0,
+                successes INTEGER DEFAULT 0,
+                tokens INTEGER DEFAULT 0
+            )
+        ''')
+        # Calls per (stage, model) of the ModelRouter tiers (cumulative)
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_tier_stats (
+                stage TEXT,
+                model TEXT,
+                tier INTEGER,
+                calls INTEGER DEFAULT 0,
+                successes INTEGER DEFAULT 0,
+                seconds REAL DEFAULT 0,
+                tokens INTEGER DEFAULT 0,
+                PRIMARY KEY (stage, model)
+            )
+        ''')
+        # One row per compile attempt with the primary parsed diagnostic
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS compile_attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                arxiv_id TEXT,
+                table_index INTEGER,
+                attempt INTEGER,
+                stage TEXT,
+                success INTEGER,
+                error_class TEXT,
+                macro TEXT,
+                package TEXT,
+                tex_line INTEGER,
+                body_line INTEGER,
+                message TEXT,
+                diagnostics TEXT,
+                created_at TEXT
+            )
+        ''')
+        # Instrumentation: one row per extraction run, its timed events and counters
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metric_runs (
+                run_id TEXT PRIMARY KEY,
+                label TEXT,
+                started_at TEXT,
+                finished_at TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metric_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                stage TEXT,
+                seconds REAL,
+                ok INTEGER,
+                extra TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS metric_counters (
+                run_id TEXT,
+                name TEXT,
+                value INTEGER,
+                PRIMARY KEY (run_id, name)
+            )
+        ''')
+        # Job journal: extraction progress per paper so a crashed or closed run can be resumed
+        self.job_dir = os.path.join(root, "jobs")
+        if not os.path.exists(self.job_dir): os.makedirs(self.job_dir)
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT,
+                stage TEXT,
+                options TEXT,
+                tables_json TEXT,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_tables (
+                job_id INTEGER,
+                idx INTEGER,
+                status TEXT,
+                method TEXT,
+                table_id INTEGER,
+                PRIMARY KEY (job_id, idx)
+            )
+        ''')
+        self._commit()
+
+    # --- Job journal ---
+    # Stages: fetched (source saved) -> extracted (LLM table list saved) -> done.
+    # job_tables rows go pending -> done | failed | duplicate.
+    JOB_FINISHED_TABLE = ("done", "failed", "duplicate")
+
+    def _job_source_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.tex")
+
+    @synchronized
+    def create_job(self, doc_id, source, options):
+        """Journal a fetched paper; the source is kept on disk so resume never re-downloads"""
+        if not self.cursor: return None
+        now = datetime.datetime.now().isoformat()
+        self.cursor.execute('''
+            INSERT INTO jobs (doc_id, stage, options, tables_json, error, created_at, updated_at)
+            VALUES (?, 'fetched', ?, NULL, NULL, ?, ?)
+        ''', (doc_id, json.dumps(options), now, now))
+        job_id = self.cursor.lastrowid
+        with open(self._job_source_path(job_id), "w", encoding="utf-8") as f:
+            f.write(source)
+        self._commit()
+        return job_id
+
+    @synchronized
+    def job_extracted(self, job_id, tables, unchanged=0):
+        """Store the raw LLM table list and one pending status row per table"""
+        if not self.cursor or job_id is None: return
+        self.cursor.execute("UPDATE jobs SET stage = 'extracted', tables_json = ?, updated_at = ? WHERE id = ?",
+                            (json.dumps({'tables': tables, 'unchanged': unchanged}),
+                             datetime.datetime.now().isoformat(), job_id))
+        self.cursor.executemany("INSERT OR REPLACE INTO job_tables (job_id, idx, status) VALUES (?, ?, 'pending')",
+                                [(job_id, idx) for idx in range(1, len(tables) + 1)])
+        self._commit()
+
+    @synchronized
+    def mark_job_table(self, job_id, idx, status, method=None, table_id=None):
+        if not self.cursor or job_id is None: return
+        self.cursor.execute("UPDATE job_tables SET status = ?, method = ?, table_id = ? WHERE job_id = ? AND idx = ?",
+                            (status, method, table_id, job_id, idx))
+        self.cursor.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (datetime.datetime.now().isoformat(), job_id))
+        self._commit()
 
-    def add_table(self, arxiv_id, latex_code, packages_list, image_src_path):
+    @synchronized
+    def finish_job(self, job_id, error=None):
+        """error=None marks the job done and drops its saved source; otherwise the error is recorded for resume"""
+        if not self.cursor or job_id is None: return
+        now = datetime.datetime.now().isoformat()
+        if error is None:
+            self.cursor.execute("UPDATE jobs SET stage = 'done', error = NULL, updated_at = ? WHERE id = ?", (now, job_id))
+            try: os.remove(self._job_source_path(job_id))
+            except OSError: pass
+        else:
+            self.cursor.execute("UPDATE jobs SET error = ?, updated_at = ? WHERE id = ?", (str(error)[:500], now, job_id))
+        self._commit()
+
+    @synchronized
+    def load_job(self, job_id):
+        """Journal entry with its saved source, LLM tables and {idx: (status, method)}; None if unknown.
+
+        Finished jobs no longer have a saved source: theirs is None.
+        """
+        if not self.cursor: return None
+        self.cursor.execute("SELECT doc_id, stage, options, tables_json FROM jobs WHERE id = ?", (job_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        doc_id, stage, options, tables_json = row
+        source = None
+        if stage != 'done':
+            with open(self._job_source_path(job_id), "r", encoding="utf-8") as f:
+                source = f.read()
+        extracted = json.loads(tables_json) if tables_json else None
+        self.cursor.execute("SELECT idx, status, method FROM job_tables WHERE job_id = ?", (job_id,))
+        return {
+            'id': job_id, 'doc_id': doc_id, 'stage': stage, 'source': source,
+            'options': json.loads(options or "{}"),
+            'tables': extracted['tables'] if extracted else None,
+            'unchanged': extracted['unchanged'] if extracted else 0,
+            'table_status': {idx: (status, method) for idx, status, method in self.cursor.fetchall()},
+        }
+
+    @synchronized
+    def get_finished_doc_ids(self):
+        if not self.cursor: return set()
+        self.cursor.execute("SELECT DISTINCT doc_id FROM jobs WHERE stage = 'done'")
+        return {row[0] for row in self.cursor.fetchall()}
+
+    @synchronized
+    def get_unfinished_jobs(self):
+        """[(job_id, doc_id, stage, done_tables, total_tables, error)] oldest first"""
+        if not self.cursor: return []
+        self.cursor.execute('''
+            SELECT j.id, j.doc_id, j.stage,
+                   SUM(CASE WHEN t.status IN ('done', 'failed', 'duplicate') THEN 1 ELSE 0 END),
+                   COUNT(t.idx), j.error
+            FROM jobs j LEFT JOIN job_tables t ON t.job_id = j.id
+            WHERE j.stage != 'done'
+            GROUP BY j.id ORDER BY j.id
+        ''')
+        return [(jid, doc, stage, done or 0, total, err) for jid, doc, stage, done, total, err in self.cursor.fetchall()
+                if os.path.exists(self._job_source_path(jid))]
+
+    @timed("db_insert")
+    @synchronized
+    def add_table(self, arxiv_id, latex_code, packages_list, image_src_path, source_fingerprint=None, cleaned_code=None,
+                  render_hash=None, compiled_tex=None, cleaned_image_path=None):
         if not self.cursor: return
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
-        img_filename = f"{arxiv_id}_{timestamp}.png"
+        # The suffix keeps names unique when several importers or clients store tables in the same microsecond
+        img_stem = f"{arxiv_id}_{timestamp}_{uuid.uuid4().hex[:8]}"
+        img_filename = img_stem + ".png"
         shutil.copy(image_src_path, os.path.join(self.img_dir, img_filename))
+        cleaned_img_filename = None
+        if cleaned_image_path:
+            cleaned_img_filename = img_stem + "_clean.png"
+            shutil.copy(cleaned_image_path, os.path.join(self.img_dir, cleaned_img_filename))
         
         packages_str = ",".join(packages_list)
         self.cursor.execute('''
-            INSERT INTO tables (arxiv_id, latex_code, packages, note, image_filename, created_at)
+            INSERT INTO tables (arxiv_id, latex_code, packages, note, image_filename, created_at, source_fingerprint, cleaned_code,
+                                render_hash, compiled_tex, cleaned_image_filename)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (arxiv_id, latex_code, packages_str, "", img_filename, datetime.datetime.now().isoformat(), source_fingerprint,
+              cleaned_code, render_hash, compiled_tex, cleaned_img_filename))
+        table_id = self.cursor.lastrowid
+        self._index_fingerprint(table_id, latex_code)
+        self._index_cells(table_id, latex_code)
+        self._commit()
+        return table_id
+
+    def _index_fingerprint(self, table_id, latex_code):
+        sig = minhash_signature(latex_code)
+        self.cursor.execute("UPDATE tables SET fingerprint = ?, minhash = ? WHERE id = ?",
+                            (latex_fingerprint(latex_code), struct.pack(f"{len(sig)}I", *sig), table_id))
+        self.cursor.executemany("INSERT INTO minhash_bands (band, bucket, table_id) VALUES (?, ?, ?)",
+                                [(band, bucket, table_id) for band, bucket in minhash_bands(sig)])
+
+    def _backfill_fingerprints(self):
+        """Index rows stored before fingerprints existed"""
+        self.cursor.execute("SELECT id, latex_code FROM tables WHERE fingerprint IS NULL")
+        rows = self.cursor.fetchall()
+        for table_id, code in rows:
+            self._index_fingerprint(table_id, code or "")
+        if rows:
+            self._commit()
+            print(f"[DEDUP] Indexed {len(rows)} existing tables")
+
+    def _index_cells(self, table_id, latex_code):
+        grids = [g.to_json() for g in parse_table_grids(latex_code)]
+        self.cursor.execute("UPDATE tables SET cells = ? WHERE id = ?", (json.dumps(grids, ensure_ascii=False), table_id))
+
+    def _backfill_cells(self):
+        """Parse the grids of rows stored before cells existed"""
+        self.cursor.execute("SELECT id, latex_code FROM tables WHERE cells IS NULL")
+        rows = self.cursor.fetchall()
+        for table_id, code in rows:
+            self._index_cells(table_id, code or "")
+        if rows:
+            self._commit()
+            print(f"[CELLS] Parsed {len(rows)} existing tables")
+
+    @synchronized
+    def get_table_grids(self, table_id):
+        """TableGrid list of a stored table (one per tabular, empty if none parsed)"""
+        if not self.cursor: return []
+        self.cursor.execute("SELECT cells FROM tables WHERE id = ?", (table_id,))
+        row = self.cursor.fetchone()
+        return [TableGrid.from_json(g) for g in json.loads(row[0] or "[]")] if row else []
+
+    @synchronized
+    def find_tables_by_header(self, header, numeric_only=False):
+        """Tables with a column whose header contains header (case-insensitive).
+
+        Returns (table_id, arxiv_id, grid_index, column, column_header) per matching
+        column; numeric_only keeps columns with at least one numeric body cell.
+        """
+        if not self.cursor: return []
+        needle = header.lower()
+        # LIKE is only a prefilter on the raw LaTeX in the JSON, so it uses the longest letter/digit
+        # run of header: markup such as \% differs from the readable header, and no LIKE wildcard
+        # (% or _) can reach the pattern. The header match itself runs on parsed grids
+        words = re.findall(r'[^\W_]+', header)
+        self.cursor.execute("SELECT id, arxiv_id, cells FROM tables WHERE cells LIKE ? ORDER BY id",
+                            (f"%{max(words, key=len) if words else ''}%",))
+        out = []
+        for table_id, arxiv_id, cells in self.cursor.fetchall():
+            for g_idx, data in enumerate(json.loads(cells or "[]")):
+                grid = TableGrid.from_json(data)
+                numeric_cols = {c for _, c, _, _ in grid.numeric_cells()} if numeric_only else None
+                for col, text in enumerate(grid.column_headers()):
+                    if needle in text.lower() and (numeric_cols is None or col in numeric_cols):
+                        out.append((table_id, arxiv_id, g_idx, col, text))
+        return out
+
+    @synchronized
+    def get_numeric_cells(self, table_id, header=None):
+        """[(grid_index, row, col, column header, value)] of a table, optionally one column only"""
+        out = []
+        for g_idx, grid in enumerate(self.get_table_grids(table_id)):
+            if header:
+                headers = grid.column_headers()
+                out += [(g_idx, r, c, h, v) for r, c, h, v in grid.numeric_cells() if header.lower() in headers[c].lower()]
+            else:
+                out += [(g_idx, r, c, h, v) for r, c, h, v in grid.numeric_cells()]
+        return out
+
+    @synchronized
+    def clean_tables(self, clean_char="-", arxiv_id=None, since=None, until=None, query=None, batch_size=500):
+        """Store clean_table_code(latex_code) as cleaned_code for every matching row, return the count.
+
+        Purely local: rows are read and written back in id-ordered batches, so a
+        whole library is re-cleaned in seconds (e.g. after changing clean_char)
+        without re-extraction or API calls. Filters are those of iter_tables.
+        """
+        if not self.cursor: return 0
+        where, params = self._table_filter(arxiv_id, since, until, query)
+        sql = "SELECT id, latex_code FROM tables WHERE " + " AND ".join(where + ["id > ?"]) + " ORDER BY id LIMIT ?"
+        count, last_id = 0, -1
+        while True:
+            self.cursor.execute(sql, params + [last_id, batch_size])
+            rows = self.cursor.fetchall()
+            if not rows:
+                return count
+            self.cursor.executemany("UPDATE tables SET cleaned_code = ? WHERE id = ?",
+                                    [(clean_table_code(code or "", clean_char), table_id) for table_id, code in rows])
+            self._commit()
+            count += len(rows)
+            last_id = rows[-1][0]
+
+    @synchronized
+    def get_cleaned_code(self, table_id, clean_char="-"):
+        """Stored cleaned variant of a table, computed (not stored) if it has none yet"""
+        if not self.cursor: return None
+        self.cursor.execute("SELECT latex_code, cleaned_code FROM tables WHERE id = ?", (table_id,))
+        row = self.cursor.fetchone()
+        if not row: return None
+        return row[1] if row[1] is not None else clean_table_code(row[0] or "", clean_char)
+
+    @synchronized
+    def find_duplicate(self, latex_code, threshold=0.9, arxiv_id=None):
+        """Return (table_id, 'exact'|'near', similarity) for a stored table matching latex_code, or None.
+
+        Exact matches come from any paper. Near matches (MinHash) only count within
+        the paper of arxiv_id (any version): a similar table of another paper is a
+        different table, e.g. the same layout with other numbers.
+        """
+        if not self.cursor: return None
+        self.cursor.execute("SELECT id FROM tables WHERE fingerprint = ? LIMIT 1", (latex_fingerprint(latex_code),))
+        row = self.cursor.fetchone()
+        if row:
+            return row[0], "exact", 1.0
+        sig = minhash_signature(latex_code)
+        candidates = set()
+        for band, bucket in minhash_bands(sig):
+            self.cursor.execute("SELECT table_id FROM minhash_bands WHERE band = ? AND bucket = ?", (band, bucket))
+            candidates.update(r[0] for r in self.cursor.fetchall())
+        best = None
+        for table_id in candidates:
+            self.cursor.execute("SELECT minhash, arxiv_id FROM tables WHERE id = ?", (table_id,))
+            row = self.cursor.fetchone()
+            if not row or not row[0] or arxiv_base_id(row[1]) != arxiv_base_id(arxiv_id):
+                continue
+            sim = minhash_similarity(sig, struct.unpack(f"{len(row[0]) // 4}I", row[0]))
+            if sim >= threshold and (best is None or sim > best[2]):
+                best = (table_id, "near", sim)
+        return best
+
+    @synchronized
+    def find_same_render(self, table_id):
+        """[(table_id, arxiv_id)] of other tables whose rendering is identical to table_id's"""
+        if not self.cursor: return []
+        self.cursor.execute('''
+            SELECT id, arxiv_id FROM tables
+            WHERE render_hash = (SELECT render_hash FROM tables WHERE id = ?) AND id != ? ORDER BY id
+        ''', (table_id, table_id))
+        return self.cursor.fetchall()
+
+    @synchronized
+    def get_same_render_groups(self, cross_paper=True, limit=100):
+        """Groups of visually identical tables: [(render_hash, [table_id, ...], [arxiv_id, ...])], largest first.
+
+        Compares the stored render hashes only, nothing is re-rendered; rows stored
+        before render hashes existed are not covered. cross_paper keeps groups
+        spanning more than one paper (all versions of a paper count as one).
+        """
+        if not self.cursor: return []
+        self.cursor.execute('''
+            SELECT render_hash, GROUP_CONCAT(id), GROUP_CONCAT(arxiv_id, char(10)) FROM tables
+            WHERE render_hash IS NOT NULL GROUP BY render_hash HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC, MIN(id)
+        ''')
+        groups = []
+        for render_hash, ids, arxiv_ids in self.cursor.fetchall():
+            papers = sorted(set(arxiv_ids.split("\n")))
+            if cross_paper and len({arxiv_base_id(a) for a in papers}) < 2:
+                continue
+            groups.append((render_hash, sorted(int(i) for i in ids.split(",")), papers))
+            if len(groups) >= limit:
+                break
+        return groups
+
+    @synchronized
+    def link_table(self, arxiv_id, table_id, relation, similarity=1.0, source_fingerprint=None):
+        """Record that arxiv_id contains an already-stored table"""
+        if not self.cursor: return
+        self.cursor.execute('''
+            INSERT INTO table_links (arxiv_id, table_id, relation, similarity, source_fingerprint, created_at)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (arxiv_id, latex_code, packages_str, "", img_filename, datetime.datetime.now().isoformat()))
-        self.conn.commit()
+        ''', (arxiv_id, table_id, relation, similarity, source_fingerprint, datetime.datetime.now().isoformat()))
+        self._commit()
 
+    @synchronized
+    def get_source_fingerprints(self, base_id):
+        """{source span fingerprint: table_id} for every stored version of an arXiv paper"""
+        if not self.cursor: return {}
+        like = base_id + "v%"
+        self.cursor.execute('''
+            SELECT source_fingerprint, id FROM tables
+            WHERE source_fingerprint IS NOT NULL AND (arxiv_id = ? OR arxiv_id LIKE ?)
+            UNION ALL
+            SELECT source_fingerprint, table_id FROM table_links
+            WHERE source_fingerprint IS NOT NULL AND (arxiv_id = ? OR arxiv_id LIKE ?)
+        ''', (base_id, like, base_id, like))
+        return {fp: tid for fp, tid in self.cursor.fetchall()}
+
+    @staticmethod
+    def _table_filter(arxiv_id=None, since=None, until=None, query=None):
+        """WHERE clauses and parameters shared by iter_tables and clean_tables"""
+        where, params = [], []
+        if arxiv_id:
+            base = arxiv_base_id(arxiv_id)
+            where.append("(arxiv_id = ? OR arxiv_id LIKE ? OR id IN "
+                         "(SELECT table_id FROM table_links WHERE arxiv_id = ? OR arxiv_id LIKE ?))")
+            params += [base, base + "v%", base, base + "v%"]
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until:
+            where.append("substr(created_at, 1, length(?)) <= ?")
+            params += [until, until]
+        if query:
+            where.append("(latex_code LIKE ? OR note LIKE ? OR arxiv_id LIKE ?)")
+            params += [f"%{query}%"] * 3
+        return where, params
+
+    def iter_tables(self, arxiv_id=None, since=None, until=None, query=None, batch_size=500, cleaned=False, clean_char="-"):
+        """Yield (id, arxiv_id, latex_code, packages, note, image_filename, created_at, compiled_tex) oldest first.
+
+        arxiv_id matches every version of the paper, including tables linked to it;
+        since/until are inclusive ISO date(-time) prefixes; query is a substring of
+        code, note or arXiv ID. Rows stream from a read-only connection of their own
+        with fetchmany, so large exports neither hold the lock nor load the library.
+        cleaned=True yields the clean-mode variant: cleaned_code (computed with
+        clean_char if not stored), the cleaned compiled document and the PNG rendered
+        from it (None for tables not extracted in clean mode).
+        """
+        if not self.cursor: return
+        where, params = self._table_filter(arxiv_id, since, until, query)
+        if cleaned:
+            sql = ("SELECT id, arxiv_id, latex_code, packages, note, cleaned_image_filename, created_at, compiled_tex, "
+                   "cleaned_code FROM tables")
+        else:
+            sql = "SELECT id, arxiv_id, latex_code, packages, note, image_filename, created_at, compiled_tex FROM tables"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            cur = conn.execute(sql + " ORDER BY id", params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if not cleaned:
+                    yield from rows
+                    continue
+                for *row, cleaned_code in rows:
+                    row[2] = cleaned_code if cleaned_code is not None else clean_table_code(row[2] or "", clean_char)
+                    row[7] = row[7] and clean_table_code(row[7], clean_char)
+                    yield tuple(row)
+        finally:
+            conn.close()
+
+    @synchronized
+    def get_library_rows(self):
+        """LibraryRow list, newest first, for the library list.
+
+        Only IDs, the package count and a note snippet are loaded, so memory stays
+        flat however large the stored LaTeX is; arXiv IDs shared by several rows
+        are interned.
+        """
+        if not self.cursor: return []
+        n = LibraryRow.NOTE_PREVIEW
+        self.cursor.execute(f'''
+            SELECT id, arxiv_id,
+                   CASE WHEN packages IS NULL OR packages = '' THEN 0
+                        ELSE length(packages) - length(replace(packages, ',', '')) + 1 END,
+                   CASE WHEN length(note) >= {n} THEN substr(note, 1, {n}) || '...' ELSE COALESCE(note, '') END
+            FROM tables ORDER BY created_at DESC
+        ''')
+        intern = sys.intern
+        return [LibraryRow(tid, intern(aid or ""), pkgs, note) for tid, aid, pkgs, note in self.cursor]
+
+    @synchronized
+    def get_table_detail(self, table_id, cleaned=False, clean_char="-"):
+        """(latex_code, packages, note, image_filename) of one row, or None if it was deleted.
+
+        cleaned=True returns the stored cleaned_code (computed with clean_char if none)
+        and the PNG rendered from it, or the regular PNG if the table has none.
+        """
+        if not self.cursor: return None
+        self.cursor.execute("SELECT latex_code, packages, note, image_filename, cleaned_code, cleaned_image_filename "
+                            "FROM tables WHERE id = ?", (table_id,))
+        row = self.cursor.fetchone()
+        if not row: return None
+        code, packages, note, image_filename, cleaned_code, cleaned_image = row
+        if cleaned:
+            code = cleaned_code if cleaned_code is not None else clean_table_code(code or "", clean_char)
+            image_filename = cleaned_image or image_filename
+        return code, packages, note, image_filename
+
+    @synchronized
+    def get_image_filename(self, table_id, cleaned=False):
+        """Stored PNG of a row; cleaned=True prefers the one rendered in clean mode, as get_table_detail does"""
+        if not self.cursor: return None
+        self.cursor.execute("SELECT image_filename, cleaned_image_filename FROM tables WHERE id = ?", (table_id,))
+        row = self.cursor.fetchone()
+        if not row: return None
+        return (cleaned and row[1]) or row[0]
+
+    @synchronized
     def get_all_tables(self):
         if not self.cursor: return []
-        self.cursor.execute("SELECT * FROM tables ORDER BY created_at DESC")
+        self.cursor.execute(
+            "SELECT id, arxiv_id, latex_code, packages, note, image_filename, created_at FROM tables ORDER BY created_at DESC"
+        )
+        return self.cursor.fetchall()
+
+    @synchronized
+    def record_rule_stats(self, stats):
+        """Accumulate ErrorFixer counters: stats = {rule: {'hits': n, 'success': m}}"""
+        if not self.cursor or not stats: return
+        for rule, c in stats.items():
+            self.cursor.execute('''
+                INSERT INTO fix_rule_stats (rule, hits, successes) VALUES (?, ?, ?)
+                ON CONFLICT(rule) DO UPDATE SET hits = hits + excluded.hits, successes = successes + excluded.successes
+            ''', (rule, c['hits'], c['success']))
+        self._commit()
+
+    @synchronized
+    def get_rule_stats(self):
+        """Rules ordered by number of compiles they rescued (= LLM calls saved)"""
+        if not self.cursor: return []
+        self.cursor.execute("SELECT rule, hits, successes FROM fix_rule_stats ORDER BY successes DESC, hits DESC")
         return self.cursor.fetchall()
 
+    @synchronized
+    def record_llm_fix_stats(self, stats):
+        """Accumulate LLMPolicy fix outcomes: stats = {error_class: {'attempts', 'successes', 'tokens'}}"""
+        if not self.cursor or not stats: return
+        for error_class, c in stats.items():
+            self.cursor.execute('''
+                INSERT INTO llm_fix_stats (error_class, attempts, successes, tokens) VALUES (?, ?, ?, ?)
+                ON CONFLICT(error_class) DO UPDATE SET attempts = attempts + excluded.attempts,
+                    successes = successes + excluded.successes, tokens = tokens + excluded.tokens
+            ''', (error_class, c['attempts'], c['successes'], c['tokens']))
+        self._commit()
+
+    @synchronized
+    def get_llm_fix_stats(self):
+        """(error_class, attempts, successes, tokens), most attempted first"""
+        if not self.cursor: return []
+        self.cursor.execute("SELECT error_class, attempts, successes, tokens FROM llm_fix_stats ORDER BY attempts DESC")
+        return self.cursor.fetchall()
+
+    @synchronized
+    def record_tier_stats(self, stats):
+        """Accumulate ModelRouter counters: stats = {(stage, model): {'tier', 'calls', 'successes', 'seconds', 'tokens'}}"""
+        if not self.cursor or not stats: return
+        for (stage, model), c in stats.items():
+            self.cursor.execute('''
+                INSERT INTO llm_tier_stats (stage, model, tier, calls, successes, seconds, tokens) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(stage, model) DO UPDATE SET tier = excluded.tier, calls = calls + excluded.calls,
+                    successes = successes + excluded.successes, seconds = seconds + excluded.seconds,
+                    tokens = tokens + excluded.tokens
+            ''', (stage, model, c['tier'], c['calls'], c['successes'], c['seconds'], c['tokens']))
+        self._commit()
+
+    @synchronized
+    def get_tier_stats(self):
+        """(stage, model, tier, calls, successes, seconds, tokens) ordered by stage and tier"""
+        if not self.cursor: return []
+        self.cursor.execute("SELECT stage, model, tier, calls, successes, seconds, tokens FROM llm_tier_stats "
+                            "ORDER BY stage, tier, model")
+        return self.cursor.fetchall()
+
+    @synchronized
+    def add_compile_attempts(self, arxiv_id, table_index, attempts):
+        """Persist the attempt_log filled by CoreLogic.render_latex"""
+        if not self.cursor or not attempts: return
+        now = datetime.datetime.now().isoformat()
+        for a in attempts:
+            diags = a.get('diagnostics') or []
+            d = diags[0] if diags else {}
+            self.cursor.execute('''
+                INSERT INTO compile_attempts (arxiv_id, table_index, attempt, stage, success, error_class,
+                                              macro, package, tex_line, body_line, message, diagnostics, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (arxiv_id, table_index, a['attempt'], a['stage'], int(a['success']), d.get('error_class'),
+                  d.get('macro'), d.get('package'), d.get('tex_line'), d.get('body_line'), d.get('message'),
+                  json.dumps(diags, ensure_ascii=False), now))
+        self._commit()
+
+    @synchronized
+    def get_failure_report(self, limit=30):
+        """Failed attempts grouped by (error class, offending macro/package), most retries first.
+
+        Rows: (error_class, subject, failed_attempts, tables_affected, tables_never_compiled)
+        """
+        if not self.cursor: return []
+        self.cursor.execute('''
+            SELECT a.error_class, COALESCE(a.macro, a.package, '') AS subject,
+                   COUNT(*) AS failed_attempts,
+                   COUNT(DISTINCT a.arxiv_id || '#' || a.table_index) AS tables_affected,
+                   COUNT(DISTINCT CASE WHEN ok.arxiv_id IS NULL THEN a.arxiv_id || '#' || a.table_index END) AS lost
+            FROM compile_attempts a
+            LEFT JOIN (SELECT DISTINCT arxiv_id, table_index FROM compile_attempts WHERE success = 1) ok
+                   ON ok.arxiv_id = a.arxiv_id AND ok.table_index = a.table_index
+            WHERE a.success = 0
+            GROUP BY a.error_class, subject
+            ORDER BY failed_attempts DESC
+            LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+
+    @synchronized
+    def save_metrics(self, run):
+        """Persist a finished Metrics run (see Metrics.start_run / end_run)"""
+        if not self.cursor or not run: return
+        self.cursor.execute("INSERT OR REPLACE INTO metric_runs (run_id, label, started_at, finished_at) VALUES (?, ?, ?, ?)",
+                            (run['run_id'], run['label'], run['started_at'], run['finished_at']))
+        for ev in run['events']:
+            extra = {k: v for k, v in ev.items() if k not in ('stage', 'seconds', 'ok')}
+            self.cursor.execute("INSERT INTO metric_events (run_id, stage, seconds, ok, extra) VALUES (?, ?, ?, ?, ?)",
+                                (run['run_id'], ev['stage'], ev['seconds'], int(ev['ok']), json.dumps(extra)))
+        for name, value in run['counters'].items():
+            self.cursor.execute("INSERT OR REPLACE INTO metric_counters (run_id, name, value) VALUES (?, ?, ?)",
+                                (run['run_id'], name, value))
+        self._commit()
+
+    @synchronized
+    def export_metrics(self, fmt="prom", run_id=None):
+        """Render stored metrics as Prometheus text exposition or JSON lines"""
+        if not self.cursor: return ""
+        where, params = ("WHERE run_id = ?", (run_id,)) if run_id else ("", ())
+        if fmt == "jsonl":
+            lines = []
+            self.cursor.execute(f"SELECT run_id, stage, seconds, ok, extra FROM metric_events {where} ORDER BY id", params)
+            for rid, stage, seconds, ok, extra in self.cursor.fetchall():
+                rec = {'type': 'event', 'run_id': rid, 'stage': stage, 'seconds': round(seconds, 6), 'ok': bool(ok)}
+                rec.update(json.loads(extra or "{}"))
+                lines.append(json.dumps(rec, ensure_ascii=False))
+            self.cursor.execute(f"SELECT run_id, name, value FROM metric_counters {where}", params)
+            for rid, name, value in self.cursor.fetchall():
+                lines.append(json.dumps({'type': 'counter', 'run_id': rid, 'name': name, 'value': value}))
+            return "\n".join(lines) + "\n"
+
+        out = [
+            "# HELP ltminer_stage_seconds Time spent per pipeline stage.",
+            "# TYPE ltminer_stage_seconds summary",
+        ]
+        self.cursor.execute(f"SELECT stage, SUM(seconds), COUNT(*), SUM(1 - ok) FROM metric_events {where} GROUP BY stage ORDER BY stage", params)
+        stage_rows = self.cursor.fetchall()
+        for stage, total, count, _ in stage_rows:
+            out.append(f'ltminer_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            out.append(f'ltminer_stage_seconds_count{{stage="{stage}"}} {count}')
+        out.append("# HELP ltminer_stage_failures_total Stage invocations that raised.")
+        out.append("# TYPE ltminer_stage_failures_total counter")
+        for stage, _, _, failures in stage_rows:
+            out.append(f'ltminer_stage_failures_total{{stage="{stage}"}} {failures}')
+        self.cursor.execute(f"SELECT name, SUM(value) FROM metric_counters {where} GROUP BY name ORDER BY name", params)
+        for name, value in self.cursor.fetchall():
+            out.append(f"# TYPE ltminer_{name}_total counter")
+            out.append(f"ltminer_{name}_total {value}")
+        return "\n".join(out) + "\n"
+
+    @synchronized
     def update_note(self, table_id, new_note):
         if not self.cursor: return
         self.cursor.execute("UPDATE tables SET note = ? WHERE id = ?", (new_note, table_id))
-        self.conn.commit()
+        self._commit()
 
+    @synchronized
     def delete_table(self, table_id):
         if not self.cursor: return
-        self.cursor.execute("SELECT image_filename FROM tables WHERE id = ?", (table_id,))
+        self.cursor.execute("SELECT image_filename, cleaned_image_filename FROM tables WHERE id = ?", (table_id,))
         res = self.cursor.fetchone()
-        if res:
-            try: os.remove(os.path.join(self.img_dir, res[0]))
+        for filename in res or ():
+            if not filename: continue
+            try: os.remove(os.path.join(self.img_dir, filename))
             except: pass
         self.cursor.execute("DELETE FROM tables WHERE id = ?", (table_id,))
-        self.conn.commit()
+        self.cursor.execute("DELETE FROM minhash_bands WHERE table_id = ?", (table_id,))
+        self.cursor.execute("DELETE FROM table_links WHERE table_id = ?", (table_id,))
+        self._commit()
+
+# --- 1b. Library Service ---
+class LibraryServiceError(Exception):
+    """A call forwarded to the LibraryService failed (remote exception or unreachable service)"""
+
+def _encode_library_value(value):
+    """json.dumps default= for DataManager results"""
+    if isinstance(value, LibraryRow):
+        return [value.id, value.arxiv_id, value.package_count, value.note_preview]
+    if isinstance(value, TableGrid):
+        return value.to_json()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"cannot encode {type(value).__name__}")
+
+class LibraryService:
+    """Serve one DataManager (DB + image store) to several GUI/CLI processes.
+
+    Clients (LibraryClient) POST {"method", "args", "kwargs"} as application/json
+    to /call over HTTP on localhost or a Unix socket (created 0600). Every request
+    must carry the token the service writes to <storage>/service.token (0600) and a
+    loopback Host; requests with an Origin header (browsers) are refused.
+    Writes go through a queue to a single writer thread that applies everything
+    queued so far inside one transaction (one savepoint per call, so a failing
+    call does not roll back its neighbours) and commits once. Reads run on the
+    request threads but still take the DataManager lock, so they are serialized
+    with each other and wait for a write batch in progress; only iter_tables
+    streams independently (client side, read-only connection).
+    Only the methods listed below are exposed; the storage path cannot be changed
+    remotely and add_table receives the PNG bytes, never a path.
+    """
+    TOKEN_FILE = "service.token"
+
+    READ_METHODS = (
+        'load_job', 'get_finished_doc_ids', 'get_unfinished_jobs', 'get_table_grids', 'find_tables_by_header',
+        'get_numeric_cells', 'get_cleaned_code', 'find_duplicate', 'get_source_fingerprints', 'get_library_rows',
+        'get_table_detail', 'get_image_filename', 'get_all_tables', 'get_rule_stats', 'get_llm_fix_stats',
+        'get_tier_stats', 'get_failure_report', 'export_metrics', 'find_same_render', 'get_same_render_groups',
+    )
+    WRITE_METHODS = (
+        'create_job', 'job_extracted', 'mark_job_table', 'finish_job', 'add_table', 'clean_tables', 'link_table',
+        'record_rule_stats', 'record_llm_fix_stats', 'record_tier_stats', 'add_compile_attempts', 'save_metrics',
+        'update_note', 'delete_table',
+    )
+
+    def __init__(self, data_manager, batch_size=64):
+        self.data_manager = data_manager
+        self.batch_size = batch_size
+        self._writes = None
+        self._writer = None
+        self._server = None
+        self._socket_path = None
+        self._token_path = None
+        self.token = None
+        self.stats = {'reads': 0, 'writes': 0, 'commits': 0}
+
+    def info(self):
+        dm = self.data_manager
+        return {'storage_path': dm.config.get("storage_path"), 'img_dir': dm.img_dir, 'db_path': dm.db_path}
+
+    def call(self, name, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if name == "add_table":
+            return self._add_uploaded_table(list(args), kwargs)
+        if name in self.WRITE_METHODS:
+            import concurrent.futures
+            future = concurrent.futures.Future()
+            self._writes.put((name, args, kwargs, future))
+            return future.result()
+        if name in self.READ_METHODS:
+            self.stats['reads'] += 1
+            return getattr(self.data_manager, name)(*args, **kwargs)
+        raise LibraryServiceError(f"unknown method {name!r}")
+
+    def _add_uploaded_table(self, args, kwargs):
+        """add_table with args[3] (and cleaned_image_path) = base64 PNG (LibraryClient.add_table), never a path here"""
+        import base64
+        if len(args) < 4 or not isinstance(args[3], str):
+            raise LibraryServiceError("add_table expects the base64 PNG as its fourth argument")
+        if not isinstance(kwargs.get('cleaned_image_path') or "", str):
+            raise LibraryServiceError("add_table expects cleaned_image_path as a base64 PNG")
+        uploads = []
+
+        def upload(data):
+            path = os.path.join(self.data_manager.img_dir, f".upload_{uuid.uuid4().hex}.png")
+            uploads.append(path)
+            with open(path, "wb") as f:
+                f.write(base64.b64decode(data, validate=True))
+            return path
+
+        try:
+            args[3] = upload(args[3])
+            if kwargs.get('cleaned_image_path'):
+                kwargs['cleaned_image_path'] = upload(kwargs['cleaned_image_path'])
+            import concurrent.futures
+            future = concurrent.futures.Future()
+            self._writes.put(("add_table", args, kwargs, future))
+            return future.result()
+        finally:
+            for path in uploads:
+                try: os.remove(path)
+                except OSError: pass
+
+    def _write_token(self):
+        import secrets
+        self.token = secrets.token_hex(32)
+        self._token_path = os.path.join(self.data_manager.config["storage_path"], self.TOKEN_FILE)
+        fd = os.open(self._token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.token)
+        os.chmod(self._token_path, 0o600)  # an existing file keeps its old mode on O_CREAT
+
+    def _writer_loop(self):
+        import queue
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._apply(batch)
+                    return
+                batch.append(item)
+            self._apply(batch)
+
+    def _apply(self, batch):
+        """Run queued write calls in one transaction; each caller gets its own result or exception"""
+        dm = self.data_manager
+        with dm.lock:
+            dm._defer_commit = True
+            outcomes = []
+            try:
+                if dm.conn.in_transaction:
+                    dm.conn.commit()
+                dm.conn.execute("BEGIN")
+                for name, args, kwargs, future in batch:
+                    dm.conn.execute("SAVEPOINT call")
+                    try:
+                        outcomes.append((future, getattr(dm, name)(*args, **kwargs), None))
+                        dm.conn.execute("RELEASE call")
+                    except Exception as e:
+                        dm.conn.execute("ROLLBACK TO call")
+                        dm.conn.execute("RELEASE call")
+                        outcomes.append((future, None, e))
+                dm.conn.commit()
+            except Exception as e:
+                dm.conn.rollback()
+                outcomes = [(future, None, e) for _name, _args, _kwargs, future in batch]
+            finally:
+                dm._defer_commit = False
+        self.stats['writes'] += len(batch)
+        self.stats['commits'] += 1
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def start(self, host="127.0.0.1", port=8765, socket_path=None):
+        """Start serving in background threads; returns the URL clients should use"""
+        import queue
+        import socketserver
+        from http.server import ThreadingHTTPServer
+        if not self.data_manager.cursor:
+            raise LibraryServiceError("storage_path is not set")
+        self._write_token()
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="library-writer", daemon=True)
+        self._writer.start()
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+            class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+            old_umask = os.umask(0o177)  # the socket is created 0600: other local users cannot connect
+            try:
+                self._server = UnixHTTPServer(socket_path, _library_request_handler())
+            finally:
+                os.umask(old_umask)
+            self._socket_path = socket_path
+            url = f"unix:{socket_path}"
+        else:
+            self._server = ThreadingHTTPServer((host, port), _library_request_handler())
+            url = f"http://{host}:{self._server.server_address[1]}"
+        self._server.service = self
+        threading.Thread(target=self._server.serve_forever, name="library-service", daemon=True).start()
+        return url
+
+    def stop(self):
+        """Stop accepting requests, apply the queued writes and close the socket"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        for path in (self._socket_path, self._token_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def _library_request_handler():
+    """Request handler class of LibraryService (http.server is only imported when serving)"""
+    from http.server import BaseHTTPRequestHandler
+
+    class LibraryRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: a client reuses one connection per thread
+        LOOPBACK = ("127.0.0.1", "localhost", "::1")
+
+        def _refusal(self):
+            """(status, reason) if the request is not from a LibraryClient on this machine, else None"""
+            import hmac
+            from urllib.parse import urlsplit
+            # Browsers always send Origin on cross-site POSTs (even CORS "simple" ones); clients never do
+            if self.headers.get("Origin") is not None:
+                return 403, "browser requests are not accepted"
+            try:
+                host = urlsplit("//" + (self.headers.get("Host") or "")).hostname
+            except ValueError:
+                host = None
+            if host not in self.LOOPBACK:  # DNS rebinding
+                return 403, "Host must be a loopback address"
+            scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+            if scheme != "Bearer" or not hmac.compare_digest(token.encode(), self.server.service.token.encode()):
+                return 401, f"missing or wrong token (see {LibraryService.TOKEN_FILE} in the service's storage folder)"
+            return None
+
+        def do_GET(self):
+            refusal = self._refusal()
+            if refusal:
+                return self._reply(refusal[0], {'error': refusal[1]})
+            if self.path == "/info":
+                self._reply(200, {'result': self.server.service.info()})
+            else:
+                self._reply(404, {'error': f"no such path {self.path}"})
+
+        def do_POST(self):
+            refusal = self._refusal()
+            if refusal:
+                return self._reply(refusal[0], {'error': refusal[1]})
+            if self.path != "/call":
+                return self._reply(404, {'error': f"no such path {self.path}"})
+            if (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+                return self._reply(415, {'error': "Content-Type must be application/json"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                result = self.server.service.call(request['method'], request.get('args', []), request.get('kwargs'))
+            except Exception as e:
+                return self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+            self._reply(200, {'result': result})
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, default=_encode_library_value, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return LibraryRequestHandler
+
+class LibraryClient:
+    """DataManager stand-in that forwards library calls to a LibraryService.
+
+    url is "http://host:port" or "unix:/path/to/socket". The access token is
+    library_service_token, or else read from service.token in the local
+    storage_path (the usual case: client and service share app_config.json).
+    Settings stay local (app_config.json), the storage path is the service's.
+    add_table uploads the PNG bytes; images are read straight from the service's
+    image store and iter_tables streams from its database file read-only, so the
+    service is meant to run on the same machine.
+    """
+
+    # Results whose Python types do not survive JSON
+    DECODERS = {
+        'get_library_rows': lambda rows: [LibraryRow(*r) for r in rows],
+        'get_table_grids': lambda grids: [TableGrid.from_json(g) for g in grids],
+        'get_finished_doc_ids': set,
+        'find_duplicate': lambda match: tuple(match) if match else None,
+        'get_table_detail': lambda row: tuple(row) if row else None,
+        'load_job': lambda job: job and {**job, 'table_status': {int(idx): tuple(v) for idx, v in job['table_status'].items()}},
+    }
+
+    def __init__(self, url, config=None, open_db=True, timeout=600):
+        self.url = url
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.config = dict(config) if config is not None else DataManager.load_config(self)
+        self._local_storage_path = self.config.get("storage_path", "")
+        self.token = self.config.get("library_service_token") or self._read_token()
+        self._local = threading.local()
+        self.cursor = None  # truthy once connected, like DataManager.cursor
+        self.img_dir = self.db_path = None
+        if open_db:
+            self.init_db()
+
+    def _read_token(self):
+        path = os.path.join(self._local_storage_path or "", LibraryService.TOKEN_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def _connection(self):
+        import http.client
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.url.startswith("unix:"):
+                import socket
+                path = self.url[len("unix:"):]
+                path = path[2:] if path.startswith("//") else path
+
+                class UnixHTTPConnection(http.client.HTTPConnection):
+                    def connect(self):
+                        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self.sock.settimeout(self.timeout)
+                        self.sock.connect(path)
+
+                conn = UnixHTTPConnection("localhost", timeout=self.timeout)
+            else:
+                from urllib.parse import urlsplit
+                parts = urlsplit(self.url)
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, payload=None):
+        import http.client
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Authorization": f"Bearer {self.token}"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        reused = getattr(self._local, 'conn', None) is not None
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            self._local.conn = None
+            # A kept-alive connection dropped by a restarted service is retried once on a fresh one
+            if reused and isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)):
+                return self._request(method, path, payload)
+            raise LibraryServiceError(f"library service {self.url} unreachable: {e}") from e
+        if 'error' in data:
+            raise LibraryServiceError(data['error'])
+        return data['result']
+
+    def _call(self, name, args, kwargs):
+        result = self._request("POST", "/call", {'method': name, 'args': list(args), 'kwargs': kwargs})
+        decode = self.DECODERS.get(name)
+        return decode(result) if decode else result
+
+    def add_table(self, arxiv_id, latex_code, packages_list, image_src_path, **kwargs):
+        """DataManager.add_table; the PNGs are sent with the call, the service never opens client-side paths"""
+        import base64
+
+        def encode(path):
+            with open(path, "rb") as f:
+                return base64.b64encode(f.read()).decode("ascii")
+
+        if kwargs.get('cleaned_image_path'):
+            kwargs['cleaned_image_path'] = encode(kwargs['cleaned_image_path'])
+        return self._call("add_table", (arxiv_id, latex_code, packages_list, encode(image_src_path)), kwargs)
+
+    def init_db(self):
+        info = self._request("GET", "/info")
+        self.config["storage_path"] = info['storage_path']
+        self.img_dir = info['img_dir']
+        self.db_path = info['db_path']
+        self.cursor = True
+
+    def save_config(self, new_config):
+        """Save settings locally; the storage path belongs to the service and is left alone"""
+        self.config.update({k: v for k, v in new_config.items() if k != "storage_path"})
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump({**self.config, "storage_path": self._local_storage_path}, f, indent=4)
+
+    # Streams from the service's DB file through a read-only connection, as DataManager does
+    _table_filter = staticmethod(DataManager._table_filter)
+    iter_tables = DataManager.iter_tables
+
+def _remote_method(name):
+    def method(self, *args, **kwargs):
+        return self._call(name, args, kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(DataManager, name).__doc__
+    return method
+
+for _name in LibraryService.READ_METHODS + LibraryService.WRITE_METHODS:
+    if _name not in LibraryClient.__dict__:  # add_table has its own upload wrapper
+        setattr(LibraryClient, _name, _remote_method(_name))
+
+def open_library(config=None, open_db=True):
+    """DataManager on the local library, or a LibraryClient when the library_service setting holds a URL"""
+    data_manager = DataManager(config, open_db=False)
+    url = data_manager.config.get("library_service")
+    if url:
+        return LibraryClient(url, data_manager.config, open_db=open_db)
+    if open_db:
+        data_manager.init_db()
+    return data_manager
 
 # --- 2. Core Logic ---
+class ErrorFixer:
+    """Deterministic error-pattern -> local rewrite rules, tried before any LLM fix"""
+
+    def __init__(self):
+        # (rule name, error pattern, handler); handlers mutate state {'defs': [...], 'body': str}
+        # and return True only if they actually changed something
+        self.rules = [
+            ('undefined_macro', re.compile(r'Undefined control sequence'), self._fix_undefined_macro),
+            ('undefined_environment', re.compile(r'Environment ([A-Za-z@*]+) undefined'), self._fix_undefined_environment),
+            ('undefined_color', re.compile(r"Undefined color [`']([^']+)'"), self._fix_undefined_color),
+            ('unknown_column_type', re.compile(r'Illegal pream-token \((.)\)|Unknown column type'), self._fix_unknown_column),
+            ('caption_outside_float', re.compile(r'\\caption outside float'), self._fix_caption),
+            ('misplaced_noalign', re.compile(r'Misplaced \\noalign'), self._fix_noalign),
+            ('missing_dollar', re.compile(r'Missing \$ inserted'), self._fix_missing_dollar),
+            ('command_already_defined', re.compile(r'Command (\\[A-Za-z@]+) already defined'), self._fix_already_defined),
+        ]
+        # Counters are per thread: parallel pipelines sharing one CoreLogic each pop their own
+        self._local = threading.local()
+
+    @property
+    def stats(self):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = {name: {'hits': 0, 'success': 0} for name, _, _ in self.rules}
+        return stats
+
+    def apply(self, error_msg, state, full_tex):
+        """Try every rule whose pattern matches error_msg, return list of rule names that changed state"""
+        applied = []
+        for name, pattern, handler in self.rules:
+            m = pattern.search(error_msg)
+            if not m:
+                continue
+            try:
+                changed = handler(m, state, error_msg, full_tex)
+            except Exception as e:
+                print(f"[RULE-FIX] Rule '{name}' crashed: {str(e)[:120]}")
+                changed = False
+            if changed:
+                self.stats[name]['hits'] += 1
+                applied.append(name)
+        return applied
+
+    def record_success(self, rule_names):
+        for name in set(rule_names):
+            self.stats[name]['success'] += 1
+
+    def pop_stats(self):
+        """Return counters the calling thread accumulated since its last call and reset them"""
+        stats = {k: dict(v) for k, v in self.stats.items() if v['hits']}
+        self._local.stats = None
+        return stats
+
+    # --- helpers ---
+    def _error_line_text(self, error_msg, full_tex):
+        """Source text of the line Tectonic reports for the first error, or None"""
+        m = re.search(r'\.tex:(\d+):', error_msg) or re.search(r'^l\.(\d+)', error_msg, re.M)
+        if not m:
+            return None
+        lines = full_tex.split('\n')
+        n = int(m.group(1))
+        if 1 <= n <= len(lines):
+            return lines[n - 1]
+        return None
+
+    def _add_def(self, state, line):
+        if line in state['defs']:
+            return False
+        state['defs'].append(line)
+        return True
+
+    # --- rules ---
+    def _fix_undefined_macro(self, m, state, error_msg, full_tex):
+        # TeX context line ("l.12 ... \foo") ends right after the offending macro
+        ctx = re.search(r'^l\.\d+ .*?(\\[A-Za-z@]+)\s*$', error_msg, re.M)
+        if ctx:
+            candidates = [ctx.group(1)]
+        else:
+            line = self._error_line_text(error_msg, full_tex) or ""
+            candidates = re.findall(r'\\[A-Za-z@]+', line)
+        changed = False
+        for macro in dict.fromkeys(candidates):
+            if macro in ('\\begin', '\\end', '\\providecommand', '\\newcommand'):
+                continue
+            # \providecommand is a no-op for macros that do exist, so stubbing every candidate is safe
+            changed |= self._add_def(state, f"\\providecommand{{{macro}}}{{}}")
+        return changed
+
+    def _fix_undefined_environment(self, m, state, error_msg, full_tex):
+        return self._add_def(state, f"\\newenvironment{{{m.group(1)}}}{{}}{{}}")
+
+    def _fix_undefined_color(self, m, state, error_msg, full_tex):
+        return self._add_def(state, f"\\definecolor{{{m.group(1)}}}{{HTML}}{{CCCCCC}}")
+
+    def _fix_unknown_column(self, m, state, error_msg, full_tex):
+        letter = m.group(1)
+        if not letter or not letter.isalpha():
+            return False
+        return self._add_def(state, f"\\newcolumntype{{{letter}}}{{c}}")
+
+    def _fix_caption(self, m, state, error_msg, full_tex):
+        body = state['body']
+        out = []
+        pos = 0
+        for cm in re.finditer(r'\\(?:caption|captionof\{[^}]*\})\*?(\[[^\]]*\])?\{', body):
+            if cm.start() < pos:
+                continue
+            # Skip the balanced argument of \caption{...}
+            depth, i = 1, cm.end()
+            while i < len(body) and depth:
+                if body[i] == '{': depth += 1
+                elif body[i] == '}': depth -= 1
+                i += 1
+            out.append(body[pos:cm.start()])
+            pos = i
+        if not out:
+            return False
+        out.append(body[pos:])
+        state['body'] = ''.join(out)
+        return True
+
+    def _fix_noalign(self, m, state, error_msg, full_tex):
+        # A rule command must start a new row: add the missing "\\" after the preceding row
+        rule_re = re.compile(r'^\s*\\(?:hline|toprule|midrule|bottomrule|cline|cmidrule|hhline)\b')
+        lines = state['body'].split('\n')
+        changed = False
+        prev = None
+        for i, line in enumerate(lines):
+            if rule_re.match(line) and prev is not None:
+                p = lines[prev].rstrip()
+                if p and not p.endswith('\\\\') and not rule_re.match(p) and '&' in p:
+                    lines[prev] = p + ' \\\\'
+                    changed = True
+            if line.strip() and not line.strip().startswith('%'):
+                prev = i
+        if changed:
+            state['body'] = '\n'.join(lines)
+        return changed
+
+    def _escape_text_scripts(self, text):
+        """Escape bare _ and ^ outside $...$, drop a trailing unmatched $"""
+        parts = re.split(r'(?<!\\)(\$)', text)
+        if parts.count('$') % 2 == 1:
+            idx = len(parts) - 1 - parts[::-1].index('$')
+            parts[idx] = ''
+        out, in_math = [], False
+        for part in parts:
+            if part == '$':
+                in_math = not in_math
+                out.append(part)
+            elif in_math:
+                out.append(part)
+            else:
+                part = re.sub(r'(?<!\\)_', r'\\_', part)
+                part = re.sub(r'(?<!\\)\^', r'\\^{}', part)
+                out.append(part)
+        return ''.join(out)
+
+    def _fix_missing_dollar(self, m, state, error_msg, full_tex):
+        line = self._error_line_text(error_msg, full_tex)
+        body = state['body']
+        if line and line.strip() and line in body:
+            new_line = self._escape_text_scripts(line)
+            if new_line == line:
+                return False
+            state['body'] = body.replace(line, new_line)
+            return True
+        new_body = '\n'.join(self._escape_text_scripts(l) for l in body.split('\n'))
+        if new_body == body:
+            return False
+        state['body'] = new_body
+        return True
+
+    def _fix_already_defined(self, m, state, error_msg, full_tex):
+        macro = re.escape(m.group(1))
+        pattern = re.compile(r'\\newcommand(\*?)\{' + macro + r'\}')
+        changed = False
+        for i, d in enumerate(state['defs']):
+            new_d = pattern.sub(lambda mm: f"\\providecommand{mm.group(1)}{{{m.group(1)}}}", d)
+            if new_d != d:
+                state['defs'][i] = new_d
+                changed = True
+        return changed
+
+class LLMBudgetExceeded(Exception):
+    """Raised instead of an LLM call that would overrun the paper or batch budget"""
+
+
+class LLMPolicy:
+    """Token / wall-time budgets for LLM calls and the decision which fixes are worth paying for.
+
+    Spend is charged by CoreLogic._call_llm to the paper of the calling thread
+    (begin_paper/end_paper, so parallel imports keep separate accounts) and to the
+    shared batch (begin_batch). A limit of 0 means unlimited. Fixes are gated by
+    the success history of the error class they target: a class the LLM rarely
+    fixes gets fewer attempts, and may only spend while enough budget is left
+    for likelier fixes (reserve * (1 - expected success)).
+    """
+    DEFAULTS = {
+        'llm_paper_tokens': 60000,
+        'llm_paper_seconds': 300,
+        'llm_batch_tokens': 0,
+        'llm_batch_seconds': 0,
+        'llm_fix_attempts': 3,
+        'llm_min_fix_success': 0.1,
+        'llm_fix_reserve': 0.5,
+    }
+    MIN_HISTORY = 3  # attempts of an error class before its success rate is trusted
+    DEFAULT_FIX_TOKENS = 4000
+
+    def __init__(self, **limits):
+        self.limits = dict(self.DEFAULTS, **{k: v for k, v in limits.items() if k in self.DEFAULTS})
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.history = {}  # error_class -> {'attempts', 'successes', 'tokens'} (stored + this session)
+        self.stats = {}    # same, this session only (see pop_stats)
+        self.begin_batch()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**{k: config[k] for k in cls.DEFAULTS if k in config})
+
+    # --- scopes ---
+    def begin_batch(self, label="batch"):
+        with self.lock:
+            self.batch = {'label': label, 'tokens': 0, 'seconds': 0.0, 'calls': 0, 'denied': 0, 'skipped': 0, 'papers': []}
+
+    def begin_paper(self, doc_id):
+        self._local.paper = {'doc_id': doc_id, 'tokens': 0, 'seconds': 0.0, 'calls': 0, 'denied': 0, 'skipped': 0}
+
+    def end_paper(self):
+        """Close the calling thread's paper account and return it"""
+        paper = getattr(self._local, 'paper', None)
+        self._local.paper = None
+        if paper:
+            with self.lock:
+                self.batch['papers'].append(paper)
+        return paper
+
+    def _paper(self):
+        return getattr(self._local, 'paper', None)
+
+    def current_paper(self):
+        return self._paper()
+
+    def attach_paper(self, paper):
+        """Charge the calling helper thread's calls to a paper account opened on another thread"""
+        self._local.paper = paper
+
+    def paper_tokens(self):
+        paper = self._paper()
+        return paper['tokens'] if paper else 0
+
+    # --- accounting ---
+    def charge(self, tokens, seconds):
+        paper = self._paper()
+        with self.lock:
+            for scope in filter(None, (paper, self.batch)):
+                scope['tokens'] += tokens
+                scope['seconds'] += seconds
+                scope['calls'] += 1
+
+    def _remaining(self):
+        """[(scope, fraction left)] for every limited scope"""
+        paper = self._paper()
+        out = []
+        for scope, account in (('paper', paper), ('batch', self.batch)):
+            if account is None:
+                continue
+            for unit, key in (('tokens', f'llm_{scope}_tokens'), ('seconds', f'llm_{scope}_seconds')):
+                limit = self.limits[key]
+                if limit:
+                    out.append((f"{scope} {unit}", (limit - account[unit]) / limit, limit - account[unit], unit))
+        return out
+
+    def check(self, estimated_tokens):
+        """Raise LLMBudgetExceeded if a call of about estimated_tokens would not fit"""
+        for name, fraction, left, unit in self._remaining():
+            if fraction <= 0 or (unit == 'tokens' and estimated_tokens > left):
+                self.deny()
+                raise LLMBudgetExceeded(f"LLM budget exhausted ({name}: {max(0, left):.0f} left, "
+                                        f"~{estimated_tokens} needed)")
+
+    def deny(self, skipped=False):
+        """Count a call refused by the budget, or with skipped=True one left out for its low success rate"""
+        key = 'skipped' if skipped else 'denied'
+        paper = self._paper()
+        with self.lock:
+            for scope in filter(None, (paper, self.batch)):
+                scope[key] += 1
+        METRICS.incr("llm_fix_skipped" if skipped else "llm_budget_denied")
+
+    # --- fix prioritization ---
+    def load_history(self, rows):
+        """rows: (error_class, attempts, successes, tokens) as stored by DataManager.record_llm_fix_stats"""
+        with self.lock:
+            self.history = {cls: {'attempts': a, 'successes': s, 'tokens': t} for cls, a, s, t in rows}
+            for cls, c in self.stats.items():  # not yet persisted
+                h = self.history.setdefault(cls, {'attempts': 0, 'successes': 0, 'tokens': 0})
+                for k in h: h[k] += c[k]
+
+    def expected_success(self, error_class):
+        """Laplace-smoothed LLM fix success rate of error_class, None without enough history"""
+        h = self.history.get(error_class)
+        if not h or h['attempts'] < self.MIN_HISTORY:
+            return None
+        return (h['successes'] + 1) / (h['attempts'] + 2)
+
+    def unlikely_fix(self, error_class):
+        """True if LLM fixes of error_class succeed less often than llm_min_fix_success"""
+        p = self.expected_success(error_class)
+        return p is not None and p < self.limits['llm_min_fix_success']
+
+    def fix_cost(self, error_class):
+        """Average tokens of one fix call for error_class (all classes if it has no history)"""
+        h = self.history.get(error_class)
+        if h and h['attempts']:
+            return h['tokens'] // h['attempts']
+        attempts = sum(c['attempts'] for c in self.history.values())
+        return sum(c['tokens'] for c in self.history.values()) // attempts if attempts else self.DEFAULT_FIX_TOKENS
+
+    def fix_attempts(self, error_class):
+        """LLM fix attempts a failing table with this error class gets"""
+        p = self.expected_success(error_class)
+        cap = self.limits['llm_fix_attempts']
+        if p is None:
+            return cap
+        if self.unlikely_fix(error_class):
+            return 0
+        return max(1, min(cap, round(cap * p + 0.5)))
+
+    def allow_fix(self, error_class):
+        """(allowed, reason) for one more LLM fix call on error_class"""
+        p = self.expected_success(error_class)
+        if self.unlikely_fix(error_class):
+            return False, f"LLM fixes of {error_class} succeed {p:.0%} of the time"
+        cost = self.fix_cost(error_class)
+        floor = self.limits['llm_fix_reserve'] * (1 - (0.5 if p is None else p))
+        for name, fraction, left, unit in self._remaining():
+            if unit == 'tokens' and cost > left:
+                return False, f"{name} budget left ({max(0, left):.0f}) below a fix call (~{cost})"
+            if fraction <= floor:
+                return False, f"{name} below {floor:.0%}, kept for likelier fixes"
+        return True, ""
+
+    def record_fix(self, error_class, success, tokens):
+        with self.lock:
+            for table in (self.stats, self.history):
+                c = table.setdefault(error_class, {'attempts': 0, 'successes': 0, 'tokens': 0})
+                c['attempts'] += 1
+                c['successes'] += int(success)
+                c['tokens'] += tokens
+
+    def pop_stats(self):
+        """Fix outcomes recorded since last call (for DataManager.record_llm_fix_stats), reset them"""
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def report(self):
+        """Spend of the current batch and its finished papers"""
+        with self.lock:
+            return {'limits': dict(self.limits), 'batch': dict(self.batch, papers=list(self.batch['papers']))}
+
+def format_llm_spend(account):
+    return (f"{account['calls']} LLM calls, {account['tokens']} tokens, {account['seconds']:.1f}s"
+            + (f", {account['denied']} denied by budget" if account['denied'] else "")
+            + (f", {account['skipped']} skipped (low fix success)" if account.get('skipped') else ""))
+
+class ModelRouter:
+    """Which provider/model serves each LLM stage, tried cheapest first.
+
+    Routes come from api_config['routes'] (config key llm_routes), e.g.
+    {"extract": ["gpt-4o-mini", "gpt-4o"], "fix": [{"provider": "Google", "model": "gemini-1.5-pro"}]};
+    a tier is a model name or a dict overriding provider/model/base_url/api_key of
+    api_config. A stage without routes uses api_config itself as its only tier.
+    Per-tier calls, successes, latency and tokens are kept for tuning (pop_stats).
+    """
+    STAGES = ("extract", "fix")
+    TIER_KEYS = ("provider", "model", "base_url", "api_key")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # (stage, label) -> {'tier', 'calls', 'successes', 'seconds', 'tokens'}
+
+    def tiers(self, api_config, stage):
+        """[(label, api_config for that tier)] in escalation order"""
+        routes = (api_config.get('routes') or {}).get(stage) or [{}]
+        out = []
+        for tier in routes:
+            if isinstance(tier, str):
+                tier = {'model': tier}
+            cfg = dict(api_config, **{k: v for k, v in tier.items() if k in self.TIER_KEYS and v})
+            out.append((f"{cfg.get('provider', 'OpenAI')}/{cfg.get('model', '')}", cfg))
+        return out
+
+    def record(self, stage, tier, label, success, seconds, tokens):
+        with self.lock:
+            c = self.stats.setdefault((stage, label), {'tier': tier, 'calls': 0, 'successes': 0,
+                                                       'seconds': 0.0, 'tokens': 0})
+            c['calls'] += 1
+            c['successes'] += int(success)
+            c['seconds'] += seconds
+            c['tokens'] += tokens
+
+    def pop_stats(self):
+        """Counters since last call (for DataManager.record_tier_stats), reset them"""
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+class ExtractionCancelled(Exception):
+    """Raised inside a run once CoreLogic.cancel() was called; the job stays resumable"""
+
+class SpeculationCancelled(ExtractionCancelled):
+    """Raised in a speculative repair (and the chain racing it) once another candidate compiled"""
+
+class RepairRace:
+    """Speculative repairs of one failing table (CoreLogic.render_latex with speculative_fixes).
+
+    Candidate repairs run on threads of their own next to the sequential chain of
+    the calling thread. The first successful compile claims the race; the engines
+    of all other participants are killed and their next step raises
+    SpeculationCancelled (see CoreLogic.check_cancelled).
+    """
+
+    def __init__(self):
+        self.lost = threading.Event()
+        self.lock = threading.Lock()
+        self.winner = None  # (img_path, method)
+        self.llm_attempts = 0
+        self.futures = []
+        self._pool = None
+
+    def claim(self, img_path, method):
+        """True if this result won; a late result's image is deleted"""
+        with self.lock:
+            if self.winner is None:
+                self.winner = (img_path, method)
+                self.lost.set()
+                return True
+        try: os.remove(img_path)
+        except OSError: pass
+        return False
+
+    def submit(self, fn, *args):
+        import concurrent.futures
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="repair")
+        self.futures.append(self._pool.submit(fn, *args))
+
+    def wait(self):
+        """Block until every candidate finished, return the winner or None"""
+        import concurrent.futures
+        for future in concurrent.futures.as_completed(self.futures):
+            error = future.exception()
+            if isinstance(error, ExtractionCancelled) and not isinstance(error, SpeculationCancelled):
+                raise error
+        return self.winner
+
+    def close(self):
+        """Stop the losers without waiting: a killed engine or dropped LLM call ends within ~0.25 s on its own"""
+        self.lost.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
 class CoreLogic:
+    # Failures not caused by the table (compile limits, no engine): no rule or LLM edit can fix them
+    RESOURCE_FAILURES = ('timeout', 'resource_limit', 'engine_missing')
+    MINIMAL_PACKAGES = ('xcolor', 'booktabs', 'multirow', 'graphicx', 'array', 'amsmath', 'amssymb')
+    # Total size of the PNGs kept per render hash. A table's failed attempts never reach the
+    # rasterizer, so hits come from the same page compiling again: re-extracted or resumed papers,
+    # tables repeated within or across papers when dedup is off
+    RASTER_CACHE_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, compile_timeout=60, compile_memory_mb=0, backend=None, policy=None, speculative_fixes=False):
+        self.error_fixer = ErrorFixer()
+        self.policy = policy or LLMPolicy()  # LLM token/time budgets and fix prioritization
+        self.router = ModelRouter()  # per-stage model tiers
+        self.backend = backend or get_backend("auto")
+        self.compile_timeout = compile_timeout  # wall-clock seconds per engine run
+        # Address-space cap per engine run (Linux only), 0 = none: engines that map large
+        # formats/bundles (Tectonic, LuaTeX) need far more virtual than resident memory
+        self.compile_memory_mb = compile_memory_mb
+        self.cancel_event = threading.Event()
+        self.speculative_fixes = speculative_fixes  # race candidate repairs on first failure (RepairRace)
+        self._race = threading.local()  # RepairRace the calling thread takes part in
+        self._rasters = collections.OrderedDict()  # render hash -> PNG bytes, least recently used first
+        self._raster_bytes = 0
+        self._raster_lock = threading.Lock()
+        print(f"[BACKEND] {self.backend.name}: {self.backend.executable or 'not installed'}")
+
+    @classmethod
+    def from_config(cls, config):
+        backend = get_backend(config.get("compile_backend", "auto"))
+        if config.get("package_index", True):
+            backend.use_package_index(package_index_path(config))
+        return cls(compile_timeout=config.get("compile_timeout", 60),
+                   compile_memory_mb=config.get("compile_memory_mb", 0),
+                   backend=backend, policy=LLMPolicy.from_config(config),
+                   speculative_fixes=config.get("speculative_fixes", False))
+
+    def cancel(self):
+        """Abort the current paper: the running compile is killed, pending compiles and LLM calls raise"""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ExtractionCancelled("Extraction cancelled")
+        race = getattr(self._race, 'current', None)
+        if race is not None and race.lost.is_set():
+            raise SpeculationCancelled("Another repair compiled first")
+
+    def _aborted(self):
+        race = getattr(self._race, 'current', None)
+        return self.cancel_event.is_set() or (race is not None and race.lost.is_set())
+
+    @timed("fetch")
     def fetch_arxiv_source(self, arxiv_id):
+        import requests
         url = f"https://arxiv.org/e-print/{arxiv_id}"
-        response = requests.get(url)
+        response = self._cancellable(requests.get, url)
         if response.status_code != 200: raise Exception("Failed to download arXiv source")
+        METRICS.incr("fetch_bytes", len(response.content))
         
         source_code = ""
         try:
@@ -142,9 +2643,9 @@ class CoreLogic:
         except: source_code = response.content.decode('utf-8', errors='ignore')
         return source_code
 
+    @timed("pre_scan")
     def pre_scan_tables(self, source_code):
         """Pre-scan source code with regex, looking only for native Table environments (table, table*, sidewaystable, longtable)"""
-        import re
         # Only match native table wrapper environments, not standalone tabulars nested inside figure etc.
         env_pattern = re.compile(
             r'\\begin\{(table\*?|sidewaystable\*?|longtable\*?|supertabular\*?)\}'
@@ -168,20 +2669,38 @@ class CoreLogic:
                 if lab_m:
                     label = lab_m.group(1)
                 
+                # Span up to the matching \end{env}, fingerprinted for incremental re-extraction
+                end_pattern = '\\end{' + env_name + '}'
+                end_line = line_no
+                for j in range(line_no - 1, len(lines)):
+                    if end_pattern in lines[j] and (j > line_no - 1 or lines[j].find(end_pattern) > m.start()):
+                        end_line = j + 1
+                        break
+                span = '\n'.join(lines[line_no-1:end_line])
+                
                 results.append({
                     'env': env_name,
                     'line': line_no,
+                    'end_line': end_line,
                     'caption': caption,
                     'label': label,
+                    'fingerprint': latex_fingerprint(span),
                 })
         
         return results
 
-    def extract_and_analyze(self, api_key, base_url, source_code, provider="OpenAI", model="gpt-3.5-turbo", clean_mode=False, clean_char="-"):
-        cleaning_instruction = ""
-        if clean_mode:
-            cleaning_instruction = f"Replace all specific numerical values in the table cells with '{clean_char}', but strictly preserve the headers, captions, and structural integrity."
+    def match_scan_entry(self, scan_results, source_line):
+        """Pre-scan entry an LLM-reported source_line belongs to (containing span, else nearest start)"""
+        if not scan_results or not isinstance(source_line, int):
+            return None
+        for r in scan_results:
+            if r['line'] <= source_line <= r['end_line']:
+                return r
+        return min(scan_results, key=lambda r: abs(r['line'] - source_line))
 
+    @timed("llm_extract")
+    def extract_and_analyze(self, api_key, base_url, source_code, provider="OpenAI", model="gpt-3.5-turbo", routes=None):
+        # Tables are always extracted verbatim; clean mode is applied locally (clean_table_code)
         # === Regex Pre-scan ===
         scan_results = self.pre_scan_tables(source_code)
         scan_count = len(scan_results)
@@ -220,9 +2739,6 @@ Before finalizing your output, COUNT your extracted tables and compare with the
 - If you have FEWER tables than pre-scan, re-examine the source for missed tables.
 - If tables are genuinely duplicated or empty, you may skip them, but note this in a brief comment.
 
-### Data Cleaning:
-{cleaning_instruction}
-
 ### CRITICAL Output Construction Rules:
 For each table, generate a **valid, independently compilable** standalone LaTeX document.
 
@@ -255,50 +2771,43 @@ Return a JSON object:
 """
         
         content_input = source_code[:100000]
-
-        if provider == "Google":
+        api_config = {'api_key': api_key, 'base_url': base_url, 'provider': provider, 'model': model, 'routes': routes}
+        # Cheapest tier first; escalate on an API error, invalid JSON or fewer tables than the pre-scan found
+        tiers = self.router.tiers(api_config, "extract")
+        tables = None
+        for level, (label, tier_cfg) in enumerate(tiers):
+            last = level == len(tiers) - 1
+            started, spent_before = time.perf_counter(), self.policy.paper_tokens()
             try:
-                import google.generativeai as genai
-                genai.configure(api_key=api_key)
-                gemini_model = genai.GenerativeModel(model if model else "gemini-pro")
-                response = gemini_model.generate_content(f"{system_prompt}\n\nUser Content:\n{content_input}")
-                text_res = response.text
-                if "```json" in text_res:
-                    text_res = text_res.split("```json")[1].split("```")[0]
-                elif "```" in text_res:
-                    text_res = text_res.split("```")[1].split("```")[0]
-                tables = json.loads(text_res).get('tables', [])
-            except ImportError:
-                 raise Exception("Please install google-generativeai library or use Compatible mode")
+                content = self._call_llm(tier_cfg, system_prompt, content_input, json_mode=True)
+                if "```json" in content:
+                    content = content.split("```json")[1].split("```")[0]
+                elif "```" in content:
+                    content = content.split("```")[1].split("```")[0]
+                try:
+                    tier_tables = json.loads(content).get('tables', [])
+                except (json.JSONDecodeError, AttributeError):
+                    print(f"JSON Parse Error ({label}). Raw Content:\n{content}")
+                    raise Exception("Model returned invalid JSON. Check console for details.")
+            except (ExtractionCancelled, LLMBudgetExceeded):
+                raise
             except Exception as e:
-                raise Exception(f"Google API Error: {str(e)}")
-
-        else:
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key, base_url=base_url)
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": content_input}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-                
-            try:
-                data = json.loads(content)
-                tables = data.get('tables', [])
-            except json.JSONDecodeError:
-                print(f"JSON Parse Error. Raw Content:\n{content}")
-                raise Exception("Model returned invalid JSON. Check console for details.")
+                self.router.record("extract", level, label, False, time.perf_counter() - started,
+                                   self.policy.paper_tokens() - spent_before)
+                if last and tables is None:
+                    raise
+                if not last:
+                    print(f"[ROUTE] extract: {label} failed ({str(e)[:120]}), escalating")
+                continue
+            complete = len(tier_tables) >= scan_count
+            self.router.record("extract", level, label, complete, time.perf_counter() - started,
+                               self.policy.paper_tokens() - spent_before)
+            if tables is None or len(tier_tables) > len(tables):
+                tables = tier_tables
+            if complete:
+                break
+            if not last:
+                print(f"[ROUTE] extract: {label} returned {len(tier_tables)}/{scan_count} tables, escalating")
 
         # === Post-extraction Verification ===
         extracted_count = len(tables)
@@ -337,9 +2846,106 @@ Return a JSON object:
         'pdflscape', 'lscape', 'afterpage',
     }
 
+    # Failure taxonomy: (error class, pattern) checked in order against each error line.
+    # Named groups 'macro' / 'package' are picked up into the diagnostic when present.
+    ERROR_TAXONOMY = [
+        ('timeout', r'Compilation timed out'),
+        ('engine_missing', r'No TeX engine found'),
+        ('resource_limit', r'memory allocation of \d+ bytes failed|Cannot allocate memory|[Oo]ut of memory'),
+        ('missing_file', r"File `(?P<package>[^']+)\.(?:sty|cls|tex|def)' not found"),
+        ('undefined_macro', r'Undefined control sequence'),
+        ('undefined_environment', r'Environment (?P<macro>[A-Za-z@*]+) undefined'),
+        ('undefined_color', r"Undefined color [`'](?P<macro>[^']+)'"),
+        ('unknown_column', r'Illegal pream-token|Unknown column type'),
+        ('caption_outside_float', r'\\caption outside float'),
+        ('misplaced_noalign', r'Misplaced \\noalign'),
+        ('misplaced_alignment', r'Misplaced alignment tab|Extra alignment tab'),
+        ('missing_dollar', r'Missing \$ inserted'),
+        ('already_defined', r'Command (?P<macro>\\[A-Za-z@]+) already defined'),
+        ('option_clash', r'Option clash for package (?P<package>[A-Za-z0-9@_-]+)'),
+        ('unbalanced_braces', r'Missing \} inserted|Extra \}|Runaway argument|Missing \{ inserted'),
+        ('package_error', r'Package (?P<package>[A-Za-z0-9@_-]+) Error'),
+        ('font_error', r'Font .* not loadable|Unable to find font'),
+        ('emergency_stop', r'Emergency stop'),
+    ]
+
+    def parse_compile_log(self, output, full_tex=""):
+        """Turn Tectonic output into structured diagnostics.
+
+        Returns a list of dicts: error_class, message, macro, package, tex_line, body_line.
+        tex_line refers to the generated .tex, body_line to the table body after \\begin{document}.
+        """
+        body_start = None
+        for i, line in enumerate(full_tex.split('\n'), 1):
+            if line.strip() == '\\begin{document}':
+                body_start = i
+                break
+
+        lines = output.split('\n')
+        diagnostics = []
+        seen = set()
+        for idx, line in enumerate(lines):
+            text = line.strip()
+            if text.startswith('!'):
+                message = text.lstrip('! ').strip()
+            elif text.startswith('error:'):
+                message = text[len('error:'):].strip()
+            else:
+                continue
+            # Tectonic's own epilogue lines carry no information about the cause
+            if message.startswith('halted on') or 'See the LaTeX manual' in message:
+                continue
+
+            tex_line = None
+            loc = re.match(r'[^:\s]+\.tex:(\d+):\s*(.*)', message)
+            if loc:
+                tex_line = int(loc.group(1))
+                message = loc.group(2)
+
+            diag = {'error_class': 'other', 'message': message[:300], 'macro': None,
+                    'package': None, 'tex_line': tex_line, 'body_line': None}
+            for cls, pattern in self.ERROR_TAXONOMY:
+                m = re.search(pattern, message)
+                if m:
+                    diag['error_class'] = cls
+                    groups = m.groupdict()
+                    diag['macro'] = groups.get('macro')
+                    diag['package'] = groups.get('package')
+                    break
+
+            # TeX context lines following a "!" error: "l.12 ...\\foo"
+            for follow in lines[idx + 1:idx + 8]:
+                ctx = re.match(r'l\.(\d+) (.*)', follow.strip())
+                if ctx:
+                    if diag['tex_line'] is None:
+                        diag['tex_line'] = int(ctx.group(1))
+                    if diag['error_class'] == 'undefined_macro' and not diag['macro']:
+                        mm = re.search(r'(\\[A-Za-z@]+)\s*$', ctx.group(2))
+                        if mm: diag['macro'] = mm.group(1)
+                    break
+
+            if diag['error_class'] == 'undefined_macro' and not diag['macro'] and diag['tex_line'] and full_tex:
+                src_lines = full_tex.split('\n')
+                if diag['tex_line'] <= len(src_lines):
+                    found = re.findall(r'\\[A-Za-z@]+', src_lines[diag['tex_line'] - 1])
+                    if len(found) == 1: diag['macro'] = found[0]
+
+            if diag['tex_line'] and body_start and diag['tex_line'] > body_start:
+                diag['body_line'] = diag['tex_line'] - body_start
+
+            key = (diag['error_class'], diag['macro'], diag['package'], diag['tex_line'])
+            if key in seen:
+                continue
+            seen.add(key)
+            diagnostics.append(diag)
+
+        if not diagnostics:
+            diagnostics.append({'error_class': 'no_output', 'message': output.strip()[-300:], 'macro': None,
+                                'package': None, 'tex_line': None, 'body_line': None})
+        return diagnostics
+
     def extract_source_preamble(self, source_code):
         """Extract reusable preamble elements from original LaTeX source"""
-        import re
         packages = []   # (full_match, pkg_name, options)
         definitions = [] # Color definitions, custom commands, etc.
 
@@ -377,10 +2983,47 @@ Return a JSON object:
         for m in re.finditer(r'\\def\\[a-zA-Z]+\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', source_code):
             definitions.append(m.group(0))
 
-        return packages, definitions
+        return packages, definitions
+
+    @timed("render")
+    def render_latex(self, latex_code, source_packages=None, source_definitions=None, api_config=None, original_source=None, status_cb=None, attempt_log=None):
+        """Compile a table to a PNG, repairing it if needed; returns (img_path, method)"""
+        try:
+            return self._render_latex(latex_code, source_packages, source_definitions, api_config, original_source,
+                                      status_cb, attempt_log)
+        except SpeculationCancelled:
+            # A speculative repair compiled while this thread's chain was still running
+            return self._race.current.winner
+        finally:
+            race = getattr(self._race, 'current', None)
+            if race is not None:
+                self._race.current = None
+                race.close()
+
+    def render_cleaned(self, full_tex, clean_char="-"):
+        """PNG of a document that compiled, with its table values blanked (clean mode); None if it fails"""
+        success, img_path, error_msg, _ = self._compile_tex(clean_table_code(full_tex, clean_char))
+        if not success:
+            print(f"[CLEAN] Cleaned table did not compile: {error_msg[:200]}")
+            return None
+        return img_path
 
-    def render_latex(self, latex_code, source_packages=None, source_definitions=None, api_config=None, original_source=None, status_cb=None):
-        import re
+    def _render_latex(self, latex_code, source_packages, source_definitions, api_config, original_source, status_cb, attempt_log):
+        log_lock = threading.Lock()  # speculative repairs record from their own threads
+        
+        def _record(stage, tex, success, error_msg, render_hash=None):
+            """Append one compile attempt (with parsed diagnostics) to attempt_log"""
+            if attempt_log is None: return
+            diagnostics = [] if success else self.parse_compile_log(error_msg, tex)
+            with log_lock:
+                attempt_log.append({
+                    'attempt': len(attempt_log) + 1,
+                    'stage': stage,
+                    'success': success,
+                    'diagnostics': diagnostics,
+                    'render_hash': render_hash,
+                    'tex': tex if success else None,
+                })
         
         # === Step 1: Thoroughly clean model output, keep only document body ===
         # Extract content between \begin{document}...\end{document}
@@ -432,6 +3075,12 @@ Return a JSON object:
                     seen_pkgs.add(pkg_name)
                     pkg_entries.append((opts, pkg_name))
         
+        # Packages the backend reports as not installed would each cost a "File not found" retry
+        unavailable = [p for _, p in pkg_entries if not self.backend.has_package(p)]
+        if unavailable:
+            print(f"[BACKEND] Not available on {self.backend.name}, skipped: {unavailable}")
+            pkg_entries = [(opts, p) for opts, p in pkg_entries if p not in unavailable]
+        
         # === Step 3: Color definitions and custom commands from source ===
         def_lines = []
         if source_definitions:
@@ -470,73 +3119,137 @@ Return a JSON object:
             "\\providecommand{\\xmark}{\\ding{55}}",
         ]
         
-        # === Step 6: Auto-retry compilation (auto-strip package on File not found) ===
+        # === Step 6: Auto-retry compilation (auto-strip package on File not found, then rule-based rewrites) ===
         max_retries = 10
         local_blacklist = set()
+        fix_state = {'defs': def_lines, 'body': doc_body}
+        applied_rules = []
+        stage = "direct"
         last_full_tex = ""
         last_error_msg = ""
+        resource_failure = False
+        race = None  # RepairRace of the speculative candidates, started on the first failure
         _sc = status_cb or (lambda msg: None)  # status callback shorthand
         
-        for attempt in range(max_retries + 1):
-            # Filter out packages banned in this round
-            pkg_lines = []
-            for opts, pkg_name in pkg_entries:
-                if pkg_name not in local_blacklist:
-                    pkg_lines.append(f"\\usepackage{opts}{{{pkg_name}}}")
-            
-            # Assemble complete .tex file
-            full_tex = (
+        def _assemble(packages, defs, body):
+            """Complete standalone .tex file"""
+            return (
                 "\\documentclass[preview]{standalone}\n"
-                + "\n".join(pkg_lines) + "\n"
-                + "\n".join(def_lines) + "\n"
+                + "\n".join(f"\\usepackage{opts}{{{pkg_name}}}" for opts, pkg_name in packages) + "\n"
+                + "\n".join(defs) + "\n"
                 + "\n".join(fallback_cmds) + "\n"
                 + "\\begin{document}\n"
-                + doc_body + "\n"
+                + body + "\n"
                 + "\\end{document}\n"
             )
+        
+        for attempt in range(max_retries + 1):
+            # Filter out packages banned in this round
+            full_tex = _assemble([(opts, p) for opts, p in pkg_entries if p not in local_blacklist],
+                                 fix_state['defs'], fix_state['body'])
             
             _sc("⚙️ Compiling...")
-            success, img_path, error_msg = self._compile_tex(full_tex)
+            success, img_path, error_msg, render_hash = self._compile_tex(full_tex)
             if success:
-                method = "AUTO" if local_blacklist else "DIRECT"
+                method = "RULE" if applied_rules else ("AUTO" if local_blacklist else "DIRECT")
+                if race is not None and not race.claim(img_path, method):
+                    raise SpeculationCancelled("Another repair compiled first")
+                _record(stage, full_tex, success, error_msg, render_hash)
                 if local_blacklist:
                     print(f"[AUTO-FIX] Automatically removed unusable packages: {local_blacklist}")
+                if applied_rules:
+                    self.error_fixer.record_success(applied_rules)
+                    print(f"[RULE-FIX] Fixed by rules: {list(dict.fromkeys(applied_rules))}")
                 return img_path, method
+            _record(stage, full_tex, success, error_msg)
             
             last_full_tex = full_tex
             last_error_msg = error_msg
+            error_class = self.parse_compile_log(error_msg, full_tex)[0]['error_class']
+            if error_class in self.RESOURCE_FAILURES:
+                print(f"[LIMIT] {error_class}: not fixable by editing the table, skipping further fixes")
+                resource_failure = True
+                break
+            if attempt == 0 and self.speculative_fixes:
+                # This thread goes on with the sequential auto/rule chain, racing the candidates
+                race = self._start_repair_race(
+                    pkg_entries, essential, fix_state, full_tex, error_msg, error_class, _assemble, _record,
+                    api_config, original_source)
+                _sc(f"🏁 Racing {len(race.futures)} repair candidates...")
             
             # Match "File `xxx.sty' not found" or "File `xxx.cls' not found"
             not_found = re.search(r"File `([^']+)\.(sty|cls)' not found", error_msg)
             if not_found and attempt < max_retries:
                 missing = not_found.group(1)
                 local_blacklist.add(missing)
+                self.backend.mark_missing(missing)  # later tables drop it before compiling
                 _sc(f"🔧 Auto-fix: removing '{missing}'")
                 print(f"[AUTO-FIX] Package '{missing}' unusable, auto-removing and retrying (attempt {attempt+1}/{max_retries})")
-                import time; time.sleep(0.01)
+                METRICS.incr("auto_fix_retries")
+                time.sleep(0.01)
+                stage = "auto"
+                continue
+            
+            # Known error patterns -> local rewrite, no LLM call needed
+            rules = self.error_fixer.apply(error_msg, fix_state, full_tex)
+            if rules and attempt < max_retries:
+                applied_rules.extend(rules)
+                _sc(f"🔧 Rule-fix: {', '.join(rules)}")
+                print(f"[RULE-FIX] Applied {rules}, retrying (attempt {attempt+1}/{max_retries})")
+                METRICS.incr("rule_fix_retries")
+                stage = "rule"
                 continue
             
-            break  # Non-File-not-found error -> break to enter LLM fix stage
+            break  # No local fix applies -> break to enter LLM fix stage
+        
+        if race is not None and race.wait():
+            img_path, method = race.winner
+            return img_path, method
         
-        # === Step 7: LLM assisted fix (max 3 times) ===
-        if api_config and original_source:
-            print(f"[LLM-FIX] Auto-retry failed, starting LLM assisted fix...")
+        # === Step 7: LLM assisted fix (attempts and spend decided by self.policy) ===
+        if api_config and original_source and not resource_failure:
             current_tex = last_full_tex
             current_error = last_error_msg
+            current_class = error_class
+            max_llm = self.policy.fix_attempts(current_class)
+            spent_attempts = race.llm_attempts if race is not None else 0  # the speculative LLM fix
+            fix_tiers = self.router.tiers(api_config, "fix")
+            p = self.policy.expected_success(current_class)
+            print(f"[LLM-FIX] Auto-retry failed, starting LLM assisted fix ({max_llm} attempt(s) for {current_class}, "
+                  f"past success {'n/a' if p is None else f'{p:.0%}'})")
             
-            for llm_attempt in range(1, 4):  # Max 3 times
-                _sc(f"🤖 LLM Fix ({llm_attempt}/3)...")
-                print(f"[LLM-FIX] LLM fix attempt {llm_attempt}/3...")
+            for llm_attempt in range(1 + spent_attempts, max_llm + 1):
+                allowed, reason = self.policy.allow_fix(current_class)
+                if not allowed:
+                    print(f"[BUDGET] LLM fix skipped: {reason}")
+                    # Past failures lowered the success rate below the floor: a policy skip, not a budget denial
+                    self.policy.deny(skipped=self.policy.unlikely_fix(current_class))
+                    break
+                # One attempt per tier, the last (strongest) tier takes the remaining attempts
+                level = min(llm_attempt, len(fix_tiers)) - 1
+                tier_label, tier_cfg = fix_tiers[level]
+                _sc(f"🤖 LLM Fix ({llm_attempt}/{max_llm})...")
+                print(f"[LLM-FIX] LLM fix attempt {llm_attempt}/{max_llm} ({tier_label})...")
+                METRICS.incr("llm_fix_retries")
+                spent_before = self.policy.paper_tokens()
+                started = time.perf_counter()
                 try:
-                    fixed_tex = self.llm_fix_latex(
-                        api_config, original_source, current_tex, current_error
-                    )
+                    fixed_tex = self._llm_fix_tex(tier_cfg, original_source, current_tex, current_error)
                     if not fixed_tex:
                         print(f"[LLM-FIX] LLM returned empty content, skipping")
-                        break
+                        self.policy.record_fix(current_class, False, self.policy.paper_tokens() - spent_before)
+                        self.router.record("fix", level, tier_label, False, time.perf_counter() - started,
+                                           self.policy.paper_tokens() - spent_before)
+                        if level == len(fix_tiers) - 1:
+                            break
+                        continue
                     
                     _sc(f"⚙️ Recompiling (LLM fix {llm_attempt})...")
-                    success, img_path, error_msg = self._compile_tex(fixed_tex)
+                    success, img_path, error_msg, render_hash = self._compile_tex(fixed_tex)
+                    _record("llm", fixed_tex, success, error_msg, render_hash)
+                    self.policy.record_fix(current_class, success, self.policy.paper_tokens() - spent_before)
+                    self.router.record("fix", level, tier_label, success, time.perf_counter() - started,
+                                       self.policy.paper_tokens() - spent_before)
                     if success:
                         print(f"[LLM-FIX] ✅ LLM fix attempt {llm_attempt} successful!")
                         return img_path, f"LLM-{llm_attempt}"
@@ -544,12 +3257,24 @@ Return a JSON object:
                     print(f"[LLM-FIX] Compilation still failed after LLM fix attempt {llm_attempt}")
                     current_tex = fixed_tex
                     current_error = error_msg
-                    
-                except Exception as llm_err:
-                    print(f"[LLM-FIX] LLM call error: {str(llm_err)[:200]}")
+                    current_class = self.parse_compile_log(error_msg, fixed_tex)[0]['error_class']
+                    if current_class in self.RESOURCE_FAILURES:
+                        print(f"[LIMIT] {current_class}: not fixable by editing the table, skipping further fixes")
+                        break
+
+                except ExtractionCancelled:
+                    raise
+                except LLMBudgetExceeded as budget_err:
+                    print(f"[BUDGET] {budget_err}")
                     break
+                except Exception as llm_err:
+                    print(f"[LLM-FIX] LLM call error ({tier_label}): {str(llm_err)[:200]}")
+                    self.router.record("fix", level, tier_label, False, time.perf_counter() - started,
+                                       self.policy.paper_tokens() - spent_before)
+                    if level == len(fix_tiers) - 1:
+                        break
             
-            print(f"[LLM-FIX] ❌ All 3 LLM fix attempts failed, abandoning this table")
+            print(f"[LLM-FIX] ❌ LLM fix attempts exhausted, abandoning this table")
         
         # Final failure -> print debug info and raise exception
         lines_list = last_full_tex.split('\n')
@@ -560,40 +3285,511 @@ Return a JSON object:
             print(f"  {i:3d}: {line}")
         print(f"{'='*60}")
         print(f"[DEBUG] 最终 Tectonic Error: {last_error_msg[:500]}")
+        primary = self.parse_compile_log(last_error_msg, last_full_tex)[0]
+        print(f"[DEBUG] Failure class: {primary['error_class']}"
+              f"  macro={primary['macro']}  package={primary['package']}  body_line={primary['body_line']}")
         print(f"{'='*60}\n")
-        raise Exception(f"Compilation failed: {last_error_msg[:500]}...")
+        raise Exception(f"Compilation failed [{primary['error_class']}]: {last_error_msg[:500]}...")
+
+    def _llm_fix_tex(self, tier_cfg, original_source, failed_tex, error_msg):
+        """One LLM repair of failed_tex: an edit patch in patch mode, else (or if it does not apply) a full rewrite"""
+        fixed_tex = None
+        if tier_cfg.get('fix_mode', 'patch') == 'patch':
+            fixed_tex = self.llm_fix_latex_patch(tier_cfg, failed_tex, error_msg)
+            if not fixed_tex:
+                print(f"[LLM-FIX] Patch not applicable, falling back to full regeneration")
+        if not fixed_tex:
+            fixed_tex = self.llm_fix_latex(tier_cfg, original_source, failed_tex, error_msg)
+        return fixed_tex
+
+    def _start_repair_race(self, pkg_entries, essential, fix_state, failed_tex, failed_error, failed_class,
+                           assemble, record, api_config, original_source):
+        """Launch the speculative candidates for a table whose first compile failed.
+
+        Candidates: the document with only the essential packages (source packages
+        stripped), a minimal preamble (MINIMAL_PACKAGES, color definitions only) and,
+        if the budget allows, one LLM fix of the first fix tier. The calling thread
+        keeps running the auto/rule chain as the fourth participant.
+        """
+        race = RepairRace()
+        self._race.current = race
+        run = METRICS.current_run()
+        essential_names = {p for _, p in essential}
+        stripped = [(opts, p) for opts, p in pkg_entries if p in essential_names]
+        minimal = [(opts, p) for opts, p in stripped if p in self.MINIMAL_PACKAGES]
+        color_defs = [d for d in fix_state['defs'] if re.match(r'\\(?:definecolor|colorlet)\b', d)]
+        variants = [("minimal", "MINIMAL", assemble(minimal, color_defs, fix_state['body']))]
+        if len(stripped) < len(pkg_entries):
+            variants.insert(0, ("strip", "STRIP", assemble(stripped, fix_state['defs'], fix_state['body'])))
+
+        def compile_variant(stage, method, tex):
+            self._race.current = race
+            METRICS.attach(run)
+            try:
+                success, img_path, error_msg, render_hash = self._compile_tex(tex)
+                won = success and race.claim(img_path, method)
+                if not won and race.lost.is_set():
+                    return  # decided by another participant meanwhile
+                record(stage, tex, success, error_msg, render_hash)
+                if success:
+                    METRICS.incr("speculative_wins")
+                    print(f"[SPECULATIVE] {method} variant compiled first")
+            except SpeculationCancelled:
+                pass
+            finally:
+                self._race.current = None
+                METRICS.attach(None)
+
+        def llm_fix(paper, tier_label, tier_cfg):
+            self._race.current = race
+            self.policy.attach_paper(paper)
+            METRICS.attach(run)
+            spent_before = self.policy.paper_tokens()
+            started = time.perf_counter()
+            try:
+                success = False
+                fixed_tex = self._llm_fix_tex(tier_cfg, original_source, failed_tex, failed_error)
+                if fixed_tex:
+                    success, img_path, error_msg, render_hash = self._compile_tex(fixed_tex)
+                    won = success and race.claim(img_path, "LLM-1")
+                    if not won and race.lost.is_set():
+                        return
+                    record("llm", fixed_tex, success, error_msg, render_hash)
+                spent = self.policy.paper_tokens() - spent_before
+                self.policy.record_fix(failed_class, success, spent)
+                self.router.record("fix", 0, tier_label, success, time.perf_counter() - started, spent)
+                if success:
+                    METRICS.incr("speculative_wins")
+                    print(f"[SPECULATIVE] LLM fix compiled first ({tier_label})")
+            except SpeculationCancelled:
+                pass
+            except LLMBudgetExceeded as budget_err:
+                print(f"[BUDGET] {budget_err}")
+            except ExtractionCancelled:
+                raise
+            except Exception as llm_err:
+                print(f"[SPECULATIVE] LLM fix error ({tier_label}): {str(llm_err)[:200]}")
+            finally:
+                self._race.current = None
+                self.policy.attach_paper(None)
+                METRICS.attach(None)
+
+        if api_config and original_source and self.policy.fix_attempts(failed_class) > 0:
+            allowed, reason = self.policy.allow_fix(failed_class)
+            if allowed:
+                race.llm_attempts = 1
+            else:
+                print(f"[BUDGET] Speculative LLM fix skipped: {reason}")
+        METRICS.incr("speculative_races")
+        print(f"[SPECULATIVE] Racing {[v[0] for v in variants] + ['llm'] * race.llm_attempts} against the rule chain")
+        for stage, method, tex in variants:
+            race.submit(compile_variant, stage, method, tex)
+        if race.llm_attempts:
+            METRICS.incr("llm_fix_retries")
+            race.submit(llm_fix, self.policy.current_paper(), *self.router.tiers(api_config, "fix")[0])
+        return race
 
+    @timed("compile")
     def _compile_tex(self, full_tex):
-        """Compile LaTeX code, return (success, img_path_or_None, error_msg)"""
-        temp_id = datetime.datetime.now().strftime("%f")
+        """Compile LaTeX code, return (success, img_path_or_None, error_msg, render_hash_or_None)"""
+        temp_id = uuid.uuid4().hex[:12]  # unique across parallel workers
         tex_file = f"temp_{temp_id}.tex"
         pdf_file = f"temp_{temp_id}.pdf"
         
         with open(tex_file, "w", encoding="utf-8") as f:
             f.write(full_tex)
         
-        result = subprocess.run(
-            [TECTONIC_PATH, tex_file],
-            capture_output=True,
-            creationflags=subprocess.CREATE_NO_WINDOW
-        )
+        log_file = f"temp_{temp_id}.log"
+        self.check_cancelled()
+        if not self.backend.available():
+            os.remove(tex_file)
+            return False, None, (f"! No TeX engine found for backend '{self.backend.name}' "
+                                 f"(install tectonic or latexmk+pdflatex, or set compile_backend)"), None
+        try:
+            result = self._run_engine(tex_file)
+        except subprocess.TimeoutExpired:
+            METRICS.incr("compile_attempts")
+            METRICS.incr("compile_timeouts")
+            for leftover in (tex_file, log_file, pdf_file):
+                try: os.remove(leftover)
+                except OSError: pass
+            return False, None, f"! Compilation timed out after {self.compile_timeout}s (engine killed)", None
+        except ExtractionCancelled:
+            for leftover in (tex_file, log_file, pdf_file):
+                try: os.remove(leftover)
+                except OSError: pass
+            raise
+        # The .log carries TeX's "! ..." / "l.NN" context that Tectonic's summary omits
+        tex_log = ""
+        if os.path.exists(log_file):
+            try:
+                with open(log_file, "r", encoding="utf-8", errors="ignore") as f:
+                    log_text = f.read()
+                first_err = log_text.find("\n!")
+                if first_err >= 0:
+                    tex_log = log_text[first_err:first_err + 4000]
+                os.remove(log_file)
+            except: pass
         
+        METRICS.incr("compile_attempts")
         if os.path.exists(pdf_file):
-            doc = fitz.open(pdf_file)
-            pix = doc[0].get_pixmap(dpi=300)
             img_path = f"temp_{temp_id}.png"
-            pix.save(img_path)
+            try:
+                render_hash = self._render_hash(pdf_file)
+            except Exception as e:
+                print(f"[RENDER] Could not hash PDF page, rasterizing: {e}")
+                render_hash = None
+            png = self._cached_raster(render_hash)
+            if png is not None:
+                # Same page as an earlier successful compile in this process
+                METRICS.incr("rasterize_reused")
+                with open(img_path, "wb") as f:
+                    f.write(png)
+            else:
+                with METRICS.timer("rasterize") as ev:
+                    ev['pdf_bytes'] = os.path.getsize(pdf_file)
+                    self._rasterize(pdf_file, img_path)
+                    ev['png_bytes'] = os.path.getsize(img_path)
+                self._cache_raster(render_hash, img_path)
             try:
                 os.remove(tex_file)
                 os.remove(pdf_file)
             except: pass
-            return True, img_path, ""
+            return True, img_path, "", render_hash
         
+        METRICS.incr("compile_failures")
         error_msg = result.stderr.decode('utf-8', errors='ignore') + "\n" + result.stdout.decode('utf-8', errors='ignore')
+        if tex_log:
+            error_msg += "\n" + tex_log
         try: os.remove(tex_file)
         except: pass
-        return False, None, error_msg
+        return False, None, error_msg, None
+
+    def _run_engine(self, tex_file):
+        """Run the compile backend on tex_file, return the CompletedProcess"""
+        try:
+            return self.backend.run(tex_file, self._run_limited)
+        finally:
+            self.backend.cleanup(tex_file[:-4])
+
+    def _run_limited(self, cmd):
+        """Run cmd in its own process group under the compile limits.
+
+        The whole group is killed when compile_timeout expires (raises
+        subprocess.TimeoutExpired) or when cancel() is called or a speculative
+        repair race is lost (raises ExtractionCancelled / SpeculationCancelled),
+        so helper processes spawned by the engine die too.
+        """
+        if os.name == "nt":
+            kwargs = {'creationflags': subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            kwargs = {'start_new_session': True}
+        # Limits are applied from outside once the process exists: preexec_fn is not safe
+        # in a process running other threads (GUI, importer workers, speculative repairs)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+        self._apply_rlimits(proc.pid)
+        deadline = time.monotonic() + self.compile_timeout if self.compile_timeout else None
+        while True:
+            try:
+                out, err = proc.communicate(timeout=0.25)
+                return subprocess.CompletedProcess(cmd, proc.returncode, out, err)
+            except subprocess.TimeoutExpired:
+                if not self._aborted() and (deadline is None or time.monotonic() < deadline):
+                    continue
+                self._kill_group(proc)
+                proc.communicate()
+                self.check_cancelled()
+                raise subprocess.TimeoutExpired(cmd, self.compile_timeout)
+
+    def _apply_rlimits(self, pid):
+        """Cap memory and CPU time of a started engine (Linux prlimit; elsewhere only the timeout applies)"""
+        try:
+            import resource
+            prlimit = resource.prlimit
+        except (ImportError, AttributeError):
+            return
+        limits = []
+        if self.compile_memory_mb:
+            limit = int(self.compile_memory_mb) * 1024 * 1024
+            limits.append((resource.RLIMIT_AS, (limit, limit)))
+        if self.compile_timeout:
+            cpu = int(self.compile_timeout) + 5  # backstop if the parent dies before killing the group
+            limits.append((resource.RLIMIT_CPU, (cpu, cpu)))
+        for which, limit in limits:
+            try:
+                prlimit(pid, which, limit)
+            except ProcessLookupError:
+                return  # already exited
+            except (OSError, ValueError) as e:
+                print(f"[COMPILE] Could not apply resource limit: {e}")
+
+    @staticmethod
+    def _kill_group(proc):
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True,
+                           creationflags=subprocess.CREATE_NO_WINDOW)
+        else:
+            import signal
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _render_hash(self, pdf_file):
+        """SHA-256 of what the first PDF page draws, independent of how the .tex got there.
+
+        Covers the page box, the decompressed content streams and the fonts, images
+        and forms they use (font subset tags stripped), but not the PDF metadata,
+        object numbers or resource names, so two compiles that differ only in
+        unused preamble lines hash the same.
+        """
+        import fitz  # PyMuPDF
+        doc = fitz.open(pdf_file)
+        try:
+            page = doc[0]
+            h = hashlib.sha256(repr(tuple(page.rect)).encode())
+            for xref in page.get_contents():
+                h.update(doc.xref_stream(xref) or b"")
+            for font in sorted(f[3].split("+")[-1] for f in page.get_fonts(full=True)):
+                h.update(font.encode("utf-8", "replace"))
+            for xref in sorted({img[0] for img in page.get_images(full=True)} | {x[0] for x in page.get_xobjects()}):
+                h.update(doc.xref_stream_raw(xref) or b"")
+            return h.hexdigest()
+        finally:
+            doc.close()
+
+    def _cached_raster(self, render_hash):
+        if render_hash is None: return None
+        with self._raster_lock:
+            png = self._rasters.get(render_hash)
+            if png is not None:
+                self._rasters.move_to_end(render_hash)
+            return png
+
+    def _cache_raster(self, render_hash, img_path):
+        if render_hash is None: return
+        with open(img_path, "rb") as f:
+            png = f.read()
+        if len(png) > self.RASTER_CACHE_BYTES // 8:
+            return  # one huge page would evict everything else
+        with self._raster_lock:
+            old = self._rasters.pop(render_hash, None)
+            self._raster_bytes += len(png) - (len(old) if old is not None else 0)
+            self._rasters[render_hash] = png
+            while self._raster_bytes > self.RASTER_CACHE_BYTES:
+                _, evicted = self._rasters.popitem(last=False)
+                self._raster_bytes -= len(evicted)
+
+    def _rasterize(self, pdf_file, img_path):
+        """Render the first PDF page to a 300-DPI PNG"""
+        import fitz  # PyMuPDF
+        doc = fitz.open(pdf_file)
+        pix = doc[0].get_pixmap(dpi=300)
+        pix.save(img_path)
+
+    def _call_llm(self, api_config, system_prompt, user_content, json_mode=False):
+        """Send one system+user exchange to the configured provider, return raw text"""
+        provider = api_config.get('provider', 'OpenAI')
+        model = api_config.get('model', 'gpt-3.5-turbo')
+
+        self.check_cancelled()
+        estimated_prompt = (len(system_prompt) + len(user_content)) // 4  # ~4 chars per prompt token
+        self.policy.check(estimated_prompt)
+        started = time.perf_counter()
+        with METRICS.timer("llm_call", provider=provider, model=model) as ev:
+            ev['input_chars'] = len(system_prompt) + len(user_content)
+            try:
+                text, prompt_tokens, completion_tokens = self._cancellable(
+                    self._llm_request, api_config, system_prompt, user_content, json_mode)
+            except ExtractionCancelled:
+                # The request was sent (a lost speculative race or a cancel only stops waiting for it):
+                # the provider bills at least the prompt
+                self.policy.charge(estimated_prompt, time.perf_counter() - started)
+                raise
+            except Exception:
+                self.policy.charge(0, time.perf_counter() - started)
+                raise
+            ev.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, output_chars=len(text or ""))
+        self.policy.charge(prompt_tokens + completion_tokens, time.perf_counter() - started)
+        METRICS.incr("llm_calls")
+        METRICS.incr("llm_prompt_tokens", prompt_tokens)
+        METRICS.incr("llm_completion_tokens", completion_tokens)
+        return text
+
+    def _cancellable(self, fn, *args):
+        """Run a blocking call on a helper thread so cancel() does not wait for it; a late result is dropped"""
+        box = {}
+        def work():
+            try:
+                box['result'] = fn(*args)
+            except BaseException as e:
+                box['error'] = e
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        while worker.is_alive():
+            worker.join(0.25)
+            if worker.is_alive():
+                self.check_cancelled()
+        if 'error' in box:
+            raise box['error']
+        return box['result']
+
+    def _llm_request(self, api_config, system_prompt, user_content, json_mode=False):
+        """Provider round trip, return (text, prompt_tokens, completion_tokens)"""
+        provider = api_config.get('provider', 'OpenAI')
+        api_key = api_config['api_key']
+        base_url = api_config.get('base_url', '')
+        model = api_config.get('model', 'gpt-3.5-turbo')
+
+        if provider == "Google":
+            try:
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                gemini_model = genai.GenerativeModel(model if model else "gemini-pro")
+                response = gemini_model.generate_content(f"{system_prompt}\n\n{user_content}")
+                usage = getattr(response, 'usage_metadata', None)
+                return (response.text,
+                        getattr(usage, 'prompt_token_count', 0) or 0,
+                        getattr(usage, 'candidates_token_count', 0) or 0)
+            except ImportError:
+                raise Exception("Please install google-generativeai library or use Compatible mode")
+            except Exception as e:
+                raise Exception(f"Google API Error: {str(e)}")
+
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key, base_url=base_url)
+        kwargs = {}
+        if json_mode:
+            kwargs['response_format'] = {"type": "json_object"}
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            **kwargs
+        )
+        usage = getattr(response, 'usage', None)
+        return (response.choices[0].message.content,
+                getattr(usage, 'prompt_tokens', 0) or 0,
+                getattr(usage, 'completion_tokens', 0) or 0)
+
+    def trim_error_log(self, error_msg, before=3, after=8, max_chars=1500):
+        """Keep only the lines around the first compile error in a Tectonic log"""
+        lines = [l for l in error_msg.split('\n') if l.strip()]
+        first = None
+        for i, line in enumerate(lines):
+            if line.startswith('!') or re.search(r'(^error:|:\d+: )', line):
+                first = i
+                break
+        if first is None:
+            return error_msg[:max_chars]
+        trimmed = '\n'.join(lines[max(0, first - before):first + after + 1])
+        return trimmed[:max_chars]
+
+    def apply_latex_edits(self, tex, edits):
+        """Apply a list of LLM edit operations to a standalone .tex, return (new_tex, applied_count).
+
+        Malformed edits (non-string fields, nargs that is not a number from 0 to 9) are skipped.
+        """
+        applied = 0
+        for edit in edits:
+            if not isinstance(edit, dict):
+                continue
+            try:
+                tex, changed = self._apply_latex_edit(tex, edit)
+            except (TypeError, ValueError) as e:
+                print(f"[LLM-FIX] Skipping malformed edit {str(edit)[:80]}: {e}")
+                continue
+            applied += changed
+        return tex, applied
+
+    def _apply_latex_edit(self, tex, edit):
+        """(new_tex, 1) for one applicable edit, (tex, 0) if it does not apply; TypeError/ValueError if malformed"""
+        def text(key):
+            value = edit.get(key)
+            if value is not None and not isinstance(value, str):
+                raise TypeError(f"'{key}' is not a string")
+            return value or ''
+
+        op = edit.get('op')
+        if op == 'add_preamble':
+            line = text('line').strip()
+            if line and line not in tex and "\\begin{document}" in tex:
+                return tex.replace("\\begin{document}", line + "\n\\begin{document}", 1), 1
+        elif op == 'provide_command':
+            name = text('name').strip()
+            if not name:
+                return tex, 0
+            if not name.startswith('\\'):
+                name = '\\' + name
+            nargs = edit.get('nargs') or 0
+            if isinstance(nargs, bool) or not isinstance(nargs, (int, float, str)):
+                raise TypeError("'nargs' is not a number")
+            nargs = int(nargs)
+            if not 0 <= nargs <= 9:
+                raise ValueError(f"'nargs' {nargs} is out of range")
+            args = f"[{nargs}]" if nargs > 0 else ""
+            line = f"\\providecommand{{{name}}}{args}{{{text('body')}}}"
+            if line not in tex and "\\begin{document}" in tex:
+                return tex.replace("\\begin{document}", line + "\n\\begin{document}", 1), 1
+        elif op == 'replace':
+            old = text('old')
+            if old and old in tex:
+                return tex.replace(old, text('new'), 1), 1
+        return tex, 0
+
+    @timed("llm_fix_patch")
+    def llm_fix_latex_patch(self, api_config, failed_tex, error_msg):
+        """Ask the LLM for a compact edit list instead of a full document, apply it locally"""
+        patch_prompt = """You are a LaTeX compilation error fixer.
 
+Given a standalone LaTeX file that FAILED to compile with the Tectonic engine and the relevant part of the error log,
+return ONLY the minimal edits needed to make it compile, as a JSON object:
+{
+    "edits": [
+        {"op": "add_preamble", "line": "\\\\usepackage{amsmath}"},
+        {"op": "provide_command", "name": "\\\\cmark", "nargs": 0, "body": "\\\\checkmark"},
+        {"op": "replace", "old": "<exact text from the file>", "new": "<replacement, may be empty>"}
+    ]
+}
+
+STRICT Rules:
+- `old` must be copied EXACTLY from the failed file; keep it short but unique
+- Use `replace` with an empty `new` to delete a package line or a decorative command
+- Do NOT use conference/journal style files or the `transparent`, `fontspec`, `xeCJK`, `hyperref` packages
+- Keep the table content and structure EXACTLY intact — do not change any data
+- Do NOT return the whole document. No explanations."""
+
+        user_content = f"""=== FAILED STANDALONE TEX FILE ===
+{failed_tex}
+
+=== COMPILATION ERRORS (around first error) ===
+{self.trim_error_log(error_msg)}"""
+
+        result_text = self._call_llm(api_config, patch_prompt, user_content, json_mode=True)
+
+        if "```json" in result_text:
+            result_text = result_text.split("```json")[1].split("```")[0]
+        elif "```" in result_text:
+            result_text = result_text.split("```")[1].split("```")[0]
+
+        try:
+            edits = json.loads(result_text).get('edits', [])
+        except (json.JSONDecodeError, AttributeError):
+            print(f"[LLM-FIX] Patch response is not valid JSON")
+            return None
+
+        if not isinstance(edits, list):
+            print("[LLM-FIX] Patch response has no edit list")
+            return None
+        fixed_tex, applied = self.apply_latex_edits(failed_tex, edits)
+        print(f"[LLM-FIX] Patch mode: {applied}/{len(edits)} edits applied ({len(result_text)} chars returned)")
+        if applied == 0:
+            return None
+        return fixed_tex
+
+    @timed("llm_fix")
     def llm_fix_latex(self, api_config, original_source, failed_tex, error_msg):
         """Call LLM to fix failed LaTeX code"""
         fix_prompt = """You are a LaTeX compilation error fixer.
@@ -628,31 +3824,7 @@ STRICT Rules:
 
 Please produce the corrected standalone .tex file:"""
 
-        provider = api_config.get('provider', 'OpenAI')
-        api_key = api_config['api_key']
-        base_url = api_config.get('base_url', '')
-        model = api_config.get('model', 'gpt-3.5-turbo')
-
-        if provider == "Google":
-            try:
-                import google.generativeai as genai
-                genai.configure(api_key=api_key)
-                gemini_model = genai.GenerativeModel(model if model else "gemini-pro")
-                response = gemini_model.generate_content(f"{fix_prompt}\n\n{user_content}")
-                result_text = response.text
-            except Exception as e:
-                raise Exception(f"Google API Error: {str(e)}")
-        else:
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key, base_url=base_url)
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": fix_prompt},
-                    {"role": "user", "content": user_content}
-                ],
-            )
-            result_text = response.choices[0].message.content
+        result_text = self._call_llm(api_config, fix_prompt, user_content)
 
         # Clean possible markdown code block wrapper
         if "```latex" in result_text:
@@ -674,455 +3846,167 @@ Please produce the corrected standalone .tex file:"""
         print(f"[LLM-FIX] LLM returned {len(result_text)} chars of fixed code")
         return result_text
 
-# --- 3. UI Interface ---
-import webbrowser
-TRANSLATIONS = {
-    "CN": {
-        "title": "Latex 表格提取器",
-        "logo_text": "LT Miner",
-        "api_group": "API 设置",
-        "api_key_ph": "请输入 API Key",
-        "base_url_ph": "Base URL (默认自动)",
-        "model_ph": "模型名称 (e.g. gpt-4)",
-        "path_btn": "更改存储路径",
-        "import_btn": "导入本地 .tex 文件",
-        "task_group": "新任务",
-        "arxiv_ph": "ArXiv ID (e.g. 2301.xxxx)",
-        "clean_mode": "数据脱敏模式",
-        "clean_hint": "说明：开启后将数值替换为选定字符，用于清洗敏感数据。",
-        "run_btn": "开始提取",
-        "run_btn_loading": "处理中...",
-        "tab_lib": "资料库",
-        "tab_insp": "检查器",
-        "pkg_label": "依赖包 (Packages)",
-        "copy_btn": "复制引用代码",
-        "src_label": "LaTeX 源码",
-        "note_label": "备注",
-        "save_note_btn": "保存备注",
-        "preview_lost": "预览丢失",
-        "preview_none": "无预览",
-        "lib_view": "查看",
-        "lib_del": "删除",
-        "success_title": "成功",
-        "success_msg": "提取 {} 个表格",
-        "copy_success_title": "复制成功",
-        "confirm_del": "确认删除此条目？",
-        "warn_no_api": "请输入 API Key",
-        "warn_no_url": "请输入 Base URL",
-        "warn_no_path": "请先选择存储路径！",
-        "copyright": "Copyright © 2ManyStars",
-        "arrow_hint": "提示：在检查器中按 ↑↓ 方向键可快捷切换表格"
-    },
-    "EN": {
-        "title": "Latex Table Miner",
-        "logo_text": "LT Miner",
-        "api_group": "API Settings",
-        "api_key_ph": "Enter API Key",
-        "base_url_ph": "Base URL (Auto default)",
-        "model_ph": "Model Name (e.g. gpt-4)",
-        "path_btn": "Change Storage Path",
-        "import_btn": "Import Local .tex",
-        "task_group": "New Task",
-        "arxiv_ph": "ArXiv ID (e.g. 2301.xxxx)",
-        "clean_mode": "Data Desensitization",
-        "clean_hint": "Note: Replaces numerical data with selected char for privacy.",
-        "run_btn": "Start Extraction",
-        "run_btn_loading": "Processing...",
-        "tab_lib": "Library",
-        "tab_insp": "Inspector",
-        "pkg_label": "Packages",
-        "copy_btn": "Copy Command",
-        "src_label": "LaTeX Source",
-        "note_label": "Notes",
-        "save_note_btn": "Save Note",
-        "preview_lost": "Preview Lost",
-        "preview_none": "No Preview",
-        "lib_view": "View",
-        "lib_del": "Delete",
-        "success_title": "Success",
-        "success_msg": "Extracted {} tables",
-        "copy_success_title": "Copied",
-        "confirm_del": "Delete this item?",
-        "warn_no_api": "Please enter API Key",
-        "warn_no_url": "Please enter Base URL",
-        "warn_no_path": "Please select storage path first!",
-        "copyright": "Copyright © 2ManyStars",
-        "arrow_hint": "Tip: Press ↑↓ arrow keys in Inspector to switch tables"
-    }
-}
-
-class App(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        self.lang = "CN"
-        self.t = TRANSLATIONS[self.lang]
-        
-        self.title(self.t["title"])
-        self.geometry("1100x800")
-        self.data_manager = DataManager()
-        self.logic = CoreLogic()
-        self.current_table_id = None
-        self.library_data = []  # Store current library data for pagination
-        self.current_index = -1  # Current index in library_data
-        self.setup_ui()
-        self.refresh_library()
-
-    def setup_ui(self):
-        self.grid_columnconfigure(1, weight=1)
-        self.grid_rowconfigure(0, weight=1)
-        
-        # Font color config (enhance contrast)
-        self.text_color_primary = "#1A1A1A"  # Dark black
-        self.text_color_secondary = "#555555" # Dark gray
-
-        # Left Sidebar
-        self.sidebar = ctk.CTkFrame(self, width=240, corner_radius=0)
-        self.sidebar.grid(row=0, column=0, sticky="nsew")
-        
-        # Language Switch
-        self.lang_switch = ctk.CTkSegmentedButton(self.sidebar, values=["CN", "EN"], command=self.change_language)
-        self.lang_switch.set("CN")
-        self.lang_switch.pack(pady=(20, 10), padx=15, fill="x")
+# --- 2b. Extraction Pipeline (headless) ---
+class ExtractionPipeline:
+    """One paper end to end: fetch -> LLM extraction -> compile/fix -> library insert.
 
-        self.logo_label = ctk.CTkLabel(self.sidebar, text="LT Miner", font=("Roboto Medium", 22), text_color=self.text_color_primary)
-        self.logo_label.pack(pady=(10, 20))
-        
-        # --- API Settings ---
-        self.api_group_label = ctk.CTkLabel(self.sidebar, text="API Settings", font=("Arial", 14, "bold"), anchor="w", text_color=self.text_color_primary)
-        self.api_group_label.pack(padx=15, fill="x")
-        
-        self.provider_var = ctk.StringVar(value=self.data_manager.config.get("provider", "OpenAI"))
-        self.provider_menu = ctk.CTkOptionMenu(self.sidebar, values=["OpenAI", "Google", "DeepSeek", "Qwen"], 
-                                               variable=self.provider_var, command=self.update_provider_settings)
-        self.provider_menu.pack(pady=5, padx=15, fill="x")
-
-        self.api_input = ctk.CTkEntry(self.sidebar)
-        self.api_input.insert(0, self.data_manager.config.get("api_key", ""))
-        self.api_input.pack(pady=5, padx=15, fill="x")
-
-        self.base_url_input = ctk.CTkEntry(self.sidebar)
-        self.base_url_input.insert(0, self.data_manager.config.get("base_url", "https://api.openai.com/v1"))
-        self.base_url_input.pack(pady=5, padx=15, fill="x")
-        
-        self.model_input = ctk.CTkEntry(self.sidebar)
-        self.model_input.insert(0, self.data_manager.config.get("model", "gpt-3.5-turbo"))
-        self.model_input.pack(pady=5, padx=15, fill="x")
-
-        self.path_btn = ctk.CTkButton(self.sidebar, text="Path", command=self.change_path, fg_color="transparent", border_width=1, text_color=self.text_color_primary)
-        self.path_btn.pack(pady=10, padx=15, fill="x")
+    Has no UI dependency; progress goes through status_cb, so the GUI, the CLI
+    and the benchmark suite all drive the same code path.
+    """
 
-        # --- Task Settings ---
-        self.task_group_label = ctk.CTkLabel(self.sidebar, text="New Task", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
-        self.task_group_label.pack(pady=(20, 5), anchor="w", padx=15)
-        
-        self.arxiv_input = ctk.CTkEntry(self.sidebar)
-        self.arxiv_input.pack(pady=5, padx=15, fill="x")
-
-        self.import_local_btn = ctk.CTkButton(self.sidebar, text="Import Local", command=self.import_local, fg_color="#5F6F81")
-        self.import_local_btn.pack(pady=(0, 5), padx=15, fill="x")
-        
-        # Data Desensitization Module
-        self.clean_mode_var = ctk.BooleanVar(value=False)
-        self.clean_mode_checkbox = ctk.CTkCheckBox(self.sidebar, text="Clean Mode", variable=self.clean_mode_var, text_color=self.text_color_primary)
-        self.clean_mode_checkbox.pack(pady=(10, 2), padx=15, anchor="w")
-        
-        self.clean_hint_label = ctk.CTkLabel(self.sidebar, text="Hint...", text_color=self.text_color_secondary, font=("Arial", 11), wraplength=200, justify="left")
-        self.clean_hint_label.pack(padx=15, anchor="w")
-
-        self.clean_char_var = ctk.StringVar(value=self.data_manager.config.get("clean_char", "-"))
-        self.clean_char_seg = ctk.CTkSegmentedButton(self.sidebar, values=["-", "SPACE"], variable=self.clean_char_var)
-        self.clean_char_seg.pack(pady=5, padx=15, fill="x")
-
-        self.run_btn = ctk.CTkButton(self.sidebar, text="Run", command=self.start_extract_thread)
-        self.run_btn.pack(pady=20, padx=15, fill="x")
-
-        # Copyright Link
-        self.copyright_label = ctk.CTkLabel(self.sidebar, text="Copyright © 2ManyStars", text_color="gray", cursor="hand2")
-        self.copyright_label.pack(side="bottom", pady=10)
-        self.copyright_label.bind("<Button-1>", lambda e: webbrowser.open("https://github.com/DianxingShi"))
-
-        # Right Tabview
-        self.tabview = ctk.CTkTabview(self, text_color=self.text_color_primary)
-        self.tabview.grid(row=0, column=1, sticky="nsew", padx=15, pady=10)
-        self.tabview.add("Library")
-        self.tabview.add("Inspector")
-        
-        self.library_frame = ctk.CTkScrollableFrame(self.tabview.tab("Library"))
-        self.library_frame.pack(fill="both", expand=True)
-        
-        # Inspector Interface
-        self.inspector = ctk.CTkFrame(self.tabview.tab("Inspector"), fg_color="transparent")
-        self.inspector.pack(fill="both", expand=True)
-        
-        self.insp_left = ctk.CTkFrame(self.inspector)
-        self.insp_left.pack(side="left", fill="both", expand=True, padx=5, pady=5)
-        self.img_preview = ctk.CTkLabel(self.insp_left, text="No Preview", text_color="gray")
-        self.img_preview.pack(expand=True)
-        
-        self.insp_right = ctk.CTkScrollableFrame(self.inspector, width=420)
-        self.insp_right.pack(side="right", fill="y", padx=5, pady=5)
-        
-        # Packages Area
-        self.pkg_label = ctk.CTkLabel(self.insp_right, text="Packages", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
-        self.pkg_label.pack(anchor="w", pady=(10,5))
-        
-        self.packages_frame = ctk.CTkFrame(self.insp_right, fg_color="transparent")
-        self.packages_frame.pack(fill="x", pady=5)
-        
-        self.copy_pkg_btn = ctk.CTkButton(self.insp_right, text="Copy", height=24, command=self.copy_packages)
-        self.copy_pkg_btn.pack(fill="x", pady=(0, 15))
-        
-        self.src_label = ctk.CTkLabel(self.insp_right, text="Source", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
-        self.src_label.pack(anchor="w")
-        self.code_editor = ctk.CTkTextbox(self.insp_right, height=200, font=("Consolas", 12))
-        self.code_editor.pack(fill="x", pady=5)
-        
-        self.note_label = ctk.CTkLabel(self.insp_right, text="Note", font=("Arial", 14, "bold"), text_color=self.text_color_primary)
-        self.note_label.pack(anchor="w", pady=(10,0))
-        self.note_editor = ctk.CTkTextbox(self.insp_right, height=150)
-        self.note_editor.pack(fill="x", pady=5)
-        
-        self.save_note_btn = ctk.CTkButton(self.insp_right, text="Save", command=self.save_current_note)
-        self.save_note_btn.pack(fill="x", pady=10)
+    def __init__(self, logic, data_manager, api_config, clean_mode=False, clean_char="-", status_cb=None):
+        self.logic = logic
+        self.data_manager = data_manager
+        self.api_config = api_config
+        self.clean_mode = clean_mode
+        self.clean_char = clean_char
+        self.status_cb = status_cb or (lambda msg, active=True: None)
 
-        # Shortcut Hint
-        self.arrow_hint_label = ctk.CTkLabel(self.insp_right, text="", text_color="#888888", font=("Arial", 11), wraplength=380, justify="center")
-        self.arrow_hint_label.pack(pady=(5, 10))
+    def run(self, doc_id, source=None, job_id=None):
+        """Process one paper; source=None downloads it from arXiv. Returns a summary dict.
 
-        self.current_packages_str = ""
-        
-        # Bind Arrow Keys
-        self.bind("<Up>", lambda e: self.navigate_inspector(-1))
-        self.bind("<Down>", lambda e: self.navigate_inspector(1))
-        
-        # === LED Status Bar ===
-        self.status_frame = ctk.CTkFrame(self, height=28, width=420, corner_radius=14, fg_color="#e8ecf1")
-        self.status_frame.place(relx=0.5, rely=1.0, anchor="s", y=-6)
-        self.status_frame.grid_propagate(False)
-        self.status_frame.grid_columnconfigure(1, weight=1)
-        
-        self.status_dot = ctk.CTkLabel(self.status_frame, text="●", font=("Consolas", 10),
-                                       text_color="#c0c5cc", width=16)
-        self.status_dot.grid(row=0, column=0, padx=(10, 3), pady=3)
-        
-        self.status_label = ctk.CTkLabel(self.status_frame, text="Ready",
-                                         font=("Consolas", 10), text_color="#a0a5ac",
-                                         anchor="w")
-        self.status_label.grid(row=0, column=1, sticky="w", padx=(0, 10), pady=3)
-        
-        self._status_blink_id = None
-        self._status_active = False
-        self._blink_state = True
-        self._led_bg = "#e8ecf1"
-        
-        self.update_language("CN") # Initialize language
-
-    def set_status(self, msg, active=True):
-        """Thread-safe LED status update"""
-        def _update():
-            self.status_label.configure(text=msg)
-            if active:
-                self.status_label.configure(text_color="#2980B9")
-                self.status_dot.configure(text_color="#2980B9")
-                self._status_active = True
-                self._start_blink()
-            else:
-                self._status_active = False
-                if self._status_blink_id:
-                    self.after_cancel(self._status_blink_id)
-                    self._status_blink_id = None
-                if "✅" in msg:
-                    self.status_label.configure(text_color="#27ae60")
-                    self.status_dot.configure(text_color="#27ae60")
-                elif "❌" in msg:
-                    self.status_label.configure(text_color="#e74c3c")
-                    self.status_dot.configure(text_color="#e74c3c")
-                self.after(5000, self._fade_status)
-        self.after(0, _update)
-
-    def _start_blink(self):
-        if self._status_blink_id:
-            self.after_cancel(self._status_blink_id)
-        self._blink_state = True
-        self._blink_dot()
-
-    def _blink_dot(self):
-        if not self._status_active:
-            return
-        if self._blink_state:
-            self.status_dot.configure(text_color="#2980B9")
-        else:
-            self.status_dot.configure(text_color=self._led_bg)
-        self._blink_state = not self._blink_state
-        self._status_blink_id = self.after(600, self._blink_dot)
-
-    def _fade_status(self):
-        if not self._status_active:
-            self.status_label.configure(text_color="#c0c5cc")
-            self.status_dot.configure(text_color="#c0c5cc")
-
-    def change_language(self, value):
-        self.lang = value
-        self.t = TRANSLATIONS[value]
-        self.update_language(value)
-        self.refresh_library()
-
-    def update_language(self, lang):
-        t = TRANSLATIONS[lang]
-        self.title(t['title'])
-        self.logo_label.configure(text=t['logo_text'])
-        self.api_group_label.configure(text=t['api_group'])
-        self.api_input.configure(placeholder_text=t['api_key_ph'])
-        self.base_url_input.configure(placeholder_text=t['base_url_ph'])
-        self.model_input.configure(placeholder_text=t['model_ph'])
-        self.path_btn.configure(text=t['path_btn'])
-        self.task_group_label.configure(text=t['task_group'])
-        self.arxiv_input.configure(placeholder_text=t['arxiv_ph'])
-        self.import_local_btn.configure(text=t['import_btn'])
-        self.clean_mode_checkbox.configure(text=t['clean_mode'])
-        self.clean_hint_label.configure(text=t['clean_hint'])
-        self.run_btn.configure(text=t['run_btn'])
-        self.copyright_label.configure(text=t['copyright'])
-        
-        # TabView titles
+        Progress is journaled (see DataManager.create_job); pass job_id to resume a
+        journaled run: the saved source and LLM table list are reused and tables that
+        already finished are not compiled again.
+        """
+        _sc = self.status_cb
+        job = None
+        if job_id is not None:
+            job = self.data_manager.load_job(job_id)
+            if job is None:
+                raise ValueError(f"Unknown job #{job_id}")
+            if job['stage'] == 'done':
+                raise ValueError(f"Job #{job_id} ({job['doc_id']}) is already done")
+            doc_id, source = job['doc_id'], job['source']
+            self.clean_mode = job['options'].get('clean_mode', self.clean_mode)
+            self.clean_char = job['options'].get('clean_char', self.clean_char)
+            print(f"[JOB] Resuming job #{job_id} ({doc_id}) from stage '{job['stage']}'")
+        METRICS.start_run(doc_id)
+        policy = self.logic.policy
+        policy.begin_paper(doc_id)
+        policy.load_history(self.data_manager.get_llm_fix_stats())
         try:
-            self.tabview._segmented_button._buttons_dict["Library"].configure(text=t['tab_lib'])
-            self.tabview._segmented_button._buttons_dict["Inspector"].configure(text=t['tab_insp'])
-        except: pass
-
-        self.pkg_label.configure(text=t['pkg_label'])
-        self.copy_pkg_btn.configure(text=t['copy_btn'])
-        self.src_label.configure(text=t['src_label'])
-        self.note_label.configure(text=t['note_label'])
-        self.save_note_btn.configure(text=t['save_note_btn'])
-        self.arrow_hint_label.configure(text=t['arrow_hint'])
-
-    def update_provider_settings(self, provider):
-        defaults = {
-            "OpenAI": ("https://api.openai.com/v1", "gpt-3.5-turbo"),
-            "Google": ("", "gemini-pro"),
-            "DeepSeek": ("https://api.deepseek.com", "deepseek-chat"),
-            "Qwen": ("https://dashscope.aliyuncs.com/compatible-mode/v1", "qwen-plus")
-        }
-        if provider in defaults:
-            url, model = defaults[provider]
-            self.base_url_input.delete(0, "end")
-            self.base_url_input.insert(0, url)
-            self.model_input.delete(0, "end")
-            self.model_input.insert(0, model)
-
-    def change_path(self):
-        new_path = filedialog.askdirectory()
-        if new_path:
-            self.data_manager.save_config({"storage_path": new_path})
-            self.refresh_library()
-            return True
-        return False
-
-    def start_extract_thread(self, mode="arxiv", data=None):
-        threading.Thread(target=self.run_extraction, args=(mode, data), daemon=True).start()
-
-    def import_local(self):
-        file_path = filedialog.askopenfilename(filetypes=[("LaTeX Files", "*.tex"), ("All Files", "*.*")])
-        if file_path:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                filename = os.path.basename(file_path)
-                self.start_extract_thread(mode="local", data={"content": content, "filename": filename})
-            except Exception as e:
-                messagebox.showerror("Error", f"Read failed: {e}")
-
-    def run_extraction(self, mode="arxiv", data=None):
-        # Check if storage path is set
-        if not self.data_manager.config.get("storage_path"):
-            self.after(0, lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_path"]))
-            # Try to let user select
-            self.after(0, self.change_path)
-            # Whether selected or not, do not continue this time, let user click again
-            return
-
-        api_key = self.api_input.get()
-        base_url = self.base_url_input.get()
-        provider = self.provider_var.get()
-        model = self.model_input.get()
-        clean_char = " " if self.clean_char_var.get() == "SPACE" else "-"
-        
-        if not api_key: 
-            self.after(0, lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_api"]))
-            return
-
-        if provider != "Google" and not base_url:
-             self.after(0, lambda: messagebox.showwarning(self.t["title"], self.t["warn_no_url"]))
-             return
+            if source is None:
+                _sc("📡 Fetching ArXiv source...")
+                source = self.logic.fetch_arxiv_source(doc_id)
+            if job is None:
+                job_id = self.data_manager.create_job(doc_id, source, {'clean_mode': self.clean_mode,
+                                                                       'clean_char': self.clean_char})
 
-        self.data_manager.save_config({
-            "api_key": api_key,
-            "base_url": base_url,
-            "provider": provider,
-            "model": model,
-            "clean_char": self.clean_char_var.get()
-        })
+            _sc("🔍 Pre-scanning tables...")
+            scan = self.logic.pre_scan_tables(source)
 
-        self.run_btn.configure(state="disabled", text=self.t["run_btn_loading"])
-        try:
-            if mode == "local":
-                source = data["content"]
-                doc_id = f"Local_{data['filename']}"
-                self.set_status("📂 Loading local file...")
+            cfg = self.api_config
+            if job and job['tables'] is not None:
+                # LLM output was journaled before the interruption; unchanged spans are already linked
+                tables, unchanged = job['tables'], job['unchanged']
             else:
-                doc_id = self.arxiv_input.get()
-                if not doc_id: 
-                    self.after(0, lambda: messagebox.showwarning("Tip", "ID required"))
-                    return 
-                self.set_status("📡 Fetching ArXiv source...")
-                source = self.logic.fetch_arxiv_source(doc_id)
+                # === Incremental re-extraction: tables unchanged since a stored version are only linked ===
+                llm_source, unchanged_entries = source, []
+                if self.data_manager.config.get("incremental_reextract", True) and not doc_id.startswith("Local_"):
+                    llm_source, unchanged_entries = self._delta_source(doc_id, source, scan)
+                for entry, table_id in unchanged_entries:
+                    self.data_manager.link_table(doc_id, table_id, "version", 1.0, entry['fingerprint'])
+                unchanged = len(unchanged_entries)
+                if unchanged:
+                    METRICS.incr("incremental_unchanged", unchanged)
+                    print(f"[INCREMENTAL] {doc_id}: {unchanged} unchanged, {len(scan) - unchanged} new/modified table(s)")
 
-            self.set_status("🔍 Pre-scanning tables...")
-            self.set_status("🤖 LLM extracting tables...")
-            tables = self.logic.extract_and_analyze(
-                api_key, base_url, source, 
-                provider=provider, model=model,
-                clean_mode=self.clean_mode_var.get(),
-                clean_char=clean_char
-            )
+                if llm_source is None:
+                    print(f"[INCREMENTAL] All tables unchanged, skipping LLM extraction (set incremental_reextract=false to force)")
+                    tables = []
+                else:
+                    _sc("🤖 LLM extracting tables...")
+                    tables = self.logic.extract_and_analyze(
+                        cfg['api_key'], cfg.get('base_url', ''), llm_source,
+                        provider=cfg.get('provider', 'OpenAI'), model=cfg.get('model', 'gpt-3.5-turbo'),
+                        routes=cfg.get('routes')
+                    )
+                self.data_manager.job_extracted(job_id, tables, unchanged)
             print(f"\n[INFO] LLM initially extracted {len(tables)} tables")
-            self.set_status(f"📋 Found {len(tables)} tables, preparing preamble...")
+            _sc(f"📋 Found {len(tables)} tables, preparing preamble...")
             # Extract preamble (packages + definitions) from original source
             src_pkgs, src_defs = self.logic.extract_source_preamble(source)
-            
+
             success_count = 0
             fail_count = 0
             total = len(tables)
             results = []  # Record result for each table
-            # Build API config for LLM fix
-            api_cfg = {
-                'api_key': api_key,
-                'base_url': base_url,
-                'provider': provider,
-                'model': model,
-            }
-            
+
+            dedup_mode = self.data_manager.config.get("dedup_mode", "link")
+            dedup_threshold = self.data_manager.config.get("dedup_threshold", 0.9)
+            dup_count = 0
+            table_status = job['table_status'] if job else {}
+
             for idx, t in enumerate(tables, 1):
-                self.set_status(f"⚙️ Compiling table {idx}/{total}...")
+                self.logic.check_cancelled()
+                status, method = table_status.get(idx, ("pending", None))
+                if status in DataManager.JOB_FINISHED_TABLE:
+                    # Finished before the interruption
+                    if status == "done": success_count += 1
+                    elif status == "failed": fail_count += 1
+                    else: dup_count += 1
+                    results.append((idx, {"done": "✅", "failed": "❌", "duplicate": "🔗"}[status], method or status.upper()))
+                    continue
+
+                entry = self.logic.match_scan_entry(scan, t.get('source_line'))
+                source_fp = entry['fingerprint'] if entry else None
+                # Skip compiling tables already in the library: identical code from any paper, or a near
+                # copy within this paper (re-extraction, overlapping or split output)
+                if dedup_mode != "off":
+                    dup = self.data_manager.find_duplicate(t['code'], dedup_threshold, arxiv_id=doc_id)
+                    if dup:
+                        dup_id, relation, similarity = dup
+                        if dedup_mode == "link":
+                            self.data_manager.link_table(doc_id, dup_id, relation, similarity, source_fp)
+                        dup_count += 1
+                        METRICS.incr("dedup_skipped")
+                        results.append((idx, "🔗", f"DUP-{relation.upper()} #{dup_id} ({similarity:.2f})"))
+                        self.data_manager.mark_job_table(job_id, idx, "duplicate", results[-1][2], dup_id)
+                        _sc(f"🔗 Table {idx}/{total} duplicate of #{dup_id}")
+                        continue
+
+                _sc(f"⚙️ Compiling table {idx}/{total}...")
+                attempts = []
                 try:
                     img_path, method = self.logic.render_latex(
                         t['code'], src_pkgs, src_defs,
-                        api_config=api_cfg, original_source=source,
-                        status_cb=lambda msg, i=idx, n=total: self.set_status(f"[{i}/{n}] {msg}")
+                        api_config=cfg, original_source=source,
+                        status_cb=lambda msg, i=idx, n=total: _sc(f"[{i}/{n}] {msg}"),
+                        attempt_log=attempts
                     )
-                    self.data_manager.add_table(doc_id, t['code'], t.get('packages', []), img_path)
-                    try: os.remove(img_path) 
-                    except: pass
+                    compiled = next((a for a in reversed(attempts) if a['success']), {})
+                    cleaned, cleaned_img = None, None
+                    if self.clean_mode:
+                        # The stored PNG of the cleaned variant is rendered from the repaired document, values blanked
+                        cleaned = clean_table_code(t['code'], self.clean_char)
+                        if compiled.get('tex'):
+                            cleaned_img = self.logic.render_cleaned(compiled['tex'], self.clean_char)
+                    table_id = self.data_manager.add_table(doc_id, t['code'], t.get('packages', []), img_path,
+                                                           source_fingerprint=source_fp, cleaned_code=cleaned,
+                                                           render_hash=compiled.get('render_hash'),
+                                                           compiled_tex=compiled.get('tex'),
+                                                           cleaned_image_path=cleaned_img)
+                    self.data_manager.mark_job_table(job_id, idx, "done", method, table_id)
+                    for tmp_img in (img_path, cleaned_img):
+                        if not tmp_img: continue
+                        try: os.remove(tmp_img)
+                        except: pass
                     success_count += 1
                     results.append((idx, "✅", method))
-                    self.set_status(f"✅ Table {idx}/{total} OK ({method})")
+                    _sc(f"✅ Table {idx}/{total} OK ({method})")
+                except ExtractionCancelled:
+                    raise
                 except Exception as render_err:
                     fail_count += 1
                     results.append((idx, "❌", "FAIL"))
-                    self.set_status(f"❌ Table {idx}/{total} failed")
+                    self.data_manager.mark_job_table(job_id, idx, "failed", "FAIL")
+                    _sc(f"❌ Table {idx}/{total} failed")
                     print(f"[WARN] Table {idx} failed: {str(render_err)[:200]}")
-            
+                finally:
+                    self.data_manager.add_compile_attempts(doc_id, idx, attempts)
+            self.data_manager.finish_job(job_id)
+
             # Print clear summary log
             print(f"\n{'='*50}")
             print(f"  Extraction Summary: Initially extracted {total} tables")
@@ -1130,117 +4014,582 @@ class App(ctk.CTk):
             for r_idx, r_status, r_method in results:
                 print(f"  Table {r_idx:>2}/{total}  {r_status}  {r_method}")
             print(f"{'='*50}")
-            print(f"  Result: {success_count} success, {fail_count} failed")
+            print(f"  Result: {success_count} success, {fail_count} failed, {dup_count} duplicate, {unchanged} unchanged")
+            rule_stats = self.logic.error_fixer.pop_stats()
+            for rule, c in rule_stats.items():
+                print(f"  Rule {rule:<24} hits={c['hits']}  success={c['success']}")
+            spend = policy.end_paper()
+            print(f"  LLM spend: {format_llm_spend(spend)}")
             print(f"{'='*50}\n")
-            
-            self.after(0, self.refresh_library)
-            result_msg = f"✅ Done: {success_count} ok"
-            if fail_count > 0:
-                result_msg += f", {fail_count} fail"
-            self.set_status(result_msg, active=False)
-            msg = self.t["success_msg"].format(success_count)
-            if fail_count > 0:
-                msg += f" ({fail_count} failed)"
-            self.after(0, lambda m=msg: messagebox.showinfo(self.t["success_title"], m))
+            self.data_manager.record_rule_stats(rule_stats)
+
+            return {'doc_id': doc_id, 'job_id': job_id, 'total': total, 'success': success_count,
+                    'failed': fail_count, 'duplicates': dup_count, 'unchanged': unchanged,
+                    'results': results, 'llm_spend': spend}
         except Exception as e:
-            err_msg = str(e)
-            self.set_status("❌ Error", active=False)
-            self.after(0, lambda: messagebox.showerror("Error", err_msg))
+            self.data_manager.finish_job(job_id, error=e)
+            policy.end_paper()
+            raise
         finally:
-            self.run_btn.configure(state="normal", text=self.t["run_btn"])
+            self.data_manager.record_llm_fix_stats(policy.pop_stats())
+            self.data_manager.record_tier_stats(self.logic.router.pop_stats())
+            self.data_manager.save_metrics(METRICS.end_run())
 
-    def refresh_library(self):
-        for w in self.library_frame.winfo_children(): w.destroy()
-        data = self.data_manager.get_all_tables()
-        self.library_data = data if data else []
-        if not data: return
-        
-        for row in data:
-            tid, aid, code, pkgs, note, img, time = row
-            card = ctk.CTkFrame(self.library_frame)
-            card.pack(fill="x", pady=5, padx=5)
-            
-            # Left: ID and Packages
-            pkg_count = len(pkgs.split(',')) if pkgs else 0
-            title = f"{aid} | {pkg_count} Pkgs"
-            ctk.CTkLabel(card, text=title, font=("Arial", 12, "bold"), text_color=self.text_color_primary).pack(side="left", padx=10)
-            
-            # Middle: Note (Truncated)
-            if note:
-                note_display = note if len(note) < 30 else note[:30] + "..."
-                ctk.CTkLabel(card, text=note_display, text_color="gray", font=("Arial", 11)).pack(side="left", padx=10)
-
-            # Right: Buttons
-            ctk.CTkButton(card, text=self.t["lib_view"], width=60, 
-                          command=lambda r=row: self.load_detail(r)).pack(side="right", padx=10, pady=10)
-            ctk.CTkButton(card, text=self.t["lib_del"], width=50, fg_color="#C0392B", 
-                          command=lambda rid=tid: self.delete_item(rid)).pack(side="right", padx=5)
-
-    def load_detail(self, row):
-        tid, aid, code, pkgs, note, img_file, time = row
-        self.current_table_id = tid
-        self.current_packages_str = pkgs
-        
-        # Update current index
-        for i, r in enumerate(self.library_data):
-            if r[0] == tid:
-                self.current_index = i
+    def _delta_source(self, doc_id, source, scan):
+        """Blank out table spans already stored for another version of this paper.
+
+        Returns (source for the LLM or None if nothing changed, [(scan entry, stored table_id)]).
+        Line numbers are preserved so LLM source_line values still match `scan`.
+        """
+        known = self.data_manager.get_source_fingerprints(arxiv_base_id(doc_id))
+        if not known:
+            return source, []
+        lines = source.split('\n')
+        unchanged = []
+        for entry in scan:
+            table_id = known.get(entry['fingerprint'])
+            if table_id is None:
+                continue
+            unchanged.append((entry, table_id))
+            lines[entry['line'] - 1] = f"% [LTMiner] unchanged table {entry['label']} already in library"
+            for i in range(entry['line'], entry['end_line']):
+                lines[i] = ""
+        if not unchanged:
+            return source, []
+        if len(unchanged) == len(scan):
+            return None, unchanged
+        return '\n'.join(lines), unchanged
+
+# --- 2c. Library Export (headless) ---
+class LibraryExporter:
+    """Streams library rows to JSONL, Parquet or per-table Overleaf bundles.
+
+    Rows come from DataManager.iter_tables, so memory stays flat however many
+    tables are exported; filters (and cleaned/clean_char) are passed through to it.
+    """
+    FORMATS = ("jsonl", "parquet", "bundles")
+    PARQUET_BATCH = 1000
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+
+    def export(self, fmt, path, progress_cb=None, **filters):
+        """Write the matching tables to path (a directory for "bundles"), return the count"""
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (choose from {', '.join(self.FORMATS)})")
+        records = (self._record(row) for row in self.data_manager.iter_tables(**filters))
+        return getattr(self, f"_export_{fmt}")(path, records, progress_cb or (lambda n: None))
+
+    def _record(self, row):
+        table_id, arxiv_id, code, packages, note, image_filename, created_at, compiled_tex = row
+        return {
+            'id': table_id,
+            'arxiv_id': arxiv_id,
+            'latex_code': code or "",
+            'packages': [p for p in (packages or "").split(",") if p],
+            'note': note or "",
+            'image': f"images/{image_filename}" if image_filename else None,
+            'created_at': created_at,
+            'compiled_tex': compiled_tex,
+        }
+
+    def _export_jsonl(self, path, records, progress_cb):
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                count += 1
+                if count % 500 == 0: progress_cb(count)
+        return count
+
+    def _export_parquet(self, path, records, progress_cb):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        schema = pa.schema([
+            ('id', pa.int64()), ('arxiv_id', pa.string()), ('latex_code', pa.string()),
+            ('packages', pa.list_(pa.string())), ('note', pa.string()),
+            ('image', pa.string()), ('created_at', pa.string()), ('compiled_tex', pa.string()),
+        ])
+        count = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for rec in records:
+                batch.append(rec)
+                if len(batch) >= self.PARQUET_BATCH:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    count += len(batch)
+                    batch = []
+                    progress_cb(count)
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+        return count
+
+    def _export_bundles(self, path, records, progress_cb):
+        """One <arxiv>_<id>.zip per table with the document that compiled to the preview PNG as main.tex"""
+        import zipfile
+        os.makedirs(path, exist_ok=True)
+        count = 0
+        for rec in records:
+            name = re.sub(r'[^A-Za-z0-9._-]+', '_', rec['arxiv_id'] or "table") + f"_{rec['id']}"
+            with zipfile.ZipFile(os.path.join(path, name + ".zip"), "w", zipfile.ZIP_DEFLATED) as zf:
+                # Rows stored before compiled_tex existed fall back to a document rebuilt from the table code
+                zf.writestr("main.tex", rec['compiled_tex'] or self.standalone_tex(rec['latex_code'], rec['packages']))
+                image_path = os.path.join(self.data_manager.img_dir, os.path.basename(rec['image'] or ""))
+                if rec['image'] and os.path.exists(image_path):
+                    zf.write(image_path, "preview.png")
+                if rec['note']:
+                    zf.writestr("NOTE.txt", rec['note'])
+            count += 1
+            if count % 100 == 0: progress_cb(count)
+        return count
+
+    @staticmethod
+    def standalone_tex(code, packages):
+        """Stored table code as a standalone document loading its recorded packages"""
+        m = re.search(r'\\begin\{document\}(.*?)\\end\{document\}', code, re.DOTALL)
+        preamble, body = (code[:m.start()], m.group(1)) if m else ("", code)
+        preamble_lines = [l for l in preamble.split("\n") if l.strip() and not l.strip().startswith("\\documentclass")]
+        loaded = set()
+        for group in re.findall(r'\\usepackage(?:\[[^\]]*\])?\{([^}]+)\}', preamble):
+            loaded.update(p.strip() for p in group.split(","))
+        extra = [f"\\usepackage{{{p}}}" for p in packages if p not in loaded]
+        return ("\\documentclass[preview]{standalone}\n" + "\n".join(extra + preamble_lines)
+                + "\n\\begin{document}\n" + body.strip() + "\n\\end{document}\n")
+
+# --- 2d. Local Corpus Import (headless) ---
+ARXIV_ID_RE = re.compile(r'^(\d{4}\.\d{4,5}(?:v\d+)?)$')
+TEX_INCLUDE_RE = re.compile(r'\\(?:input|include|subfile)\{([^}]+)\}')
+
+def resolve_root_tex(files):
+    """Pick the main file of a project: {relative path: text} -> path, or None.
+
+    Prefers files that contain both \\documentclass and \\begin{document}, then
+    conventional names, then the file that pulls in the most others.
+    """
+    def uncommented(text):
+        return re.sub(r'(?<!\\)%.*', '', text)
+    candidates = []
+    for name, text in files.items():
+        body = uncommented(text)
+        if '\\documentclass' not in body:
+            continue
+        score = (
+            '\\begin{document}' in body,
+            os.path.basename(name).lower() in ('main.tex', 'ms.tex', 'paper.tex', 'article.tex'),
+            len(TEX_INCLUDE_RE.findall(body)),
+            -name.count('/'),
+            len(text),
+        )
+        candidates.append((score, name))
+    return max(candidates)[1] if candidates else None
+
+def flatten_tex(root, files, max_depth=10):
+    """Inline \\input/\\include/\\subfile of root recursively.
+
+    Paths resolve like TeX does, relative to the folder of root (where it is
+    compiled), then relative to the project root; every include on a line is expanded.
+    """
+    import posixpath
+    root_dir = posixpath.dirname(root)
+    def lookup(target):
+        target = target.strip()
+        for base in ((root_dir, "") if root_dir else ("",)):
+            path = posixpath.normpath(posixpath.join(base, target))
+            for candidate in (path, path + ".tex"):
+                if candidate in files:
+                    return candidate
+        return None
+    def expand(name, depth, seen):
+        out = []
+        for line in files[name].split('\n'):
+            code = re.sub(r'(?<!\\)%.*', '', line)
+            pos, parts = 0, []
+            for m in TEX_INCLUDE_RE.finditer(code):
+                child = lookup(m.group(1))
+                if not child or child in seen or depth >= max_depth:
+                    continue
+                parts.append(line[pos:m.start()])
+                parts.append(f"% --- {child} ---")
+                parts.append(expand(child, depth + 1, seen | {child}))
+                pos = m.end()
+            if parts:
+                out.extend(parts + [line[pos:]])
+            else:
+                out.append(line)
+        return '\n'.join(out)
+    return expand(root, 0, {root})
+
+def project_source(files):
+    """Source text of a project: the flattened root file, or all .tex files concatenated as a fallback"""
+    root = resolve_root_tex(files)
+    if root:
+        return flatten_tex(root, files)
+    return ''.join(f"\n% --- {name} ---\n{text}" for name, text in sorted(files.items()))
+
+
+class LocalImporter:
+    """Offline ingestion of a local mirror: unpacked project folders and/or arXiv tarballs.
+
+    discover() walks the given paths; every folder holding a .tex file with
+    \\documentclass is one project (its subfolders belong to it), every
+    .tar.gz/.tgz/.tar/.gz file is one project. Projects run through
+    ExtractionPipeline on a thread pool; papers that already have a finished
+    job are skipped and papers with an unfinished job resume it, so an
+    interrupted import can simply be started again.
+    """
+    TARBALL_EXTS = ('.tar.gz', '.tgz', '.tar', '.gz')
+
+    def __init__(self, logic, data_manager, api_config, workers=4, clean_mode=False, clean_char="-", status_cb=None):
+        self.logic = logic
+        self.data_manager = data_manager
+        self.api_config = api_config
+        self.workers = max(1, workers)
+        self.clean_mode = clean_mode
+        self.clean_char = clean_char
+        self.status_cb = status_cb or (lambda msg, active=True: None)
+
+    def discover(self, paths):
+        """[(doc_id, kind, path)] with kind 'dir', 'tarball' or 'file'"""
+        projects = []
+        for path in paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    for fname in sorted(filenames):
+                        if fname.lower().endswith(self.TARBALL_EXTS):
+                            projects.append(self._project(os.path.join(dirpath, fname), 'tarball'))
+                    if any(fname.endswith('.tex') and self._has_documentclass(os.path.join(dirpath, fname))
+                           for fname in filenames):
+                        projects.append(self._project(dirpath, 'dir'))
+                        dirnames[:] = []  # sections/, figures/ ... belong to this project
+            elif path.lower().endswith(self.TARBALL_EXTS):
+                projects.append(self._project(path, 'tarball'))
+            elif os.path.isfile(path):
+                projects.append(self._project(path, 'file'))
+        return projects
+
+    def _project(self, path, kind):
+        name = os.path.basename(os.path.normpath(path))
+        for ext in self.TARBALL_EXTS:
+            if kind == 'tarball' and name.lower().endswith(ext):
+                name = name[:-len(ext)]
                 break
-        
-        self.code_editor.delete("0.0", "end")
-        self.code_editor.insert("0.0", code)
-        self.note_editor.delete("0.0", "end")
-        self.note_editor.insert("0.0", note)
-
-        for w in self.packages_frame.winfo_children(): w.destroy()
-        if pkgs:
-            r, c = 0, 0
-            for pkg in pkgs.split(','):
-                btn = ctk.CTkButton(self.packages_frame, text=pkg.strip(), width=60, height=24, fg_color="#2980B9", hover=False)
-                btn.grid(row=r, column=c, padx=2, pady=2)
-                c += 1
-                if c > 3: c, r = 0, r + 1
-
-        full_img_path = os.path.join(self.data_manager.img_dir, img_file)
-        if os.path.exists(full_img_path):
-            pil_img = Image.open(full_img_path)
-            ratio = min(600/pil_img.width, 800/pil_img.height, 1.0)
-            ctk_img = ctk.CTkImage(pil_img, size=(int(pil_img.width*ratio), int(pil_img.height*ratio)))
-            self.img_preview.configure(image=ctk_img, text="")
-        else: self.img_preview.configure(image=None, text=self.t["preview_lost"])
-        self.tabview.set("Inspector")
-
-    def navigate_inspector(self, direction):
-        """Arrow key pagination: direction=-1 prev, direction=1 next"""
-        if not self.library_data or self.current_index < 0:
-            return
-        # Only active when Inspector tab is active
+        # arXiv mirrors name tarballs/folders after the paper: keep the ID so versions and dedup line up.
+        # Other names (main.tex, paper/...) repeat across a mirror, so a hash of the full path keeps them apart
+        if ARXIV_ID_RE.match(name):
+            doc_id = name
+        else:
+            path_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+            doc_id = f"Local_{name}_{path_hash}"
+        return doc_id, kind, path
+
+    @staticmethod
+    def _has_documentclass(path):
         try:
-            if self.tabview.get() != "Inspector":
-                return
-        except: return
-        
-        new_index = self.current_index + direction
-        if 0 <= new_index < len(self.library_data):
-            self.load_detail(self.library_data[new_index])
-
-    def copy_packages(self):
-        if not self.current_packages_str: return
-        cmds = "\n".join([f"\\usepackage{{{p.strip()}}}" for p in self.current_packages_str.split(',')])
-        self.clipboard_clear()
-        self.clipboard_append(cmds)
-        messagebox.showinfo(self.t["copy_success_title"], cmds)
-
-    def save_current_note(self):
-        if self.current_table_id:
-            self.data_manager.update_note(self.current_table_id, self.note_editor.get("0.0", "end").strip())
-            self.refresh_library()
-
-    def delete_item(self, tid):
-        if messagebox.askyesno(self.t["title"], self.t["confirm_del"]):
-            self.data_manager.delete_table(tid)
-            self.refresh_library()
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                return '\\documentclass' in f.read(65536)
+        except OSError:
+            return False
+
+    def load_source(self, kind, path):
+        files = {}
+        if kind == 'file':
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        if kind == 'dir':
+            for dirpath, _, filenames in os.walk(path):
+                for fname in filenames:
+                    if fname.endswith('.tex'):
+                        full = os.path.join(dirpath, fname)
+                        with open(full, "r", encoding="utf-8", errors="ignore") as f:
+                            files[os.path.relpath(full, path).replace(os.sep, '/')] = f.read()
+            return project_source(files)
+        try:
+            with tarfile.open(path, "r:*") as tar:
+                for member in tar.getmembers():
+                    if member.isfile() and member.name.endswith('.tex'):
+                        f = tar.extractfile(member)
+                        if f:
+                            name = member.name[2:] if member.name.startswith('./') else member.name
+                            files[name] = f.read().decode('utf-8', errors='ignore')
+        except tarfile.ReadError:
+            # arXiv serves single-file submissions as a bare gzipped .tex
+            import gzip
+            with gzip.open(path, "rb") as f:
+                return f.read().decode('utf-8', errors='ignore')
+        return project_source(files)
+
+    def run(self, paths, skip_done=True):
+        """Discover and extract everything under paths; returns a summary dict"""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        started = time.perf_counter()
+        self.logic.cancel_event.clear()
+        self.logic.policy.begin_batch("import")
+        projects = self.discover(paths)
+        done_ids = self.data_manager.get_finished_doc_ids() if skip_done else set()
+        todo = [p for p in projects if p[0] not in done_ids]
+        # An interrupted paper continues its journaled job (newest one if several) instead of starting over
+        unfinished = {doc_id: job_id for job_id, doc_id, *_ in self.data_manager.get_unfinished_jobs()}
+        resumed = sum(1 for p in todo if p[0] in unfinished)
+        summary = {'projects': len(projects), 'skipped': len(projects) - len(todo), 'resumed': resumed,
+                   'processed': 0, 'errors': 0, 'tables': 0, 'success': 0, 'failed': 0, 'failures': []}
+        print(f"[IMPORT] {len(projects)} projects found, {summary['skipped']} already extracted, "
+              f"{len(todo)} to process ({resumed} resumed) with {self.workers} workers")
+        lock = threading.Lock()
+
+        def work(project):
+            doc_id, kind, path = project
+            self.logic.check_cancelled()
+            pipeline = ExtractionPipeline(self.logic, self.data_manager, self.api_config,
+                                          clean_mode=self.clean_mode, clean_char=self.clean_char)
+            if doc_id in unfinished:
+                return pipeline.run(doc_id, job_id=unfinished[doc_id])
+            return pipeline.run(doc_id, self.load_source(kind, path))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ltminer-import") as pool:
+            futures = {pool.submit(work, p): p for p in todo}
+            for future in as_completed(futures):
+                doc_id = futures[future][0]
+                with lock:
+                    summary['processed'] += 1
+                    try:
+                        result = future.result()
+                        summary['tables'] += result['total']
+                        summary['success'] += result['success']
+                        summary['failed'] += result['failed']
+                    except ExtractionCancelled:
+                        summary['processed'] -= 1
+                        continue
+                    except Exception as e:
+                        summary['errors'] += 1
+                        summary['failures'].append((doc_id, str(e)[:200]))
+                        print(f"[IMPORT] {doc_id} failed: {str(e)[:200]}")
+                    elapsed = time.perf_counter() - started
+                    rate = summary['processed'] / elapsed * 60 if elapsed else 0
+                    self.status_cb(f"📦 Import {summary['processed']}/{len(todo)} papers, "
+                                   f"{summary['success']} tables ok ({rate:.1f} papers/min)")
+        summary['seconds'] = round(time.perf_counter() - started, 1)
+        summary['cancelled'] = self.logic.cancel_event.is_set()
+        summary['llm_spend'] = self.logic.policy.report()['batch']
+
+        print(f"\n{'='*50}")
+        print(f"  Import Summary ({summary['seconds']}s)")
+        print(f"{'='*50}")
+        print(f"  Projects: {summary['projects']} found, {summary['skipped']} skipped, "
+              f"{summary['processed']} processed ({summary['resumed']} resumed), {summary['errors']} errors")
+        print(f"  Tables:   {summary['tables']} extracted, {summary['success']} ok, {summary['failed']} failed")
+        print(f"  LLM:      {format_llm_spend(summary['llm_spend'])}")
+        for doc_id, err in summary['failures'][:20]:
+            print(f"  ❌ {doc_id}: {err}")
+        if summary['cancelled']:
+            print(f"  Cancelled: unfinished papers can be resumed (main.py resume all)")
+        print(f"{'='*50}\n")
+        return summary
+
+def print_failure_report(data_manager):
+    """Console report of why tables fail to compile across the whole library"""
+    rows = data_manager.get_failure_report()
+    print(f"\n{'='*72}")
+    print(f"  Compile Failure Report ({data_manager.config.get('storage_path')})")
+    print(f"{'='*72}")
+    print(f"  {'error class':<24}{'macro/package':<22}{'retries':>8}{'tables':>8}{'lost':>8}")
+    for cls, subject, retries, tables, lost in rows:
+        print(f"  {str(cls):<24}{subject[:21]:<22}{retries:>8}{tables:>8}{lost:>8}")
+    print(f"{'-'*72}")
+    for rule, hits, successes in data_manager.get_rule_stats():
+        print(f"  Rule {rule:<24} hits={hits}  rescued={successes}")
+    llm_stats = data_manager.get_llm_fix_stats()
+    if llm_stats:
+        print(f"{'-'*72}")
+        print(f"  {'LLM fixes by error class':<32}{'calls':>8}{'fixed':>8}{'rate':>8}{'tokens/call':>14}")
+        for error_class, attempts, successes, tokens in llm_stats:
+            print(f"  {str(error_class):<32}{attempts:>8}{successes:>8}{successes / attempts if attempts else 0:>8.0%}"
+                  f"{tokens // attempts if attempts else 0:>14}")
+    tier_stats = data_manager.get_tier_stats()
+    if tier_stats:
+        print(f"{'-'*72}")
+        print(f"  {'model tiers':<32}{'calls':>8}{'ok':>8}{'rate':>8}{'avg s':>8}{'tok/call':>8}")
+        for stage, model, tier, calls, successes, seconds, tokens in tier_stats:
+            print(f"  {f'{stage}[{tier}] {model}'[:31]:<32}{calls:>8}{successes:>8}"
+                  f"{successes / calls if calls else 0:>8.0%}{seconds / calls if calls else 0:>8.1f}"
+                  f"{tokens // calls if calls else 0:>8}")
+    print(f"{'='*72}\n")
+
+def cli_api_config(cfg):
+    """LLM settings for headless commands, taken from the saved GUI config"""
+    return {
+        'api_key': cfg.get('api_key', ''),
+        'base_url': cfg.get('base_url', ''),
+        'provider': cfg.get('provider', 'OpenAI'),
+        'model': cfg.get('model', ''),
+        'fix_mode': cfg.get('llm_fix_mode', 'patch'),
+        'routes': cfg.get('llm_routes') or {},
+    }
+
+def resume_jobs_cli(data_manager, job=None):
+    """Without job: list unfinished jobs. Otherwise resume one job id (or 'all') with the saved API settings."""
+    jobs = data_manager.get_unfinished_jobs()
+    if job is None:
+        print(f"  {'job':>5}  {'paper':<28}{'stage':<12}{'tables':>8}  error")
+        for job_id, doc_id, stage, done, total, err in jobs:
+            print(f"  {job_id:>5}  {doc_id[:27]:<28}{stage:<12}{f'{done}/{total}':>8}  {(err or '')[:60]}")
+        if not jobs:
+            print("  No unfinished jobs")
+        return
+    job_ids = [j[0] for j in jobs] if job == "all" else [int(job)]
+    cfg = data_manager.config
+    logic = CoreLogic.from_config(cfg)
+    logic.policy.begin_batch("resume")
+    pipeline = ExtractionPipeline(logic, data_manager, cli_api_config(cfg),
+                                  status_cb=lambda msg, active=True: print(msg))
+    failed = 0
+    for job_id in job_ids:
+        # One broken job (e.g. its saved source is gone) must not stop the others
+        try:
+            job = data_manager.load_job(job_id)
+            if job is None or job['stage'] == 'done':
+                print(f"  Job #{job_id}: " + ("unknown" if job is None else f"{job['doc_id']} already done"))
+                continue
+            pipeline.run(None, job_id=job_id)
+        except ExtractionCancelled:
+            raise
+        except Exception as e:
+            failed += 1
+            print(f"  Job #{job_id} failed: {str(e)[:200]}")
+    if failed:
+        print(f"  {failed} of {len(job_ids)} jobs failed (see above)")
+    print(f"  Batch LLM spend: {format_llm_spend(logic.policy.report()['batch'])}")
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Latex Table Miner")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("report", help="print the compile failure report")
+    p_metrics = sub.add_parser("metrics", help="export stored run metrics")
+    p_metrics.add_argument("--format", choices=["prom", "jsonl"], default="prom")
+    p_metrics.add_argument("--run", default=None, help="restrict to one run_id")
+    p_backends = sub.add_parser("backends", help="list compile backends and their capabilities")
+    p_backends.add_argument("--reindex", action="store_true", help="rebuild the package index of the selected backend")
+    p_export = sub.add_parser("export", help="export library tables (streamed)")
+    p_export.add_argument("format", choices=LibraryExporter.FORMATS)
+    p_export.add_argument("output", help="output file (jsonl/parquet) or directory (bundles)")
+    p_export.add_argument("--arxiv", default=None, help="only this paper (all versions)")
+    p_export.add_argument("--since", default=None, help="created on/after, e.g. 2025-01-01")
+    p_export.add_argument("--until", default=None, help="created on/before, e.g. 2025-06-30")
+    p_export.add_argument("--query", default=None, help="substring of code, note or arXiv ID")
+    p_export.add_argument("--cleaned", action="store_true",
+                          help="export the clean-mode variant (values blanked, cleaned PNG only)")
+    p_export.add_argument("--char", choices=["-", "SPACE"], default=None,
+                          help="replacement for tables with no stored cleaned code (default: clean_char setting)")
+    p_import = sub.add_parser("import", help="extract a local mirror of project folders / arXiv tarballs")
+    p_import.add_argument("paths", nargs="+")
+    p_import.add_argument("--workers", type=int, default=None, help="papers processed in parallel")
+    p_import.add_argument("--no-skip", action="store_true", help="also re-extract papers that already finished")
+    p_import.add_argument("--clean", action="store_true",
+                          help="Clean Mode: also store value-blanked code and a preview rendered from it")
+    p_import.add_argument("--char", choices=["-", "SPACE"], default=None, help="replacement (default: clean_char setting)")
+    p_query = sub.add_parser("query", help="find tables by column header, or list a table's numeric cells")
+    p_query.add_argument("header", nargs="?", default=None, help="substring of a column header, e.g. 'BLEU'")
+    p_query.add_argument("--table", type=int, default=None, help="list numeric cells of this table id")
+    p_query.add_argument("--numeric", action="store_true", help="only columns holding numbers")
+    p_clean = sub.add_parser("clean", help="store value-blanked variants of library tables (local, no API)")
+    p_clean.add_argument("--char", choices=["-", "SPACE"], default=None, help="replacement (default: clean_char setting)")
+    p_clean.add_argument("--arxiv", default=None, help="only this paper (all versions)")
+    p_clean.add_argument("--query", default=None, help="substring of code, note or arXiv ID")
+    p_serve = sub.add_parser("serve", help="own the library and serve it to several GUI/CLI clients")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--socket", default=None, help="listen on this Unix socket instead of TCP")
+    p_same = sub.add_parser("same-render", help="list tables that render identically (stored render hashes)")
+    p_same.add_argument("--table", type=int, default=None, help="only tables identical to this table id")
+    p_same.add_argument("--same-paper", action="store_true", help="also list groups within a single paper")
+    p_resume = sub.add_parser("resume", help="list or resume interrupted extraction jobs")
+    p_resume.add_argument("job", nargs="?", default=None, help="job id, or 'all'")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print_failure_report(open_library())
+    elif args.command == "metrics":
+        sys.stdout.write(open_library().export_metrics(args.format, args.run))
+    elif args.command == "backends":
+        config = DataManager().config
+        selected = config.get("compile_backend", "auto")
+        print(f"  compile_backend = {selected}")
+        if args.reindex:
+            backend = get_backend(selected)
+            index = PackageIndex.load_or_build(backend, package_index_path(config), rebuild=True)
+            print(f"  {backend.name}: {len(index) if index else 'no'} packages indexed")
+        for name, cls in COMPILE_BACKENDS.items():
+            caps = (FakeBackend() if cls is FakeBackend else cls()).capabilities()
+            flags = ", ".join(k for k in ('fetches_packages', 'unicode_input') if caps[k])
+            print(f"  {name:<10}{caps['executable'] or '(not installed)':<40}{flags}")
+    elif args.command == "export":
+        data_manager = open_library()
+        choice = args.char or data_manager.config.get("clean_char", "-")
+        count = LibraryExporter(data_manager).export(
+            args.format, args.output, progress_cb=lambda n: print(f"  {n} tables...", file=sys.stderr),
+            arxiv_id=args.arxiv, since=args.since, until=args.until, query=args.query,
+            cleaned=args.cleaned, clean_char=" " if choice == "SPACE" else "-")
+        print(f"Exported {count} tables to {args.output}")
+    elif args.command == "query":
+        data_manager = open_library()
+        if args.table is not None:
+            for g_idx, r, c, header, value in data_manager.get_numeric_cells(args.table, args.header):
+                print(f"  [{g_idx}] r{r} c{c}  {header:<30} {value:g}")
+        elif args.header:
+            for table_id, arxiv_id, g_idx, col, text in data_manager.find_tables_by_header(args.header, args.numeric):
+                print(f"  #{table_id:<6}{arxiv_id:<18}[{g_idx}] col {col}: {text}")
+        else:
+            parser.error("query needs a header or --table")
+    elif args.command == "clean":
+        data_manager = open_library()
+        choice = args.char or data_manager.config.get("clean_char", "-")
+        started = time.perf_counter()
+        count = data_manager.clean_tables(" " if choice == "SPACE" else "-", arxiv_id=args.arxiv, query=args.query)
+        print(f"Cleaned {count} tables in {time.perf_counter() - started:.2f}s")
+    elif args.command == "same-render":
+        data_manager = open_library()
+        if args.table is not None:
+            for table_id, arxiv_id in data_manager.find_same_render(args.table):
+                print(f"  #{table_id:<6}{arxiv_id}")
+        else:
+            groups = data_manager.get_same_render_groups(cross_paper=not args.same_paper)
+            for render_hash, ids, papers in groups:
+                print(f"  {render_hash[:12]}  {len(ids)} tables  #{', #'.join(map(str, ids))}  ({', '.join(papers)})")
+            print(f"  {len(groups)} group(s) of visually identical tables")
+    elif args.command == "serve":
+        data_manager = DataManager()  # the service always owns the local library
+        service = LibraryService(data_manager)
+        url = service.start(args.host, args.port, args.socket)
+        print(f"Serving {data_manager.config.get('storage_path')} at {url} (set library_service to this URL in clients)")
+        print(f"  Access token: {service._token_path} (clients read it from their storage_path, "
+              f"or set library_service_token)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+            print(f"  {service.stats['writes']} writes in {service.stats['commits']} commits, {service.stats['reads']} reads")
+    elif args.command == "resume":
+        resume_jobs_cli(open_library(), args.job)
+    elif args.command == "import":
+        data_manager = open_library()
+        cfg = data_manager.config
+        choice = args.char or cfg.get("clean_char", "-")
+        importer = LocalImporter(CoreLogic.from_config(cfg), data_manager, cli_api_config(cfg),
+                                 workers=args.workers or cfg.get("import_workers", 4),
+                                 clean_mode=args.clean, clean_char=" " if choice == "SPACE" else "-",
+                                 status_cb=lambda msg, active=True: print(msg))
+        importer.run(args.paths, skip_done=not args.no_skip)
+    else:
+        import gui
+        gui.run(sys.modules[__name__])
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,383 @@
+"""Input/output checks of the headless core (main.py), no network, TeX or API key needed.
+
+Compiles go through main.FakeBackend; run with `python -m pytest tests`.
+"""
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+TABLE = r"""\begin{tabular}{l*{2}{c}}
+\toprule
+\multirow{2}{*}{Model} & \multicolumn{2}{c}{Accuracy} \\
+ & Dev & Test \\
+\midrule
+BERT-2 & \textbf{71.2}$\pm$0.3 & 1,024 \\
+ResNet-50 & $-0.5$ & 12.5\% \\
+\bottomrule
+\end{tabular}"""
+
+
+class FakeLogic(main.CoreLogic):
+    """CoreLogic on FakeBackend with a canned LLM; the blank PDF stands in for the rendering"""
+
+    def __init__(self, tables=(), missing_packages=(), edits=(), backend=None):
+        super().__init__(backend=backend or main.FakeBackend(missing_packages))
+        self.tables = list(tables)
+        self.edits = list(edits)
+        self.llm_calls = 0
+
+    def _llm_request(self, api_config, system_prompt, user_content, json_mode=False):
+        self.llm_calls += 1
+        if '"edits"' in system_prompt:
+            return json.dumps({'edits': self.edits}), 100, 100
+        text = json.dumps({'tables_found': len(self.tables), 'tables_extracted': len(self.tables),
+                           'tables': self.tables})
+        return text, 100, 100
+
+    def _rasterize(self, pdf_file, img_path):
+        with open(pdf_file, "rb") as src, open(img_path, "wb") as dst:
+            dst.write(b"\x89PNG\r\n\x1a\n" + src.read())
+
+    def _render_hash(self, pdf_file):
+        with open(pdf_file, "rb") as f:
+            return main.hashlib.sha256(f.read()).hexdigest()
+
+
+@pytest.fixture
+def logic():
+    return FakeLogic()
+
+
+@pytest.fixture
+def dm(tmp_path):
+    data_manager = main.DataManager(config={"storage_path": str(tmp_path / "library")})
+    yield data_manager
+    data_manager.conn.close()
+
+
+def standalone(body, packages=("booktabs",)):
+    pkgs = "".join(f"\\usepackage{{{p}}}\n" for p in packages)
+    return f"\\documentclass[preview]{{standalone}}\n{pkgs}\\begin{{document}}\n{body}\n\\end{{document}}"
+
+
+# --- parser ---
+@pytest.mark.parametrize("spec, ncols", [
+    ("lcr", 3),
+    ("|l|c|r|", 3),
+    ("l*{3}{c}", 4),
+    ("p{2cm}X", 2),
+    ("@{}l@{\\hspace{1em}}c@{}", 2),
+    (">{\\bfseries}lS[table-format=2.1]", 2),
+    ("*{2}{c|r}", 4),
+])
+def test_count_columns(spec, ncols):
+    assert main.count_columns(spec) == ncols
+
+
+def test_split_rows_ignores_nested_separators():
+    code = r"a & {b & c} \\ \begin{tabular}{c} x \\ y \end{tabular} & d \\[2pt] e"
+    rows = main._split_rows(code, 0, len(code))
+    texts = [[code[s:e].strip() for s, e in row] for row in rows]
+    assert texts == [["a", "{b & c}"], [r"\begin{tabular}{c} x \\ y \end{tabular}", "d"], ["e"]]
+
+
+def test_parse_cell_unwraps_spans():
+    code = r"\multicolumn{2}{c}{\multirow{3}{*}{Acc}}"
+    cell = main._parse_cell(code, 0, len(code))
+    assert (cell['text'], cell['colspan'], cell['rowspan'], cell['align']) == ("Acc", 2, 3, "c")
+    assert code[slice(*cell['span'])] == "Acc"
+
+
+def test_scan_tabulars_rows_and_rules():
+    (scanned,) = main._scan_tabulars("before " + TABLE + " after")
+    assert (scanned['env'], scanned['spec'], scanned['ncols']) == ("tabular", "l*{2}{c}", 3)
+    rows = scanned['rows']
+    assert rows[0]['rules'] == ["\\toprule"]
+    assert [c['text'] for c in rows[0]['cells']] == ["Model", "Accuracy"]
+    assert rows[2]['rules'] == ["\\midrule"]
+    assert [c['text'] for c in rows[2]['cells']] == ["BERT-2", "\\textbf{71.2}$\\pm$0.3", "1,024"]
+    assert rows[-1] == {'rules': ["\\bottomrule"], 'cells': []}
+    grid = main.TableGrid.from_scan(scanned)
+    assert grid.header_rows == 2
+    assert grid.column_headers() == ["Model", "Accuracy / Dev", "Accuracy / Test"]
+    assert [(r, c, v) for r, c, _, v in grid.numeric_cells()] == [(2, 1, 71.2), (2, 2, 1024.0), (3, 1, -0.5),
+                                                                   (3, 2, 12.5)]
+
+
+@pytest.mark.parametrize("text, value", [
+    ("71.2", 71.2),
+    ("71.2±0.3", 71.2),
+    ("12.5%", 12.5),
+    ("1,024", 1024.0),
+    ("−0.5", -0.5),
+    (".5", 0.5),
+    ("12.3*", 12.3),
+    ("3-5", None),
+    ("10 − 20", None),
+    ("ResNet-50", None),
+    ("Avg 3", None),
+    ("", None),
+])
+def test_parse_number(text, value):
+    assert main.parse_number(text) == value
+
+
+def test_clean_table_code_blanks_values_only():
+    cleaned = main.clean_table_code(TABLE)
+    assert "\\multicolumn{2}{c}{Accuracy}" in cleaned
+    assert "BERT-2 & \\textbf{-}$\\pm$- & - \\\\" in cleaned
+    assert "ResNet-50 & $-$ & -\\% \\\\" in cleaned
+
+
+# --- ErrorFixer ---
+@pytest.mark.parametrize("error, body, defs", [
+    ("! Undefined control sequence.\nl.7 A & \\cmark", "A & \\cmark", ["\\providecommand{\\cmark}{}"]),
+    ("! LaTeX Error: Environment threeparttable undefined.", "", ["\\newenvironment{threeparttable}{}{}"]),
+    ("! Package xcolor Error: Undefined color `lightgray'.", "", ["\\definecolor{lightgray}{HTML}{CCCCCC}"]),
+    ("! Package array Error: Illegal pream-token (Y): `c' used.", "", ["\\newcolumntype{Y}{c}"]),
+])
+def test_error_fixer_adds_definitions(error, body, defs):
+    state = {'defs': [], 'body': body}
+    applied = main.ErrorFixer().apply(error, state, "")
+    assert len(applied) == 1
+    assert state['defs'] == defs
+
+
+def test_error_fixer_rewrites_body():
+    fixer = main.ErrorFixer()
+    state = {'defs': [], 'body': "\\caption{Results {a}}\n\\begin{tabular}{c}\nx\n\\end{tabular}"}
+    assert fixer.apply("! LaTeX Error: \\caption outside float.", state, "") == ['caption_outside_float']
+    assert state['body'] == "\n\\begin{tabular}{c}\nx\n\\end{tabular}"
+
+    state = {'defs': [], 'body': "a & b\n\\hline\nc & d \\\\"}
+    assert fixer.apply("! Misplaced \\noalign.", state, "") == ['misplaced_noalign']
+    assert state['body'] == "a & b \\\\\n\\hline\nc & d \\\\"
+
+    full_tex = "\\begin{document}\nacc_top1 & $x_1$ \\\\\n\\end{document}"
+    state = {'defs': [], 'body': "acc_top1 & $x_1$ \\\\"}
+    assert fixer.apply("error: t.tex:2: Missing $ inserted", state, full_tex) == ['missing_dollar']
+    assert state['body'] == "acc\\_top1 & $x_1$ \\\\"
+
+    state = {'defs': ["\\newcommand{\\best}[1]{\\textbf{#1}}"], 'body': ""}
+    assert fixer.apply("! LaTeX Error: Command \\best already defined.", state, "") == ['command_already_defined']
+    assert state['defs'] == ["\\providecommand{\\best}[1]{\\textbf{#1}}"]
+    assert fixer.pop_stats() == {name: {'hits': 1, 'success': 0} for name in
+                                 ('caption_outside_float', 'misplaced_noalign', 'missing_dollar',
+                                  'command_already_defined')}
+
+
+def test_error_fixer_reports_no_change():
+    state = {'defs': ["\\newcolumntype{Y}{c}"], 'body': ""}
+    assert main.ErrorFixer().apply("Illegal pream-token (Y)", state, "") == []
+
+
+# --- LLM patch helpers ---
+def test_apply_latex_edits(logic):
+    tex = standalone("\\cmark & \\fancy{x}")
+    new_tex, applied = logic.apply_latex_edits(tex, [
+        {'op': 'add_preamble', 'line': "\\usepackage{amssymb}"},
+        {'op': 'add_preamble', 'line': "\\usepackage{booktabs}"},  # already there
+        {'op': 'provide_command', 'name': "cmark", 'nargs': 0, 'body': "\\checkmark"},
+        {'op': 'provide_command', 'name': "\\fancy", 'nargs': "1", 'body': "#1"},
+        {'op': 'replace', 'old': "\\usepackage{booktabs}\n", 'new': ""},
+        {'op': 'replace', 'old': "not in the file", 'new': "x"},
+        {'op': 'unknown'},
+        "not an edit",
+    ])
+    assert applied == 4
+    assert new_tex == ("\\documentclass[preview]{standalone}\n\\usepackage{amssymb}\n"
+                       "\\providecommand{\\cmark}{\\checkmark}\n\\providecommand{\\fancy}[1]{#1}\n"
+                       "\\begin{document}\n\\cmark & \\fancy{x}\n\\end{document}")
+
+
+def test_apply_latex_edits_skips_malformed(logic):
+    tex = standalone("\\cmark")
+    malformed = [
+        {'op': 'provide_command', 'name': "\\cmark", 'nargs': "one", 'body': ""},
+        {'op': 'provide_command', 'name': "\\cmark", 'nargs': 12, 'body': ""},
+        {'op': 'provide_command', 'name': ["\\cmark"]},
+        {'op': 'replace', 'old': 42, 'new': ""},
+        {'op': 'replace', 'old': "\\cmark", 'new': {'text': "x"}},
+        {'op': 'add_preamble', 'line': None},
+    ]
+    assert logic.apply_latex_edits(tex, malformed) == (tex, 0)
+    new_tex, applied = logic.apply_latex_edits(tex, malformed + [{'op': 'replace', 'old': "\\cmark", 'new': "x"}])
+    assert applied == 1 and "\\cmark" not in new_tex
+
+
+def test_malformed_patch_falls_back_to_full_fix(logic):
+    logic.edits = [{'op': 'provide_command', 'name': "\\cmark", 'nargs': "one"}]
+    tex = standalone("\\cmark")
+    assert logic.llm_fix_latex_patch({'api_key': "test", 'model': "fake"}, tex, "! Undefined control sequence.") is None
+    logic.edits = {'op': 'replace', 'old': "\\cmark", 'new': ""}  # not a list
+    assert logic.llm_fix_latex_patch({'api_key': "test", 'model': "fake"}, tex, "! Undefined control sequence.") is None
+    assert logic.llm_calls == 2
+
+
+def test_trim_error_log(logic):
+    log = "\n".join([f"info {i}" for i in range(10)] + ["! Undefined control sequence.", "l.12 \\foo"]
+                    + [f"after {i}" for i in range(20)])
+    trimmed = logic.trim_error_log(log, before=2, after=3)
+    assert trimmed.split("\n") == ["info 8", "info 9", "! Undefined control sequence.", "l.12 \\foo",
+                                   "after 0", "after 1"]
+    assert logic.trim_error_log("no error here " * 200, max_chars=50) == ("no error here " * 200)[:50]
+
+
+def test_parse_compile_log(logic):
+    full_tex = standalone("A & \\zzmark \\\\")
+    output = ("error: table.tex:4: Undefined control sequence\n"
+              "! LaTeX Error: File `icml2025.sty' not found.\n"
+              "error: halted on potentially-recoverable error as specified\n")
+    diags = logic.parse_compile_log(output, full_tex)
+    assert [(d['error_class'], d['macro'], d['package'], d['tex_line'], d['body_line']) for d in diags] == [
+        ('undefined_macro', '\\zzmark', None, 4, 1),
+        ('missing_file', None, 'icml2025', None, None),
+    ]
+    assert logic.parse_compile_log("", full_tex)[0]['error_class'] == 'no_output'
+
+
+class SlowBackend(main.FakeBackend):
+    """FakeBackend that times out on \\zzslow and reports an error no rule fixes on \\zzextra"""
+
+    def run(self, tex_file, runner):
+        with open(tex_file, "r", encoding="utf-8") as f:
+            tex = f.read()
+        if "\\zzslow" in tex:
+            raise subprocess.TimeoutExpired(tex_file, 60)
+        if "\\zzextra" in tex:
+            return subprocess.CompletedProcess([tex_file], 1, b"",
+                                               f"error: {tex_file}:4: Extra alignment tab has been changed".encode())
+        return super().run(tex_file, runner)
+
+
+def test_llm_fix_stops_on_resource_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    logic = FakeLogic(edits=[{'op': 'replace', 'old': "\\zzextra", 'new': "\\zzslow"}], backend=SlowBackend())
+    with pytest.raises(Exception):
+        logic.render_latex(standalone("a & \\zzextra \\\\"), api_config={'api_key': "test", 'model': "fake"},
+                           original_source="source")
+    assert logic.llm_calls == 1  # the timed-out LLM fix is not followed by more attempts
+
+
+# --- dedup ---
+def test_minhash_similarity():
+    code = "\n".join(f"Model{i} & {i}.5 & {i * 3}.1 \\\\" for i in range(30))
+    near = code.replace("29.5", "29.7")
+    other = "\n".join(f"Other{i} & x & y \\\\" for i in range(30))
+    sig = main.minhash_signature(code)
+    assert main.minhash_similarity(sig, main.minhash_signature(code)) == 1.0
+    assert main.minhash_similarity(sig, main.minhash_signature(near)) > 0.8
+    assert main.minhash_similarity(sig, main.minhash_signature(other)) < 0.2
+    assert main.latex_fingerprint(code) == main.latex_fingerprint(code.replace(" & ", "  &  "))
+
+
+def test_find_duplicate(dm, tmp_path):
+    png = tmp_path / "t.png"
+    png.write_bytes(b"png")
+    code = "\\begin{tabular}{ll}\n" + "".join(f"M{i} & {i}.5 \\\\\n" for i in range(20)) + "\\end{tabular}"
+    table_id = dm.add_table("2301.00001v1", code, [], str(png))
+    near = code.replace("19.5", "19.7")
+    assert dm.find_duplicate(code, arxiv_id="2302.00002v1") == (table_id, "exact", 1.0)
+    match = dm.find_duplicate(near, 0.8, arxiv_id="2301.00001v2")
+    assert match[:2] == (table_id, "near") and 0.8 <= match[2] < 1.0
+    assert dm.find_duplicate(near, 0.8, arxiv_id="2302.00002v1") is None
+    assert dm.find_duplicate("\\begin{tabular}{c}\nunrelated\n\\end{tabular}", 0.8, arxiv_id="2301.00001v2") is None
+
+
+# --- incremental re-extraction ---
+def test_delta_source(logic, dm, tmp_path):
+    png = tmp_path / "t.png"
+    png.write_bytes(b"png")
+    source = ("\\section{Results}\n"
+              "\\begin{table}\n\\caption{Old}\\label{tab:old}\n\\begin{tabular}{c}\n1 \\\\\n\\end{tabular}\n\\end{table}\n"
+              "Text.\n"
+              "\\begin{table}\n\\caption{New}\\label{tab:new}\n\\begin{tabular}{c}\n2 \\\\\n\\end{tabular}\n\\end{table}")
+    scan = logic.pre_scan_tables(source)
+    pipeline = main.ExtractionPipeline(logic, dm, {})
+    assert pipeline._delta_source("2301.00001v2", source, scan) == (source, [])
+
+    old_id = dm.add_table("2301.00001v1", "code", [], str(png), source_fingerprint=scan[0]['fingerprint'])
+    delta, unchanged = pipeline._delta_source("2301.00001v2", source, scan)
+    assert unchanged == [(scan[0], old_id)]
+    lines = delta.split("\n")
+    assert len(lines) == len(source.split("\n"))
+    assert lines[1] == "% [LTMiner] unchanged table tab:old already in library"
+    assert lines[2:7] == [""] * 5
+    assert lines[8:] == source.split("\n")[8:]
+    # another paper shares nothing
+    assert pipeline._delta_source("2302.00002v1", source, scan) == (source, [])
+
+    dm.add_table("2301.00001v1", "code", [], str(png), source_fingerprint=scan[1]['fingerprint'])
+    assert pipeline._delta_source("2301.00001v2", source, scan)[0] is None
+
+
+# --- job journal ---
+def test_job_journal(dm):
+    job_id = dm.create_job("2301.00001v1", "\\documentclass{article}", {'clean_mode': True})
+    tables = [{'code': "a"}, {'code': "b"}]
+    dm.job_extracted(job_id, tables, unchanged=1)
+    dm.mark_job_table(job_id, 1, "done", "DIRECT", 7)
+    assert dm.get_unfinished_jobs() == [(job_id, "2301.00001v1", "extracted", 1, 2, None)]
+    job = dm.load_job(job_id)
+    assert job['source'] == "\\documentclass{article}"
+    assert (job['tables'], job['unchanged'], job['options']) == (tables, 1, {'clean_mode': True})
+    assert job['table_status'] == {1: ("done", "DIRECT"), 2: ("pending", None)}
+
+    dm.finish_job(job_id, error=RuntimeError("window closed"))
+    assert dm.get_unfinished_jobs()[0][5] == "window closed"
+    dm.finish_job(job_id)
+    assert dm.get_unfinished_jobs() == []
+    assert dm.get_finished_doc_ids() == {"2301.00001v1"}
+    assert dm.load_job(job_id)['source'] is None
+
+
+def test_pipeline_resumes_journaled_job(dm, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # compiles write their temp files into the cwd
+    tables = [{'code': standalone("\\begin{tabular}{c}\n%d \\\\\n\\end{tabular}" % i), 'packages': ['booktabs'],
+               'source_line': i} for i in (1, 2, 3)]
+    tables[2]['code'] = standalone("\\begin{tabular}{c}\n3 \\\\\n\\end{tabular}", ("booktabs", "icml2025"))
+    logic = FakeLogic(tables, missing_packages=("icml2025",))
+    pipeline = main.ExtractionPipeline(logic, dm, {'api_key': "test", 'model': "fake"})
+
+    job_id = dm.create_job("Local_paper", "source", {})
+    dm.job_extracted(job_id, tables)
+    dm.mark_job_table(job_id, 1, "done", "DIRECT", None)
+    summary = pipeline.run(None, job_id=job_id)
+
+    assert logic.llm_calls == 0  # the journaled table list is reused
+    assert (summary['total'], summary['success'], summary['failed']) == (3, 3, 0)
+    assert [r[0] for r in summary['results']] == [1, 2, 3]
+    assert dm.load_job(job_id)['stage'] == "done"
+    # only the two pending tables were compiled and stored
+    dm.cursor.execute("SELECT COUNT(*) FROM tables WHERE arxiv_id = 'Local_paper'")
+    assert dm.cursor.fetchone()[0] == 2
+    with pytest.raises(ValueError):
+        pipeline.run(None, job_id=job_id)
+
+
+def test_importer_resumes_unfinished_job(dm, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    project = tmp_path / "mirror" / "2301.00001v1"
+    project.mkdir(parents=True)
+    (project / "main.tex").write_text("\\documentclass{article}\n\\begin{document}\nx\n\\end{document}\n")
+    tables = [{'code': standalone("\\begin{tabular}{c}\n%d \\\\\n\\end{tabular}" % i), 'packages': ['booktabs'],
+               'source_line': i} for i in (1, 2)]
+    job_id = dm.create_job("2301.00001v1", "journaled source", {})
+    dm.job_extracted(job_id, tables)
+    dm.mark_job_table(job_id, 1, "done", "DIRECT", None)
+
+    logic = FakeLogic(tables)
+    summary = main.LocalImporter(logic, dm, {'api_key': "test", 'model': "fake"}, workers=1).run([str(tmp_path / "mirror")])
+    assert (summary['projects'], summary['resumed'], summary['success']) == (1, 1, 2)
+    assert logic.llm_calls == 0
+    assert dm.get_unfinished_jobs() == []
+    dm.cursor.execute("SELECT COUNT(*) FROM jobs")
+    assert dm.cursor.fetchone()[0] == 1